@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Video
+from .models import Video, VideoRendition
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
@@ -10,7 +10,12 @@ class VideoResources(resources.ModelResource):
 
 
 
+class VideoRenditionInline(admin.TabularInline):
+    model = VideoRendition
+    extra = 0
+
+
 @admin.register(Video)
 class VideoAdmin(ImportExportModelAdmin):
-    pass
+    inlines = [VideoRenditionInline]
 
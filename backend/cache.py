@@ -0,0 +1,361 @@
+import collections
+import hashlib
+import math
+import random
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+from .local_cache import LocalCache, VersionListener
+
+
+CATALOG_LIST_SCOPE = 'list'
+VERSION_KEY = 'catalog:version:{scope}'
+MODIFIED_KEY = 'catalog:modified:{scope}'
+RESPONSE_KEY = 'catalog:response:{name}:{digest}'
+LOCK_KEY = '{key}:lock'
+LOCK_POLL_INTERVAL = 0.05
+STATS_KEY = 'catalog:stats:{counter}'
+STATS_COUNTERS = ('hits', 'misses', 'stale')
+VERSION_CHANNEL = 'catalog:versions'
+CACHE_ERRORS = (RedisError, ConnectionInterrupted)
+
+local_cache = LocalCache(getattr(settings, 'CATALOG_LOCAL_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+version_listener = VersionListener(cache.make_key(VERSION_CHANNEL), on_reset=local_cache.clear)
+local_stats = collections.Counter()
+
+
+def video_scope(video_id):
+    """Returns the version scope of one video, which its detail response is keyed on."""
+    return f'video:{video_id}'
+
+
+def initial_version():
+    """
+    Returns the version of a scope that has no version in the cache yet.
+    The version starts at the current time in nanoseconds instead of 1, so a version that was evicted by Redis
+    never comes back with a value whose responses are still cached.
+    """
+    return time.time_ns()
+
+
+def get_versions(scopes):
+    """
+    Returns the current version of every scope and the time of their latest change, creating the versions that
+    do not exist yet. Both are read with one `get_many`.
+    The list scope is the catalog-wide version: it changes with every write to any video.
+    Args:
+        scopes (list): The scopes, e.g. ['list'] or ['video:7'].
+    Returns:
+        tuple: The versions in the order of `scopes`, and the Unix time of the latest version change of any of
+            them. A scope without a recorded change counts as changed now.
+    """
+    keys = [VERSION_KEY.format(scope=scope) for scope in scopes]
+    modified_keys = [MODIFIED_KEY.format(scope=scope) for scope in scopes]
+    values = cache.get_many(keys + modified_keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, initial_version(), timeout=None)
+            values[key] = cache.get(key)
+    for key in modified_keys:
+        if key not in values:
+            cache.add(key, time.time(), timeout=None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys], max(values[key] or 0 for key in modified_keys)
+
+
+def publish_version(scope, version):
+    """
+    Announces a new version on the pub/sub channel of the `VersionListener`s, so every process drops its local
+    copies of the responses built from older versions. Does nothing if the cache backend is not Redis.
+    """
+    try:
+        get_redis_connection('default').publish(cache.make_key(VERSION_CHANNEL), f'{scope} {version}')
+    except NotImplementedError:
+        pass
+
+
+def bump_versions(*scopes):
+    """
+    Moves the given scopes to a new version, so every response cached under the old versions is no longer read.
+    The old entries are not deleted; they expire after `CACHE_TTL`. The new versions are published to the local
+    caches of all processes with `publish_version`. The time of the change is recorded before the version, so a
+    response built from the new version never carries an older Last-Modified. Invalidation must never fail a
+    conversion job, so cache errors are only printed.
+    """
+    for scope in scopes:
+        key = VERSION_KEY.format(scope=scope)
+        try:
+            cache.set(MODIFIED_KEY.format(scope=scope), time.time(), timeout=None)
+            try:
+                version = cache.incr(key)
+            except ValueError:
+                cache.add(key, initial_version(), timeout=None)
+                version = cache.get(key)
+            publish_version(scope, version)
+        except CACHE_ERRORS as e:
+            print(f"Warnung: Cache-Version {scope} konnte nicht erhöht werden: {e}")
+
+
+def invalidate_video(video_id):
+    """
+    Invalidates the cached detail response of a video and all cached list responses, which may contain it.
+    Inside a transaction the versions are bumped once it commits, so no request can cache the old rows under the
+    new version in between.
+    """
+    transaction.on_commit(lambda: bump_versions(video_scope(video_id), CATALOG_LIST_SCOPE))
+
+
+def response_key(name, url):
+    """
+    Returns the cache key of a response.
+    The key only names the endpoint and URL; the versions the response was built from are stored in the entry,
+    so after an invalidation the previous response is still at hand and can be served while it is rebuilt.
+    Args:
+        name (str): The name of the endpoint, e.g. 'video-list'.
+        url (str): The absolute URL of the request with the query parameters the response depends on (see
+            `CatalogCacheMixin.get_cache_url`). Serialized file URLs contain the host, so responses for different
+            hosts are cached separately.
+    Returns:
+        str: The cache key.
+    """
+    digest = hashlib.sha256(url.encode()).hexdigest()[:32]
+    return RESPONSE_KEY.format(name=name, digest=digest)
+
+
+def response_etag(key, versions):
+    """
+    Returns the ETag of a response: a digest of its cache key and the versions it was built from. A response only
+    changes when one of its versions does, so the ETag is known before the response is built or read.
+    """
+    digest = hashlib.sha256(f'{key}:{versions}'.encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def get_validators(name, scopes, url):
+    """
+    Returns the validators a response would have, computed from the current versions alone, so a conditional
+    request can be answered with 304 before the response is read from the cache or built.
+    Args:
+        name (str): The name of the endpoint, e.g. 'video-list'.
+        scopes (list): The version scopes the response depends on.
+        url (str): The URL the response is cached under, as passed to `fetch`.
+    Returns:
+        dict or None: The 'etag' and the Unix time the response was last 'modified', in the form of a cache entry,
+            or `None` if the cache is unavailable.
+    """
+    try:
+        versions, modified = get_versions(scopes)
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache nicht erreichbar: {e}")
+        return None
+    return {'etag': response_etag(response_key(name, url), versions), 'modified': modified}
+
+
+def record(counter):
+    """Increments a hit, miss or stale counter. The counters are shared by all processes through the cache."""
+    key = STATS_KEY.format(counter=counter)
+    try:
+        try:
+            cache.incr(key)
+        except ValueError:
+            if not cache.add(key, 1, timeout=None):
+                cache.incr(key)
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache-Zähler {counter} konnte nicht erhöht werden: {e}")
+
+
+def cache_stats():
+    """
+    Returns the counters of the catalog cache.
+    Returns:
+        dict: 'hits', 'misses', 'stale' (outdated responses served while another process rebuilt them) and
+            'hit_ratio' (hits and stale responses per request, `None` before the first request), counted by all
+            processes in Redis. 'local' holds the counters of the local cache of this process alone: its 'hits',
+            which are not counted in Redis, and its current 'size_bytes' and 'entries'.
+    """
+    counters = cache.get_many([STATS_KEY.format(counter=counter) for counter in STATS_COUNTERS])
+    stats = {counter: counters.get(STATS_KEY.format(counter=counter), 0) for counter in STATS_COUNTERS}
+    requests = sum(stats.values())
+    stats['hit_ratio'] = round((stats['hits'] + stats['stale']) / requests, 4) if requests else None
+    stats['local'] = {
+        'hits': local_stats['hits'],
+        'size_bytes': local_cache.size,
+        'entries': len(local_cache.entries),
+    }
+    return stats
+
+
+def refresh_early(entry, now, beta):
+    """
+    Decides whether a valid entry is rebuilt before it expires (probabilistic early expiration, "XFetch").
+    The probability grows as the expiry approaches and with the time the entry took to build, so the requests of a
+    hot key spread their rebuilds out instead of all missing at the moment of expiry.
+    Args:
+        entry (dict): The cache entry with 'expires' (Unix time) and 'delta' (build time in seconds).
+        now (float): The current Unix time.
+        beta (float): Values above 1 favour earlier rebuilds, 0 disables them.
+    Returns:
+        bool: True if this request should rebuild the entry.
+    """
+    return now - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['expires']
+
+
+def acquire_lock(key):
+    """
+    Takes the short fill lock of a response with an atomic `add`. Returns a token for `release_lock`, or `None`
+    if another process holds the lock. The lock expires after `CATALOG_LOCK_TIMEOUT` seconds, so a crashed
+    process cannot block the key.
+    """
+    token = uuid.uuid4().hex
+    timeout = getattr(settings, 'CATALOG_LOCK_TIMEOUT', 10)
+    return token if cache.add(LOCK_KEY.format(key=key), token, timeout=timeout) else None
+
+
+def release_lock(key, token):
+    """Releases the fill lock of a response if it is still held with `token`."""
+    lock_key = LOCK_KEY.format(key=key)
+    try:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache nicht erreichbar: {e}")
+
+
+def store(key, versions, modified, content, delta):
+    """
+    Stores a response with its versions, validators and build time. It is fresh for `CACHE_TTL` seconds and is
+    kept for another `CATALOG_STALE_TTL` seconds, during which it may be served while it is rebuilt.
+    """
+    ttl = getattr(settings, 'CACHE_TTL', 60 * 15)
+    entry = {
+        'versions': versions,
+        'content': content,
+        'etag': response_etag(key, versions),
+        'modified': modified,
+        'expires': time.time() + ttl,
+        'delta': delta,
+    }
+    try:
+        cache.set(key, entry, timeout=ttl + getattr(settings, 'CATALOG_STALE_TTL', 60 * 60))
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache nicht erreichbar: {e}")
+    return entry
+
+
+def store_local(key, entry):
+    """
+    Keeps a fresh entry in the local cache of this process for at most `CATALOG_LOCAL_CACHE_TTL` seconds, which
+    bounds how long a version bump lost on the pub/sub channel can go unnoticed.
+    """
+    if local_cache.max_bytes and version_listener.connected.is_set():
+        expires = min(entry['expires'], time.time() + getattr(settings, 'CATALOG_LOCAL_CACHE_TTL', 30))
+        local_cache.set(key, entry, len(entry['content']), expires)
+
+
+def wait_for_fill(key, versions):
+    """
+    Polls for the response that another process is building, for at most `CATALOG_LOCK_WAIT` seconds.
+    Returns:
+        dict or None: The entry, or `None` if it did not arrive in time.
+    """
+    deadline = time.monotonic() + getattr(settings, 'CATALOG_LOCK_WAIT', 2)
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        try:
+            entry = cache.get(key)
+        except CACHE_ERRORS:
+            return None
+        if entry is not None and entry['versions'] == versions:
+            return entry
+    return None
+
+
+def build_timed(build):
+    """Calls `build` and returns its content with the time it took in seconds."""
+    started = time.monotonic()
+    content = build()
+    return content, time.monotonic() - started
+
+
+def uncached_entry(content):
+    """Wraps content built while the cache was unavailable like an entry, without validators."""
+    if content is None:
+        return None
+    return {'content': content, 'etag': None, 'modified': None}
+
+
+def fetch(name, scopes, url, build):
+    """
+    Returns a response from the catalog cache, building it on a miss with stampede protection.
+    An entry is fresh if it was built from the current versions of `scopes` and has not expired. Fresh entries
+    are served, except for the occasional request that rebuilds it early (see `refresh_early`). Otherwise only
+    the process that takes the fill lock rebuilds the entry. All others serve the previous response while it
+    exists, even if outdated, or wait up to `CATALOG_LOCK_WAIT` seconds for the rebuild when there is none. So
+    an invalidation or expiry of a hot key costs one database query instead of one per concurrent request.
+    In front of Redis, every process keeps the hottest fresh entries in its `local_cache`. While the
+    `version_listener` has the current versions of all scopes, a local entry built from them is served without
+    any Redis access. If the cache is unavailable, every request builds its response itself.
+    Args:
+        name (str): The name of the endpoint, e.g. 'video-list'.
+        scopes (list): The version scopes the response depends on.
+        url (str): The absolute URL of the request.
+        build (callable): Returns the content to cache, or `None` if the response must not be cached.
+    Returns:
+        tuple: The entry with the 'content', its 'etag' and the Unix time it was last 'modified' (`None` if
+            `build` returned `None`), and how it was obtained: 'HIT', 'STALE' or 'MISS'.
+    """
+    key = response_key(name, url)
+    now = time.time()
+    beta = getattr(settings, 'CATALOG_XFETCH_BETA', 1.0)
+    if local_cache.max_bytes:
+        version_listener.ensure_started()
+        local_versions = version_listener.get(scopes)
+        entry = local_cache.get(key, now) if local_versions is not None else None
+        if entry is not None and entry['versions'] == local_versions and not refresh_early(entry, now, beta):
+            local_stats['hits'] += 1
+            return entry, 'HIT'
+    try:
+        versions, modified = get_versions(scopes)
+        entry = cache.get(key)
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache nicht erreichbar: {e}")
+        return uncached_entry(build()), 'MISS'
+    version_listener.remember(dict(zip(scopes, versions)))
+    valid = entry is not None and entry['versions'] == versions and now < entry['expires']
+    if valid and not refresh_early(entry, now, beta):
+        record('hits')
+        store_local(key, entry)
+        return entry, 'HIT'
+    try:
+        token = acquire_lock(key)
+    except CACHE_ERRORS as e:
+        print(f"Warnung: Cache nicht erreichbar: {e}")
+        return uncached_entry(build()), 'MISS'
+    if token is None:
+        if valid:
+            record('hits')
+            return entry, 'HIT'
+        if entry is not None:
+            record('stale')
+            return entry, 'STALE'
+        entry = wait_for_fill(key, versions)
+        if entry is not None:
+            record('hits')
+            return entry, 'HIT'
+        record('misses')
+        return uncached_entry(build()), 'MISS'
+    entry = None
+    try:
+        content, delta = build_timed(build)
+        if content is not None:
+            entry = store(key, versions, modified, content, delta)
+            store_local(key, entry)
+    finally:
+        release_lock(key, token)
+    record('misses')
+    return entry, 'MISS'
@@ -0,0 +1,101 @@
+from xml.etree import ElementTree
+
+
+DASH_NAMESPACE = 'urn:mpeg:dash:schema:mpd:2011'
+DASH_PROFILE = 'urn:mpeg:dash:profile:isoff-main:2011'
+DASH_TIMESCALE = 1000
+
+
+def format_duration(seconds):
+    """Formats seconds as an ISO 8601 duration, e.g. 'PT634.560S'."""
+    return f'PT{seconds:.3f}S'
+
+
+def format_range(offset, length):
+    """Formats a byte range as the inclusive 'first-last' range used by DASH, e.g. '0-799'."""
+    return f'{offset}-{offset + length - 1}'
+
+
+def build_segment_timeline(durations):
+    """
+    Compresses segment durations into the (duration, repeat) pairs of a `SegmentTimeline`.
+    Consecutive segments with the same duration share one entry, so a typical rendition with equal segments and a
+    shorter last one needs two entries.
+    Args:
+        durations (list): The duration of every segment in `DASH_TIMESCALE` units.
+    Returns:
+        list: (duration, repeat) tuples, where repeat counts the additional segments of the same duration.
+    """
+    timeline = []
+    for duration in durations:
+        if timeline and timeline[-1][0] == duration:
+            timeline[-1] = (duration, timeline[-1][1] + 1)
+        else:
+            timeline.append((duration, 0))
+    return timeline
+
+
+def build_mpd(representations, duration):
+    """
+    Builds a static MPEG-DASH manifest for renditions that are stored as single fragmented MP4 files.
+    Every representation points at the same file that its HLS playlist uses: the init segment and the media
+    segments are addressed by byte range in a `SegmentList`, so DASH clients play the HLS media without a second
+    encode or a copy of the segments. Representations are grouped into one adaptation set per content type, so a
+    shared audio rendition becomes its own audio adaptation set next to the video rungs.
+    Args:
+        representations (list): One dict per rendition, ordered by bandwidth, with 'id', 'content_type' ('video'
+            or 'audio'), 'bandwidth', 'media' (the file name relative to the manifest), 'init' (a dict with 'media',
+            'offset' and 'length') and 'segments' (dicts with 'offset', 'length' and 'duration' in seconds).
+            'width', 'height', 'codecs' and 'frame_rate' are written if present.
+        duration (float): The duration of the presentation in seconds.
+    Returns:
+        str: The manifest as XML.
+    """
+    mpd = ElementTree.Element('MPD', {
+        'xmlns': DASH_NAMESPACE,
+        'profiles': DASH_PROFILE,
+        'type': 'static',
+        'mediaPresentationDuration': format_duration(duration),
+        'minBufferTime': format_duration(2),
+    })
+    period = ElementTree.SubElement(mpd, 'Period', {'id': '0', 'start': format_duration(0)})
+    adaptation_sets = {}
+    for representation in representations:
+        content_type = representation.get('content_type', 'video')
+        if content_type not in adaptation_sets:
+            adaptation_sets[content_type] = ElementTree.SubElement(period, 'AdaptationSet', {
+                'id': str(len(adaptation_sets)), 'contentType': content_type, 'mimeType': f'{content_type}/mp4',
+                'segmentAlignment': 'true', 'startWithSAP': '1',
+            })
+        attributes = {'id': representation['id'], 'bandwidth': str(representation['bandwidth'])}
+        if representation.get('width') and representation.get('height'):
+            attributes['width'] = str(representation['width'])
+            attributes['height'] = str(representation['height'])
+        if representation.get('codecs'):
+            attributes['codecs'] = representation['codecs']
+        if representation.get('frame_rate'):
+            attributes['frameRate'] = f"{representation['frame_rate']:g}"
+        element = ElementTree.SubElement(adaptation_sets[content_type], 'Representation', attributes)
+        ElementTree.SubElement(element, 'BaseURL').text = representation['media']
+        segment_list = ElementTree.SubElement(element, 'SegmentList', {'timescale': str(DASH_TIMESCALE)})
+        init = representation['init']
+        init_attributes = {'range': format_range(init['offset'], init['length'])}
+        if init['media'] != representation['media']:
+            init_attributes['sourceURL'] = init['media']
+        ElementTree.SubElement(segment_list, 'Initialization', init_attributes)
+        segments = representation['segments']
+        timeline = ElementTree.SubElement(segment_list, 'SegmentTimeline')
+        durations = [round(segment['duration'] * DASH_TIMESCALE) for segment in segments]
+        for index, (segment_duration, repeat) in enumerate(build_segment_timeline(durations)):
+            entry = {'d': str(segment_duration)}
+            if index == 0:
+                entry['t'] = '0'
+            if repeat:
+                entry['r'] = str(repeat)
+            ElementTree.SubElement(timeline, 'S', entry)
+        for segment in segments:
+            ElementTree.SubElement(segment_list, 'SegmentURL', {
+                'mediaRange': format_range(segment['offset'], segment['length']),
+            })
+    ElementTree.indent(mpd)
+    return '<?xml version="1.0" encoding="UTF-8"?>\n' + ElementTree.tostring(mpd, encoding='unicode') + '\n'
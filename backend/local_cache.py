@@ -0,0 +1,182 @@
+import collections
+import os
+import threading
+import time
+from django_redis import get_redis_connection
+from django_redis.exceptions import ConnectionInterrupted
+from redis.exceptions import RedisError
+
+
+RECONNECT_DELAY = 5
+
+
+class LocalCache:
+    """
+    A bounded in-process cache with LRU eviction and per-entry expiry, sized by bytes instead of entries.
+    It sits in front of Redis for the hottest catalog responses, which it serves without a network round trip or
+    unpickling. Entries are only as coherent as the caller makes them: `backend.cache` stores the versions a
+    response was built from in the entry and compares them with the versions kept by a `VersionListener`.
+    All methods are thread-safe.
+    Attributes:
+        max_bytes (int): The budget for the sizes of all entries. 0 disables the cache.
+        size (int): The current size of all entries in bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, now=None):
+        """
+        Returns the value of a key that has not expired and marks it as recently used, or `None`.
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            value, size, expires = item
+            if now >= expires:
+                del self.entries[key]
+                self.size -= size
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size, expires):
+        """
+        Stores a value until `expires` (Unix time), evicting the least recently used entries until it fits.
+        Values larger than a quarter of the budget are not stored, so one large response cannot flush the cache.
+        Args:
+            key (str): The key.
+            value: The value.
+            size (int): The size of the value in bytes.
+            expires (float): The Unix time after which the value is no longer returned.
+        """
+        if size > self.max_bytes // 4:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            while self.entries and self.size + size > self.max_bytes:
+                _, (_, evicted_size, _) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+            self.entries[key] = (value, size, expires)
+            self.size += size
+
+    def clear(self):
+        """Removes all entries."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class VersionListener:
+    """
+    Keeps a per-process copy of the catalog versions, updated through a Redis pub/sub channel.
+    Every version bump is published on the channel, and a daemon thread of each process applies it to the copy,
+    so a process can check whether a locally cached response is current without asking Redis. The copy is only
+    trusted while the subscription is active: pub/sub delivers at most once, so when the connection drops, the
+    copy is cleared together with the local cache (`on_reset`) and rebuilt after reconnecting.
+    The thread is started on first use in every process, so forked web workers each get their own.
+    Attributes:
+        channel (str): The pub/sub channel of the version bumps.
+        on_reset (callable): Called whenever the copy is cleared.
+        connected (threading.Event): Set while the subscription is active.
+    """
+
+    def __init__(self, channel, on_reset=None):
+        self.channel = channel
+        self.on_reset = on_reset
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.connected = threading.Event()
+        self.pid = None
+        self.disabled = False
+
+    def ensure_started(self):
+        """Starts the listener thread if this process does not have one yet."""
+        if self.disabled or self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.versions.clear()
+            self.connected.clear()
+        threading.Thread(target=self.run, name='catalog-version-listener', daemon=True).start()
+
+    def run(self):
+        """Subscribes to the channel and applies version messages, reconnecting after connection errors."""
+        while True:
+            try:
+                connection = get_redis_connection('default')
+            except NotImplementedError:
+                # the cache backend is not Redis, so there is no channel to listen to
+                self.disabled = True
+                return
+            pubsub = connection.pubsub()
+            try:
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        self.connected.set()
+                    elif message['type'] == 'message':
+                        self.handle(message['data'])
+            except (RedisError, ConnectionInterrupted) as e:
+                print(f"Warnung: Cache-Versionskanal unterbrochen: {e}")
+            finally:
+                self.reset()
+                pubsub.close()
+            time.sleep(RECONNECT_DELAY)
+
+    def reset(self):
+        """Forgets all versions, since bumps may be missed until the subscription is active again."""
+        self.connected.clear()
+        with self.lock:
+            self.versions.clear()
+        if self.on_reset is not None:
+            self.on_reset()
+
+    def handle(self, data):
+        """Applies a message of the form '<scope> <version>'."""
+        if isinstance(data, bytes):
+            data = data.decode()
+        scope, _, version = data.rpartition(' ')
+        try:
+            version = int(version)
+        except ValueError:
+            print(f"Warnung: Ungültige Cache-Version: {data}")
+            return
+        with self.lock:
+            if version > self.versions.get(scope, -1):
+                self.versions[scope] = version
+
+    def remember(self, versions):
+        """
+        Stores versions read from Redis. Versions only grow, so a value read from Redis just before a bump can never
+        overwrite the newer value that arrived on the channel in between.
+        Versions are ignored while the subscription is not active, since later bumps could not be received.
+        Args:
+            versions (dict): The versions by scope.
+        """
+        if not self.connected.is_set():
+            return
+        with self.lock:
+            for scope, version in versions.items():
+                if version > self.versions.get(scope, -1):
+                    self.versions[scope] = version
+
+    def get(self, scopes):
+        """
+        Returns the versions of the scopes, or `None` if one of them is unknown or the subscription is not active.
+        """
+        if not self.connected.is_set():
+            return None
+        with self.lock:
+            if not all(scope in self.versions for scope in scopes):
+                return None
+            return [self.versions[scope] for scope in scopes]
@@ -0,0 +1,280 @@
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from backend.process import run_process
+from backend.tasks import (
+    AUDIO_CODEC, AUDIO_RENDITION, VIDEO_LADDER, build_audio_command, build_copy_command, build_encode_command,
+    find_copy_rung, parse_probe, playlist_stats, priority_groups, run_command, select_ladder
+)
+
+
+BASELINE_VERSION = 1
+DEFAULT_SIZES = ['640x360', '1280x720', '1920x1080']
+DEFAULT_DURATIONS = [10, 60]
+# metrics where a higher value is better; all other metrics regress when they grow
+HIGHER_IS_BETTER = {'speed'}
+
+
+def build_clip_command(target, width, height, duration, frame_rate=30):
+    """
+    Builds the ffmpeg command that renders a reproducible test clip from ffmpeg's lavfi sources.
+    The picture is `testsrc2`, which has moving content and a running counter, so the encoder does real work on
+    every frame. The sound is a `sine` tone. Both are generated from their parameters alone, so every run on
+    every machine encodes the same input. The clip is H.264/AAC, like most uploads.
+    Parameters:
+    target (str): The file path of the clip.
+    width (int): The width of the clip in pixels.
+    height (int): The height of the clip in pixels.
+    duration (int): The length of the clip in seconds.
+    frame_rate (int, optional): The frame rate of the clip. Defaults to 30.
+    Returns:
+    list: The ffmpeg arguments.
+    """
+    return [
+        'ffmpeg', '-y', '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={frame_rate}:duration={duration}',
+        '-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=48000:duration={duration}',
+        '-c:v', 'libx264', '-preset', 'fast', '-crf', '18', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '192k',
+        '-shortest', target,
+    ]
+
+
+def job_metrics(result, duration):
+    """
+    Returns the measurements of one ffmpeg run: wall-clock seconds, CPU seconds, peak RSS and the speed as a
+    multiple of real time.
+    """
+    return {
+        'ok': result.ok,
+        'seconds': result.seconds,
+        'cpu_seconds': result.cpu_seconds,
+        'max_rss_kb': result.max_rss_kb,
+        'speed': round(duration / result.seconds, 3) if result.seconds else None,
+    }
+
+
+def rendition_metrics(hls_target):
+    """Returns the size, bitrates and segment count of a rendition, or `None` if its playlist was not written."""
+    if not os.path.exists(hls_target):
+        return None
+    return playlist_stats(hls_target)
+
+
+def benchmark_clip(source, duration, copy=True):
+    """
+    Runs the conversion pipeline of `process_video` against a clip and measures every ffmpeg job.
+    The same commands as in production are built with the pipeline's own functions: the ladder is chosen with
+    `select_ladder`, the audio rendition with `build_audio_command`, a matching rung is copied with
+    `build_copy_command` and the other rungs are encoded in the groups of `priority_groups` with
+    `build_encode_command`. The jobs run one after another, and nothing is written to the database or Redis.
+    The test clips are H.264 at ladder sizes, so the top rung is always copied. With `copy` disabled, every rung
+    is encoded, so presets and CRF are measured on the most expensive rung as well.
+    The time to first playable assumes that the audio job and the video jobs run on separate workers, as they
+    do with RQ: the master playlist is published once the probe, the audio rendition and the first video
+    rendition (the copied rung, or else the first encode group) are done.
+    Parameters:
+    source (str): The file path of the clip.
+    duration (int): The length of the clip in seconds.
+    copy (bool, optional): If False, no rung is produced by stream copy. Defaults to True.
+    Returns:
+    dict: The metrics of every job under 'jobs', of every rendition under 'renditions', and the totals
+        'seconds', 'cpu_seconds', 'max_rss_kb' and 'time_to_first_playable'.
+    """
+    jobs = {}
+    renditions = {}
+    probe = run_process(
+        ['ffprobe', '-v', 'error', '-print_format', 'json=compact=1', '-show_format', '-show_streams', source]
+    )
+    if not probe.ok:
+        raise CommandError(f"{source} konnte nicht analysiert werden: {probe.describe()}")
+    jobs['probe'] = job_metrics(probe, duration)
+    metadata = parse_probe(probe.stdout)
+    ladder = select_ladder(metadata.get('height'), metadata.get('width'))
+    separate_audio = bool(getattr(settings, 'VIDEO_SEPARATE_AUDIO', True) and metadata.get('audio_codec'))
+    audio_seconds = 0
+    if separate_audio:
+        args, hls_target = build_audio_command(source, copy=metadata['audio_codec'] == AUDIO_CODEC)
+        result = run_command(args)
+        jobs[f'encode_{AUDIO_RENDITION}'] = job_metrics(result, duration)
+        renditions[AUDIO_RENDITION] = rendition_metrics(hls_target)
+        audio_seconds = result.seconds
+    first_video_seconds = None
+    copy_rung = find_copy_rung(metadata, ladder, separate_audio=separate_audio) if copy else None
+    if copy_rung:
+        args, hls_target = build_copy_command(source, copy_rung, separate_audio=separate_audio)
+        result = run_command(args)
+        jobs[f"copy_{copy_rung['resolution']}"] = job_metrics(result, duration)
+        renditions[copy_rung['resolution']] = rendition_metrics(hls_target)
+        first_video_seconds = result.seconds
+        ladder = [rung for rung in ladder if rung is not copy_rung]
+    for _, rungs in priority_groups(ladder):
+        args, targets = build_encode_command(source, rungs, direct_hls=True, separate_audio=separate_audio)
+        result = run_command(args)
+        jobs['encode_' + '_'.join(rung['resolution'] for rung in rungs)] = job_metrics(result, duration)
+        for resolution, hls_target in targets:
+            renditions[resolution] = rendition_metrics(hls_target)
+        if first_video_seconds is None:
+            first_video_seconds = result.seconds
+    return {
+        'jobs': jobs,
+        'renditions': renditions,
+        'seconds': round(sum(job['seconds'] for job in jobs.values()), 3),
+        'cpu_seconds': round(sum(job['cpu_seconds'] for job in jobs.values()), 3),
+        'max_rss_kb': max(job['max_rss_kb'] for job in jobs.values()),
+        'time_to_first_playable': round(probe.seconds + max(audio_seconds, first_video_seconds or 0), 3),
+    }
+
+
+def flatten_metrics(data, prefix=''):
+    """
+    Flattens the numeric values of a nested baseline into a dict of dotted paths,
+    e.g. {'720p_10s.renditions.360p.size_bytes': 1843200}.
+    """
+    metrics = {}
+    for key, value in data.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict):
+            metrics.update(flatten_metrics(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            metrics[path] = value
+    return metrics
+
+
+def compare_baselines(baseline, current):
+    """
+    Compares the metrics of two benchmark runs.
+    Parameters:
+    baseline (dict): The earlier run, as written by the benchmark.
+    current (dict): The new run.
+    Returns:
+    list: (path, old value, new value, regression in percent) tuples for every metric present in both runs. The
+        regression is positive if the metric got worse, i.e. grew, or shrank for metrics in `HIGHER_IS_BETTER`.
+        It is `None` if the old value is 0.
+    """
+    old_metrics = flatten_metrics(baseline.get('clips', {}))
+    new_metrics = flatten_metrics(current.get('clips', {}))
+    changes = []
+    for path in sorted(old_metrics.keys() & new_metrics.keys()):
+        old, new = old_metrics[path], new_metrics[path]
+        regression = None
+        if old:
+            regression = (new - old) / old * 100
+            if path.rsplit('.', 1)[-1] in HIGHER_IS_BETTER:
+                regression = -regression
+        changes.append((path, old, new, regression))
+    return changes
+
+
+class Command(BaseCommand):
+    help = (
+        'Renders synthetic test clips with ffmpeg and runs the conversion pipeline against them. Reports encode '
+        'speed, CPU seconds, peak RSS, bytes per rendition and time to first playable as JSON, optionally '
+        'compared with an earlier baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', nargs='+', default=DEFAULT_SIZES, metavar='WIDTHxHEIGHT',
+            help='Resolutions of the test clips (default: %(default)s).',
+        )
+        parser.add_argument(
+            '--durations', nargs='+', type=int, default=DEFAULT_DURATIONS, metavar='SECONDS',
+            help='Lengths of the test clips in seconds (default: %(default)s).',
+        )
+        parser.add_argument('--frame-rate', type=int, default=30, help='Frame rate of the test clips.')
+        parser.add_argument('--output', help='Writes the results to this JSON file instead of standard output.')
+        parser.add_argument('--compare', metavar='BASELINE', help='Compares the results with an earlier JSON file.')
+        parser.add_argument(
+            '--max-regression', type=float, metavar='PERCENT',
+            help='With --compare, fails if any metric got worse by more than this percentage.',
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Encodes every rung, including the one the clip matches and the pipeline would stream-copy.',
+        )
+        parser.add_argument('--keep', action='store_true', help='Keeps the clips and renditions after the run.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Baseline {options['compare']} konnte nicht gelesen werden: {e}")
+        with contextlib.redirect_stdout(sys.stderr):
+            results = self.run_benchmark(options)
+        output = json.dumps(results, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if baseline is not None:
+            self.report_changes(compare_baselines(baseline, results), options['max_regression'])
+
+    def run_benchmark(self, options):
+        """
+        Renders the test clips and benchmarks each of them with `benchmark_clip`.
+        `handle` runs it with standard output redirected to standard error, so the error messages that
+        `run_command` and the pipeline functions print cannot end up in the JSON report on standard output.
+        Returns:
+        dict: The results, with the ffmpeg version, the pipeline settings and the metrics of every clip.
+        """
+        version = run_process(['ffmpeg', '-version'])
+        if not version.ok:
+            raise CommandError(f"ffmpeg ist nicht verfügbar: {version.describe()}")
+        results = {
+            'version': BASELINE_VERSION,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'ffmpeg': version.stdout.splitlines()[0] if version.stdout else None,
+            'settings': {
+                'segment_type': getattr(settings, 'VIDEO_HLS_SEGMENT_TYPE', 'mpegts'),
+                'separate_audio': getattr(settings, 'VIDEO_SEPARATE_AUDIO', True),
+                'prioritize_first_rung': getattr(settings, 'VIDEO_PRIORITIZE_FIRST_RUNG', True),
+                'ladder': VIDEO_LADDER,
+                'copy': not options['no_copy'],
+            },
+            'clips': {},
+        }
+        work_dir = tempfile.mkdtemp(prefix='videoflix-benchmark-')
+        try:
+            for size in options['sizes']:
+                try:
+                    width, height = (int(value) for value in size.lower().split('x'))
+                except ValueError:
+                    raise CommandError(f"Ungültige Auflösung: {size}")
+                for duration in options['durations']:
+                    name = f'{height}p_{duration}s'
+                    self.stderr.write(f'Benchmarking {name}')
+                    source = os.path.join(work_dir, f'clip_{name}.mp4')
+                    clip = run_command(build_clip_command(source, width, height, duration, options['frame_rate']))
+                    if not clip.ok:
+                        raise CommandError(f"Testclip {name} konnte nicht erstellt werden: {clip.describe()}")
+                    results['clips'][name] = dict(
+                        width=width, height=height, duration=duration, **benchmark_clip(source, duration, copy=not options['no_copy'])
+                    )
+        finally:
+            if options['keep']:
+                self.stderr.write(f'Dateien in {work_dir}')
+            else:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        return results
+
+    def report_changes(self, changes, max_regression):
+        """Prints the changes against the baseline and fails if one exceeds `max_regression` percent."""
+        regressions = []
+        for path, old, new, regression in changes:
+            change = 'n/a' if regression is None else f'{regression:+.1f}%'
+            self.stderr.write(f'{path}: {old} -> {new} ({change})')
+            if max_regression is not None and regression is not None and regression > max_regression:
+                regressions.append(path)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} Messwerte um mehr als {max_regression}% verschlechtert: {', '.join(regressions)}"
+            )
@@ -0,0 +1,226 @@
+import os
+import posixpath
+import re
+import stat
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+
+
+MEDIA_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+    '.ts': 'video/mp2t',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+    '.vtt': 'text/vtt',
+    '.jpg': 'image/jpeg',
+    '.png': 'image/png',
+    '.webp': 'image/webp',
+}
+MANIFEST_EXTENSIONS = ('.m3u8', '.mpd')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+PRIVATE_MEDIA_DIRS = ('uploads/',)
+SIGNED_MEDIA_DIRS = ('videos/',)
+RENDITION_EXTENSIONS = ('.m3u8', '.ts', '.m4s', '.init.mp4')
+
+
+def media_content_type(path):
+    """Returns the content type of a media file from its extension."""
+    return MEDIA_CONTENT_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+
+
+def normalize_media_path(path):
+    """
+    Resolves the '.' and '..' segments of a path relative to MEDIA_ROOT, so the checks on its directory see the
+    path that is actually served ('./uploads/x' and 'videos/../uploads/x' both become 'uploads/x').
+    Raises:
+        Http404: If the path leaves MEDIA_ROOT.
+    """
+    normalized = posixpath.normpath(path)
+    if normalized in ('.', '..') or normalized.startswith(('/', '../')):
+        raise Http404
+    return normalized
+
+
+def is_private(absolute_path):
+    """
+    Returns True if a file lies in one of the `PRIVATE_MEDIA_DIRS`. Both sides are resolved with
+    `os.path.realpath`, so neither dot segments nor symlinks reach the partial uploads.
+    """
+    real_path = os.path.realpath(absolute_path)
+    for directory in PRIVATE_MEDIA_DIRS:
+        private_dir = os.path.realpath(os.path.join(settings.MEDIA_ROOT, directory))
+        if real_path == private_dir or real_path.startswith(private_dir + os.sep):
+            return True
+    return False
+
+
+def requires_signature(path):
+    """
+    Returns True if a media file is an HLS playlist or segment of a rendition, which `MEDIA_REQUIRE_SIGNED_URLS`
+    restricts to signed URLs. Trickplay tracks and sprites, thumbnails, DASH manifests and source files are not
+    covered: the catalog exposes them as plain URLs.
+    """
+    return path.startswith(SIGNED_MEDIA_DIRS) and path.lower().endswith(RENDITION_EXTENSIONS)
+
+
+def media_cache_control(path):
+    """
+    Returns the Cache-Control header of a media file.
+    Playlists and manifests are rewritten while renditions land, so they may only be cached for
+    `MEDIA_MANIFEST_MAX_AGE` seconds. Segments and all other files never change under their name and are immutable.
+    """
+    if path.lower().endswith(MANIFEST_EXTENSIONS):
+        return f"public, max-age={getattr(settings, 'MEDIA_MANIFEST_MAX_AGE', 2)}"
+    return IMMUTABLE_CACHE_CONTROL
+
+
+def file_etag(file_stat):
+    """Returns a strong ETag built from the size and modification time of a file, without reading it."""
+    return f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+
+
+def etag_matches(header, etag):
+    """Returns True if an If-None-Match or If-Range header matches the ETag. Weak validators compare equal."""
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+
+def parse_range(header, size):
+    """
+    Parses a single-range Range header.
+    Args:
+        header (str): The header value, e.g. 'bytes=0-1023', 'bytes=1024-' or 'bytes=-500'.
+        size (int): The size of the file in bytes.
+    Returns:
+        tuple or None: The first and last byte of the range, or `None` if the header is missing, malformed or asks
+            for several ranges. In that case the whole file is sent, which RFC 9110 allows.
+    Raises:
+        ValueError: If the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - suffix, 0), size - 1
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first >= size or last < first:
+        raise ValueError(header)
+    return first, last
+
+
+def read_range(path, first, last):
+    """Yields the bytes from `first` to `last` of a file in blocks of `STREAM_BLOCK_SIZE`."""
+    with open(path, 'rb') as f:
+        f.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def offload_response(relative_path, absolute_path):
+    """
+    Returns an empty response that tells the web server to send the file itself, or `None` without offloading.
+    With `MEDIA_SENDFILE_MODE = 'x-accel-redirect'`, nginx serves the file from the internal location
+    `MEDIA_SENDFILE_PREFIX`; with 'x-sendfile', Apache's mod_xsendfile serves the absolute path. The web server
+    then also answers Range requests, so the file's bytes never pass through Python.
+    """
+    mode = getattr(settings, 'MEDIA_SENDFILE_MODE', None)
+    if mode == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + relative_path
+        return response
+    if mode == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = absolute_path
+        return response
+    return None
+
+
+def file_response(request, absolute_path, size, etag):
+    """
+    Sends a file from Python: the requested byte range with 206, or the whole file with `FileResponse`.
+    A Range header is ignored if an If-Range header does not match the current ETag, so clients never combine
+    parts of different versions of a file.
+    """
+    byte_range = None
+    if 'If-Range' not in request.headers or etag_matches(request.headers['If-Range'], etag):
+        try:
+            byte_range = parse_range(request.headers.get('Range'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    if byte_range is None:
+        return FileResponse(open(absolute_path, 'rb'))
+    first, last = byte_range
+    response = StreamingHttpResponse(read_range(absolute_path, first, last), status=206)
+    response['Content-Length'] = str(last - first + 1)
+    response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def serve_media(request, relative_path):
+    """
+    Serves a file below MEDIA_ROOT with validators, per-type caching and byte ranges.
+    Requests whose If-None-Match header matches the file's ETag get a 304 without touching the file's content.
+    Without an offload mode (see `offload_response`), a Range request is answered with 206 and only the requested
+    bytes are streamed, and a full request is sent with `FileResponse`, which the WSGI server can pass to sendfile.
+    Args:
+        request (HttpRequest): The request.
+        relative_path (str): The path of the file relative to MEDIA_ROOT. It is normalized with
+            `normalize_media_path` before it is checked.
+    Returns:
+        HttpResponse: The file, a part of it, a 304, or a 416 for an unsatisfiable range.
+    Raises:
+        Http404: If the path leaves MEDIA_ROOT, points into a private directory such as the partial uploads, or
+            is not a file.
+    """
+    relative_path = normalize_media_path(relative_path)
+    try:
+        absolute_path = safe_join(settings.MEDIA_ROOT, relative_path)
+    except SuspiciousFileOperation:
+        raise Http404
+    if is_private(absolute_path):
+        raise Http404
+    try:
+        file_stat = os.stat(absolute_path)
+    except OSError:
+        raise Http404
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404
+    etag = file_etag(file_stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(file_stat.st_mtime),
+        'Cache-Control': media_cache_control(relative_path),
+    }
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+    else:
+        response = offload_response(relative_path, absolute_path)
+        if response is None:
+            response = file_response(request, absolute_path, file_stat.st_size, etag)
+    response['Content-Type'] = media_content_type(relative_path)
+    response['Accept-Ranges'] = 'bytes'
+    for name, value in headers.items():
+        response[name] = value
+    return response
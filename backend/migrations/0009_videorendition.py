@@ -0,0 +1,78 @@
+# Generated by Django 5.0.6 on 2026-10-17 10:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+LADDER = {
+    '360p': (640, 360),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+}
+
+
+def copy_fixed_renditions(apps, schema_editor):
+    Video = apps.get_model('backend', 'Video')
+    VideoRendition = apps.get_model('backend', 'VideoRendition')
+    renditions = []
+    for video in Video.objects.all():
+        for resolution, (width, height) in LADDER.items():
+            playlist = getattr(video, f'video_{resolution}_m3u8')
+            if playlist:
+                renditions.append(VideoRendition(
+                    video=video, codec='h264', resolution=resolution, width=width, height=height,
+                    playlist=playlist.name, status='ready',
+                ))
+    VideoRendition.objects.bulk_create(renditions)
+
+
+def restore_fixed_renditions(apps, schema_editor):
+    Video = apps.get_model('backend', 'Video')
+    VideoRendition = apps.get_model('backend', 'VideoRendition')
+    for rendition in VideoRendition.objects.filter(codec='h264', resolution__in=LADDER, status='ready'):
+        Video.objects.filter(pk=rendition.video_id).update(
+            **{f'video_{rendition.resolution}_m3u8': rendition.playlist.name}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0008_video_probe_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VideoRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(default='h264', max_length=50)),
+                ('resolution', models.CharField(max_length=20)),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('bitrate', models.PositiveIntegerField(blank=True, null=True)),
+                ('segment_count', models.PositiveIntegerField(default=0)),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+                ('playlist', models.FileField(blank=True, null=True, upload_to='videos/')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='backend.video')),
+            ],
+            options={
+                'ordering': ['height'],
+                'constraints': [models.UniqueConstraint(fields=('video', 'codec', 'resolution'), name='unique_video_rendition')],
+            },
+        ),
+        migrations.RunPython(copy_fixed_renditions, restore_fixed_renditions),
+        migrations.RemoveField(
+            model_name='video',
+            name='video_1080p_m3u8',
+        ),
+        migrations.RemoveField(
+            model_name='video',
+            name='video_360p_m3u8',
+        ),
+        migrations.RemoveField(
+            model_name='video',
+            name='video_720p_m3u8',
+        ),
+    ]
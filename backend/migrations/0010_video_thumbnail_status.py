@@ -0,0 +1,24 @@
+# Generated by Django 5.0.6 on 2026-10-17 10:41
+
+from django.db import migrations, models
+
+
+def mark_existing_thumbnails(apps, schema_editor):
+    Video = apps.get_model('backend', 'Video')
+    Video.objects.exclude(thumbnails='').exclude(thumbnails__isnull=True).update(thumbnail_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0009_videorendition'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_thumbnails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0010_video_thumbnail_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='trickplay_vtt',
+            field=models.FileField(blank=True, null=True, upload_to='videos/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0012_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='video_dash_mpd',
+            field=models.FileField(blank=True, null=True, upload_to='videos/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-17 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0013_video_video_dash_mpd'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videorendition',
+            name='peak_bitrate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='videorendition',
+            name='codecs',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='videorendition',
+            name='frame_rate',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
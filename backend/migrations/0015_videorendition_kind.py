@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0014_videorendition_playlist_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videorendition',
+            name='kind',
+            field=models.CharField(choices=[('video', 'Video'), ('audio', 'Audio')], default='video', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-17 07:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0017_video_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='pixel_format',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='video_profile',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+    ]
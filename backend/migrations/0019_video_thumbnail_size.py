@@ -0,0 +1,34 @@
+# Generated by Django 5.0.6 on 2026-10-17 14:12
+
+from django.db import migrations, models
+
+
+def store_thumbnail_sizes(apps, schema_editor):
+    Video = apps.get_model('backend', 'Video')
+    for video in Video.objects.exclude(thumbnails='').exclude(thumbnails__isnull=True).iterator():
+        try:
+            width, height = video.thumbnails.width, video.thumbnails.height
+        except (OSError, ValueError):
+            continue
+        Video.objects.filter(pk=video.pk).update(thumbnail_width=width, thumbnail_height=height)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_video_profile_pixel_format'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail_height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail_width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(store_thumbnail_sizes, migrations.RunPython.noop),
+    ]
@@ -1,33 +1,167 @@
+import os
+import uuid
+from django.conf import settings
 from django.db import models
 from datetime import date
 
+
+class ProcessingStatus(models.TextChoices):
+    """
+    The processing state of a pipeline stage, shared by thumbnails and renditions.
+    """
+    PENDING = 'pending', 'Pending'
+    PROCESSING = 'processing', 'Processing'
+    READY = 'ready', 'Ready'
+    FAILED = 'failed', 'Failed'
+
+
+class RenditionKind(models.TextChoices):
+    """
+    The type of media in a rendition. Audio renditions are shared by all video renditions of a video.
+    """
+    VIDEO = 'video', 'Video'
+    AUDIO = 'audio', 'Audio'
+
+
 class Video(models.Model):
     """
     Represents a video record, containing details and various resolution streams.
+    The individual streams are stored as `VideoRendition` records, available through `renditions`.
     Attributes:
         created_at (models.DateField): The date when the video was created. Defaults to the current day.
+        updated_at (models.DateTimeField): When the video or one of its renditions was last changed. Set by `save`;
+            queryset updates must set it themselves, see `backend.tasks.update_video`.
         title (models.CharField): The title of the video, limited to 100 characters.
         description (models.TextField): A text field that describes the video.
         thumbnails (models.ImageField): An optional image field for storing video thumbnails. Stored in the 'thumbnails/' directory.
-        video_360p_m3u8 (models.FileField): An optional field for storing the 360p .m3u8 video file. Stored in the 'videos/' directory.
-        video_720p_m3u8 (models.FileField): An optional field for storing the 720p .m3u8 video file. Stored in the 'videos/' directory.
-        video_1080p_m3u8 (models.FileField): An optional field for storing the 1080p .m3u8 video file. Stored in the 'videos/' directory.
+        thumbnail_status (models.CharField): The state of the queued thumbnail job, one of `ProcessingStatus`.
+        thumbnail_width (models.PositiveIntegerField): The width of the thumbnail image in pixels, stored when the thumbnail is saved so lists never open the image.
+        thumbnail_height (models.PositiveIntegerField): The height of the thumbnail image in pixels.
         video_master_m3u8 (models.FileField): An optional field for storing the master .m3u8 video file. Stored in the 'videos/' directory.
+        video_dash_mpd (models.FileField): An optional MPEG-DASH manifest that references the fMP4 files of the HLS renditions. Stored in the 'videos/' directory.
+        trickplay_vtt (models.FileField): An optional WebVTT track that maps time ranges to tiles of the seek preview sprite sheets. Stored in the 'videos/' directory.
         video_file (models.FileField): An optional field for storing a video file in any format. Stored in the 'videos/' directory.
         genre (models.CharField): An optional field describing the genre of the video, limited to 100 characters.
+        duration (models.FloatField): The duration of the source video in seconds, as reported by ffprobe.
+        width (models.PositiveIntegerField): The width of the source video in pixels.
+        height (models.PositiveIntegerField): The height of the source video in pixels.
+        frame_rate (models.FloatField): The frame rate of the source video in frames per second.
+        video_codec (models.CharField): The codec of the source video stream, e.g. 'h264'.
+        video_profile (models.CharField): The codec profile of the source video stream, e.g. 'High'.
+        pixel_format (models.CharField): The pixel format of the source video stream, e.g. 'yuv420p'.
+        audio_codec (models.CharField): The codec of the source audio stream, e.g. 'aac'.
+        bitrate (models.PositiveIntegerField): The overall bitrate of the source video in bits per second.
     Methods:
         save(*args, **kwargs): Saves the current instance. Overrides the default save method to perform additional actions.
     """
     created_at = models.DateField(default=date.today)
+    updated_at = models.DateTimeField(auto_now=True)
     title = models.CharField(max_length=100)
     description = models.TextField()
     thumbnails = models.ImageField(upload_to='thumbnails/', null=True, blank=True)
-    video_360p_m3u8 = models.FileField(upload_to='videos/', null=True, blank=True)
-    video_720p_m3u8 = models.FileField(upload_to='videos/', null=True, blank=True)
-    video_1080p_m3u8 = models.FileField(upload_to='videos/', null=True, blank=True)
+    thumbnail_status = models.CharField(max_length=20, choices=ProcessingStatus.choices, default=ProcessingStatus.PENDING)
+    thumbnail_width = models.PositiveIntegerField(null=True, blank=True)
+    thumbnail_height = models.PositiveIntegerField(null=True, blank=True)
     video_master_m3u8 = models.FileField(upload_to='videos/', null=True, blank=True)
+    video_dash_mpd = models.FileField(upload_to='videos/', null=True, blank=True)
+    trickplay_vtt = models.FileField(upload_to='videos/', null=True, blank=True)
     video_file = models.FileField(upload_to='videos/', null=True, blank=True)
     genre = models.CharField(max_length=100, null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    frame_rate = models.FloatField(null=True, blank=True)
+    video_codec = models.CharField(max_length=50, null=True, blank=True)
+    video_profile = models.CharField(max_length=50, null=True, blank=True)
+    pixel_format = models.CharField(max_length=50, null=True, blank=True)
+    audio_codec = models.CharField(max_length=50, null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='video_created_at_id_idx'),
+            models.Index(fields=['genre', '-created_at', '-id'], name='video_genre_created_at_id_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class VideoRendition(models.Model):
+    """
+    Represents one encoded stream of a video, identified by its codec and resolution.
+    Every rendition is stored in its own row, so conversion jobs that finish at the same time update
+    different rows instead of overwriting each other's fields on the `Video`, and new rungs can be added
+    to the ladder without changing the schema.
+    Attributes:
+        video (models.ForeignKey): The video this rendition belongs to. Available on the video as `renditions`.
+        kind (models.CharField): Whether the rendition is a video rung or the shared audio rendition, one of `RenditionKind`.
+        codec (models.CharField): The codec of the rendition, e.g. 'h264' or 'aac'.
+        resolution (models.CharField): The name of the rung in the ladder, e.g. '720p', or 'audio' for the audio rendition.
+        width (models.PositiveIntegerField): The width of the rendition in pixels.
+        height (models.PositiveIntegerField): The height of the rendition in pixels.
+        bitrate (models.PositiveIntegerField): The average bitrate of the rendition in bits per second, measured from its segments.
+        peak_bitrate (models.PositiveIntegerField): The bitrate of the rendition's largest segment in bits per second, advertised as BANDWIDTH.
+        codecs (models.CharField): The RFC 6381 codec strings of the rendition, e.g. 'avc1.64001F,mp4a.40.2'.
+        frame_rate (models.FloatField): The frame rate of the rendition in frames per second.
+        segment_count (models.PositiveIntegerField): The number of HLS segments of the rendition.
+        size_bytes (models.PositiveBigIntegerField): The total size of all segments in bytes.
+        playlist (models.FileField): The .m3u8 playlist of the rendition. Stored in the 'videos/' directory.
+        status (models.CharField): The processing state of the rendition, one of `ProcessingStatus`.
+    """
+    Status = ProcessingStatus
+    Kind = RenditionKind
+
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='renditions')
+    kind = models.CharField(max_length=10, choices=Kind.choices, default=Kind.VIDEO)
+    codec = models.CharField(max_length=50, default='h264')
+    resolution = models.CharField(max_length=20)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    bitrate = models.PositiveIntegerField(null=True, blank=True)
+    peak_bitrate = models.PositiveIntegerField(null=True, blank=True)
+    codecs = models.CharField(max_length=100, null=True, blank=True)
+    frame_rate = models.FloatField(null=True, blank=True)
+    segment_count = models.PositiveIntegerField(default=0)
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    playlist = models.FileField(upload_to='videos/', null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+
+    class Meta:
+        ordering = ['height']
+        constraints = [
+            models.UniqueConstraint(fields=['video', 'codec', 'resolution'], name='unique_video_rendition'),
+        ]
+
+    def __str__(self):
+        return f'{self.video_id} {self.codec} {self.resolution}'
+
+
+class UploadSession(models.Model):
+    """
+    Represents a resumable upload of a video file that is sent in byte ranges.
+    The bytes are written straight into a partial file below MEDIA_ROOT, which is moved into place when the
+    upload is finalized, so the file is never copied.
+    Attributes:
+        id (models.UUIDField): The unguessable identifier of the session, used in the upload URLs.
+        filename (models.CharField): The original name of the uploaded file.
+        size (models.PositiveBigIntegerField): The total size of the file in bytes, announced when the session is created.
+        offset (models.PositiveBigIntegerField): The number of bytes received so far. The next range has to start here.
+        title (models.CharField): The title of the video that is created when the upload is finalized.
+        description (models.TextField): The description of the video.
+        genre (models.CharField): The optional genre of the video.
+        created_at (models.DateTimeField): When the session was created.
+    Methods:
+        partial_path(self): Returns the absolute path of the partial file.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    title = models.CharField(max_length=100)
+    description = models.TextField()
+    genre = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def partial_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{self.id}.part')
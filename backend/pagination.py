@@ -0,0 +1,152 @@
+import base64
+import binascii
+import json
+from datetime import date
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(created_at, pk, reverse=False):
+    """Encodes the position of a row as an opaque, URL-safe page token."""
+    position = {'c': created_at.isoformat(), 'i': pk}
+    if reverse:
+        position['r'] = 1
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """
+    Decodes a page token created by `encode_cursor`.
+    Returns:
+        tuple: The `created_at` date and ID of the row, and whether the page lies before it.
+    Raises:
+        ValueError: If the token is not valid.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return date.fromisoformat(position['c']), int(position['i']), bool(position.get('r'))
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError) as e:
+        raise ValueError(token) from e
+
+
+def keyset_filter(queryset, created_at, pk, reverse=False):
+    """
+    Restricts a video queryset to the rows after (or, with `reverse`, before) the position (created_at, id), i.e.
+    `created_at < X OR (created_at = X AND id < Y)` with the comparisons flipped for `reverse`. The `created_at`
+    part is a range condition on the composite index of the `Video` model, which the database uses with the
+    ordering of the page to stop after `page_size` rows.
+    """
+    if reverse:
+        return queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk))
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+
+class VideoCursorPagination(BasePagination):
+    """
+    Keyset pagination over videos, newest first, ordered by (`created_at`, `id`).
+    A page token holds the (created_at, id) pair of the last row of the previous page, and the next page is
+    fetched with the rows before that position (see `keyset_filter`), which the database reads from the composite
+    index of the `Video` model. Every page therefore costs one index range scan of `page_size` rows, however deep
+    it lies, where an offset would have to skip all earlier rows. Since `id` breaks ties between videos of the same day, tokens stay stable while videos are added
+    or removed: no row is ever skipped or returned twice.
+    The page size is `VIDEO_PAGE_SIZE` and can be chosen by the client with the `page_size` query parameter up to
+    `VIDEO_MAX_PAGE_SIZE`.
+    Attributes:
+        cursor_query_param (str): The query parameter of the page token.
+        page_size_query_param (str): The query parameter of the page size.
+        ordering (tuple): The order of the rows; the keyset filters depend on it.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+
+    def get_page_size(self, request):
+        """
+        Returns the page size requested with `page_size`, capped at `VIDEO_MAX_PAGE_SIZE`, or `VIDEO_PAGE_SIZE`.
+        """
+        page_size = getattr(settings, 'VIDEO_PAGE_SIZE', 20)
+        max_page_size = getattr(settings, 'VIDEO_MAX_PAGE_SIZE', 100)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return min(page_size, max_page_size)
+        return min(requested, max_page_size) if requested > 0 else min(page_size, max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Returns the rows of the page that the `cursor` query parameter points at, or the first page.
+        One row more than the page size is fetched to find out whether there is a further page.
+        Raises:
+            NotFound: If the page token is not valid.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        token = request.query_params.get(self.cursor_query_param)
+        reverse = False
+        if token:
+            try:
+                created_at, pk, reverse = decode_cursor(token)
+            except ValueError:
+                raise NotFound('Invalid cursor')
+            queryset = keyset_filter(queryset, created_at, pk, reverse)
+        ordering = [field.lstrip('-') if reverse else field for field in self.ordering]
+        rows = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, bool(token)
+        self.page = rows
+        return rows
+
+    def get_base_url(self):
+        """
+        Returns the absolute URL of the request with only the `page_size` parameter, which the page links keep.
+        Other query parameters have no effect on the page, and cached pages must not repeat them to other clients.
+        """
+        url = self.request.build_absolute_uri(self.request.path)
+        page_size = self.request.query_params.get(self.page_size_query_param)
+        return replace_query_param(url, self.page_size_query_param, page_size) if page_size else url
+
+    def get_next_link(self):
+        """Returns the URL of the page after the current one, or `None` on the last page."""
+        if not self.has_next or not self.page:
+            return None
+        last = self.page[-1]
+        url = self.get_base_url()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(last.created_at, last.pk))
+
+    def get_previous_link(self):
+        """Returns the URL of the page before the current one, or `None` on the first page."""
+        if not self.has_previous:
+            return None
+        url = self.get_base_url()
+        if not self.page:
+            return url
+        first = self.page[0]
+        token = encode_cursor(first.created_at, first.pk, reverse=True)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
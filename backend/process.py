@@ -0,0 +1,145 @@
+import collections
+import os
+import signal
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+
+
+OUTPUT_LINES = 200
+POLL_INTERVAL = 0.2
+KILL_GRACE_PERIOD = 5
+
+
+@dataclass
+class ProcessResult:
+    """
+    The outcome of a process started with `run_process`.
+    Only the last lines of each output stream are kept, so `stdout` and `stderr` are tails, not the full output.
+    """
+    args: list
+    returncode: int = None
+    stdout: str = ''
+    stderr: str = ''
+    timed_out: bool = False
+    seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    max_rss_kb: int = 0
+    error: str = field(default=None)
+
+    @property
+    def ok(self):
+        """True if the process ran to completion and exited with status 0."""
+        return self.error is None and not self.timed_out and self.returncode == 0
+
+    def describe(self):
+        """Returns a one-line description of why the process failed, for log messages."""
+        if self.error:
+            return self.error
+        if self.timed_out:
+            return f'Zeitlimit nach {self.seconds:.0f} Sekunden überschritten'
+        return f'Exit-Code {self.returncode}: {self.stderr.strip()}'
+
+
+def limit_cpu(cpu_seconds):
+    """
+    Returns a `preexec_fn` that limits the CPU time of the child process with RLIMIT_CPU.
+    The kernel sends SIGXCPU when the soft limit is reached and SIGKILL one second later.
+    """
+    def apply():
+        import resource
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    return apply
+
+
+def kill_process_tree(process, grace_period=KILL_GRACE_PERIOD):
+    """
+    Terminates a process started by `run_process` together with every process it spawned.
+    The process is the leader of its own session, so the whole process group is sent SIGTERM first and SIGKILL
+    if it is still alive after `grace_period` seconds.
+    """
+    for sig, wait in ((signal.SIGTERM, grace_period), (signal.SIGKILL, 0)):
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            return
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def read_stream(stream, lines, on_line):
+    """Reads a pipe line by line into a bounded deque until it is closed."""
+    for line in stream:
+        lines.append(line)
+        if on_line is not None:
+            on_line(line)
+    stream.close()
+
+
+def run_process(args, timeout=None, cpu_limit=None, on_stdout_line=None, output_lines=OUTPUT_LINES):
+    """
+    Runs a program without a shell and waits for it under wall-clock and CPU limits.
+    Standard output and standard error are read by two threads while the program runs, so no pipe can fill up.
+    Only the last `output_lines` lines of each stream are kept, which bounds the memory of long ffmpeg runs.
+    The program is started in a new session; on timeout or an exception in the caller (such as an RQ job timeout)
+    its whole process group is killed, so no orphaned encoders are left behind. Standard input is /dev/null, so a
+    prompt such as ffmpeg's overwrite question fails at once instead of blocking the worker until the timeout.
+    Args:
+        args (list): The program and its arguments, e.g. ['ffprobe', '-v', 'error', 'input.mp4'].
+        timeout (float, optional): The wall-clock limit in seconds.
+        cpu_limit (int, optional): The CPU time limit in seconds, enforced by the kernel with RLIMIT_CPU.
+        on_stdout_line (callable, optional): Called in a reader thread with every line of standard output.
+        output_lines (int): The number of lines kept per stream.
+    Returns:
+        ProcessResult: Exit status, output tails, run time and resource usage of the process.
+    """
+    result = ProcessResult(args=list(args))
+    started = time.monotonic()
+    try:
+        process = subprocess.Popen(
+            result.args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            errors='replace',
+            start_new_session=True, preexec_fn=limit_cpu(cpu_limit) if cpu_limit else None,
+        )
+    except OSError as e:
+        result.error = f'{result.args[0]} konnte nicht gestartet werden: {e}'
+        return result
+    stdout = collections.deque(maxlen=output_lines)
+    stderr = collections.deque(maxlen=output_lines)
+    readers = [
+        threading.Thread(target=read_stream, args=(process.stdout, stdout, on_stdout_line), daemon=True),
+        threading.Thread(target=read_stream, args=(process.stderr, stderr, None), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        while True:
+            pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+            if pid:
+                process.returncode = os.waitstatus_to_exitcode(status)
+                break
+            if timeout is not None and time.monotonic() - started > timeout:
+                result.timed_out = True
+                kill_process_tree(process)
+                break
+            time.sleep(POLL_INTERVAL)
+    except BaseException:
+        kill_process_tree(process)
+        raise
+    if process.returncode is None:
+        process.wait()
+        usage = None
+    for reader in readers:
+        reader.join()
+    result.returncode = process.returncode
+    result.stdout = ''.join(stdout)
+    result.stderr = ''.join(stderr)
+    result.seconds = round(time.monotonic() - started, 3)
+    if usage is not None:
+        result.cpu_seconds = round(usage.ru_utime + usage.ru_stime, 3)
+        result.max_rss_kb = usage.ru_maxrss
+    return result
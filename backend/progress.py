@@ -0,0 +1,113 @@
+import time
+from contextlib import contextmanager
+import django_rq
+from redis.exceptions import RedisError
+
+
+PROGRESS_KEY = 'videoflix:pipeline:{video_id}'
+PROGRESS_TTL = 7 * 24 * 60 * 60
+
+
+def record_stage(video_id, stage, **fields):
+    """
+    Stores fields of a pipeline stage in the video's progress hash in Redis.
+    Every field is stored as '<stage>:<field>'. Progress reporting must never fail a conversion, so Redis
+    errors are only printed.
+    Args:
+        video_id (int): The ID of the video.
+        stage (str): The name of the stage, e.g. 'probe' or 'encode_360p'.
+        **fields: The values to store, e.g. status='running' or seconds=12.5.
+    """
+    key = PROGRESS_KEY.format(video_id=video_id)
+    try:
+        connection = django_rq.get_connection('default')
+        pipeline = connection.pipeline()
+        pipeline.hset(key, mapping={f'{stage}:{name}': value for name, value in fields.items()})
+        pipeline.expire(key, PROGRESS_TTL)
+        pipeline.execute()
+    except RedisError as e:
+        print(f"Warnung: Fortschritt für Video {video_id} konnte nicht gespeichert werden: {e}")
+
+
+class StageOutcome:
+    """
+    The outcome of a stage timed by `stage_timer`. Stages whose work fails without raising, such as an ffmpeg run
+    that `run_command` reports as not ok, call `fail` so the stage is not recorded as 'done'.
+    Attributes:
+        failed (bool): Whether the stage failed.
+    """
+
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        """Marks the stage as failed."""
+        self.failed = True
+
+
+@contextmanager
+def stage_timer(video_id, stage):
+    """
+    Records the status and wall-clock duration of a pipeline stage.
+    The stage is marked 'running' when entered and 'done' or 'failed' with its duration in seconds when left. It
+    is 'failed' if the block raises or calls `fail` on the yielded `StageOutcome`.
+    Args:
+        video_id (int): The ID of the video.
+        stage (str): The name of the stage.
+    Yields:
+        StageOutcome: Lets the block mark the stage as failed.
+    """
+    started = time.monotonic()
+    outcome = StageOutcome()
+    record_stage(video_id, stage, status='running', started_at=time.time())
+    try:
+        yield outcome
+    except BaseException:
+        record_stage(video_id, stage, status='failed', seconds=round(time.monotonic() - started, 3))
+        raise
+    status = 'failed' if outcome.failed else 'done'
+    record_stage(video_id, stage, status=status, seconds=round(time.monotonic() - started, 3))
+
+
+def progress_recorder(video_id, stage):
+    """
+    Returns a callback for `run_command` that stores ffmpeg's progress reports for a stage.
+    The position in the output (in seconds) and the encode speed factor are recorded on every report.
+    Args:
+        video_id (int): The ID of the video.
+        stage (str): The name of the stage.
+    Returns:
+        callable: Takes the dict of one ffmpeg progress report.
+    """
+    def on_progress(report):
+        fields = {}
+        if report.get('out_time_us', '').isdigit():
+            fields['out_time'] = int(report['out_time_us']) / 1000000
+        speed = report.get('speed', '').rstrip('x')
+        if speed and speed != 'N/A':
+            fields['speed'] = float(speed)
+        if fields:
+            record_stage(video_id, stage, **fields)
+    return on_progress
+
+
+def get_pipeline_status(video_id):
+    """
+    Reads all recorded stages of a video.
+    Args:
+        video_id (int): The ID of the video.
+    Returns:
+        dict: One dict of fields per stage, e.g. {'probe': {'status': 'done', 'seconds': 0.4}}.
+            Numeric values are returned as floats.
+    """
+    key = PROGRESS_KEY.format(video_id=video_id)
+    stages = {}
+    for name, value in django_rq.get_connection('default').hgetall(key).items():
+        stage, _, field = name.decode().rpartition(':')
+        value = value.decode()
+        try:
+            value = float(value)
+        except ValueError:
+            pass
+        stages.setdefault(stage, {})[field] = value
+    return stages
@@ -1,5 +1,37 @@
+import os
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Video
+from .models import UploadSession, Video, VideoRendition
+from .thumbnails import build_srcset
+
+
+class VideoRenditionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a single encoded stream of a video.
+    Meta:
+        model (Model): The database model representing video renditions.
+        fields (list): List of fields from the VideoRendition model that are included in the serialization.
+    """
+    class Meta:
+        model = VideoRendition
+        fields = [
+            'codec',
+            'resolution',
+            'width',
+            'height',
+            'bitrate',
+            'peak_bitrate',
+            'codecs',
+            'frame_rate',
+            'segment_count',
+            'size_bytes',
+            'playlist',
+            'status'
+        ]
+
 
 class VideoViewSerializer(serializers.ModelSerializer):
     """
@@ -8,31 +40,140 @@ class VideoViewSerializer(serializers.ModelSerializer):
     Attributes:
         id (int): Unique identifier of the video.
         created_at (datetime): Timestamp when the video was created.
+        updated_at (datetime): Timestamp of the last change of the video or one of its renditions.
         title (str): Title of the video.
         description (str): Description or summary of the video content.
         thumbnails (list): List of URLs pointing to thumbnail images of varying resolutions.
-        video_360p_m3u8 (str): URL to the 360p quality HLS stream of the video.
-        video_720p_m3u8 (str): URL to the 720p quality HLS stream of the video.
-        video_1080p_m3u8 (str): URL to the 1080p quality HLS stream of the video.
+        thumbnail_srcset (dict): One srcset string per image format with the resized thumbnail variants, or None without a thumbnail.
+        renditions (list): The encoded streams of the video, one entry per codec and resolution.
         video_master_m3u8 (str): URL to the master playlist HLS stream, which includes all available qualities.
+        signed_master_m3u8 (str): URL of the per-viewer master playlist with signed rendition URLs, which requires
+            authentication. With `MEDIA_REQUIRE_SIGNED_URLS` enabled, this is the only way to play a video.
+        video_dash_mpd (str): URL to the MPEG-DASH manifest of the same renditions, if they were packaged as fMP4.
+            The manifest references the segments without signatures, so it is omitted while
+            `MEDIA_REQUIRE_SIGNED_URLS` is enabled.
+        trickplay_vtt (str): URL to the WebVTT thumbnail track with the seek preview sprite sheets.
         video_file (FileField): Direct link to the video file, typically for download purposes.
         genre (str): Genre of the video, helping in categorization.
+        duration (float): Duration of the source video in seconds.
+        width (int): Width of the source video in pixels.
+        height (int): Height of the source video in pixels.
+        frame_rate (float): Frame rate of the source video.
+        video_codec (str): Codec of the source video stream.
+        audio_codec (str): Codec of the source audio stream.
+        bitrate (int): Overall bitrate of the source video in bits per second.
     Meta:
         model (Model): The database model representing Videos.
         fields (list): List of fields from the Video model that are included in the serialization.
     """
+    renditions = VideoRenditionSerializer(many=True, read_only=True)
+    thumbnail_srcset = serializers.SerializerMethodField()
+    signed_master_m3u8 = serializers.SerializerMethodField()
+
     class Meta:
         model = Video
         fields = [
             'id',
             'created_at',
+            'updated_at',
             'title',
             'description',
             'thumbnails',
-            'video_360p_m3u8',
-            'video_720p_m3u8',
-            'video_1080p_m3u8',
+            'thumbnail_srcset',
+            'renditions',
             'video_master_m3u8',
+            'signed_master_m3u8',
+            'video_dash_mpd',
+            'trickplay_vtt',
             'video_file',
-            'genre'
-        ]
\ No newline at end of file
+            'genre',
+            'duration',
+            'width',
+            'height',
+            'frame_rate',
+            'video_codec',
+            'audio_codec',
+            'bitrate'
+        ]
+
+    def to_representation(self, video):
+        data = super().to_representation(video)
+        if getattr(settings, 'MEDIA_REQUIRE_SIGNED_URLS', False):
+            data['video_dash_mpd'] = None
+        return data
+
+    def get_signed_master_m3u8(self, video):
+        """
+        Build the URL of the signed master playlist endpoint, absolute if a request is available, or None before
+        the master playlist exists.
+        """
+        if not video.video_master_m3u8:
+            return None
+        request = self.context.get('request')
+        url = reverse('video-master-playlist', kwargs={'pk': video.pk})
+        return request.build_absolute_uri(url) if request else url
+
+    def get_thumbnail_srcset(self, video):
+        """
+        Build the srcset map of the video's thumbnail variants, with absolute URLs if a request is available.
+        """
+        if not video.thumbnails:
+            return None
+        request = self.context.get('request')
+
+        def url_for(width, image_format):
+            url = reverse('video-thumbnail', kwargs={'pk': video.pk, 'width': width, 'image_format': image_format})
+            return request.build_absolute_uri(url) if request else url
+
+        return build_srcset(video, url_for)
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """
+    Serializer for resumable upload sessions.
+    The client announces the file name, the total size and the video's metadata when it creates the session,
+    and reads back the `offset` at which to continue the upload.
+    Meta:
+        model (Model): The database model representing upload sessions.
+        fields (list): List of fields from the UploadSession model that are included in the serialization.
+        read_only_fields (list): Fields that are managed by the server.
+    """
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'filename',
+            'size',
+            'offset',
+            'title',
+            'description',
+            'genre',
+            'created_at'
+        ]
+        read_only_fields = ['id', 'offset', 'created_at']
+
+    def validate_filename(self, value):
+        """
+        Only accept MP4 files, which is the format the conversion pipeline expects, and store a safe name.
+        The pipeline derives every output path by replacing '.mp4' in the source path, so the extension is
+        lowercased and any other dots in the name are replaced. Otherwise a '.MP4' source would be its own
+        rendition, playlist and thumbnail target. The name is then cleaned with the storage's `get_valid_name`.
+        """
+        stem, extension = os.path.splitext(os.path.basename(value))
+        if extension.lower() != '.mp4':
+            raise serializers.ValidationError('Only .mp4 files can be uploaded.')
+        try:
+            name = default_storage.get_valid_name(f"{stem.replace('.', '_')}.mp4")
+        except SuspiciousFileOperation:
+            raise serializers.ValidationError('The file name is not valid.')
+        if name == '.mp4':
+            raise serializers.ValidationError('The file name is not valid.')
+        return name
+
+    def validate_size(self, value):
+        """
+        Reject empty files.
+        """
+        if value <= 0:
+            raise serializers.ValidationError('The file size must be positive.')
+        return value
@@ -0,0 +1,109 @@
+import base64
+import binascii
+import hmac
+import os
+import re
+import time
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+
+SIGNING_SALT = 'backend.signing.media'
+URI_ATTRIBUTE_PATTERN = re.compile(r'URI="([^"]+)"')
+
+
+def encode_scope(scope):
+    """Encodes a scope for use as a single URL path segment (URL-safe base64 without padding)."""
+    return base64.urlsafe_b64encode(scope.encode()).decode().rstrip('=')
+
+
+def decode_scope(encoded_scope):
+    """Decodes a scope encoded by `encode_scope`. Raises ValueError if it is not valid."""
+    try:
+        return base64.urlsafe_b64decode(encoded_scope + '=' * (-len(encoded_scope) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(encoded_scope) from e
+
+
+def sign_scope(expires, scope):
+    """
+    Returns the signature of a scope that is valid until `expires`.
+    The HMAC is keyed with `MEDIA_SIGNING_KEY`, which defaults to SECRET_KEY, and salted, so the signatures can
+    never be replayed against other uses of the secret.
+    """
+    digest = salted_hmac(
+        SIGNING_SALT, f'{expires}:{scope}', secret=getattr(settings, 'MEDIA_SIGNING_KEY', None), algorithm='sha256'
+    ).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def in_scope(path, scope):
+    """
+    Returns True if a media path belongs to a scope.
+    A scope names one rendition, e.g. 'videos/video_360p'. Its playlist and segments only differ in a suffix
+    without '_' or '/' ('.m3u8', '0.ts', '.m4s', '.init.mp4'), so the scope of one video never covers the files of
+    another video whose name merely starts with the same characters, such as 'videos/video_360p_abc1234.mp4'.
+    """
+    if not path.startswith(scope):
+        return False
+    suffix = path[len(scope):]
+    return '/' not in suffix and '_' not in suffix
+
+
+def verify_signed_path(expires, encoded_scope, signature, path):
+    """
+    Checks a signed media URL from its parts alone, without database or cache access.
+    Args:
+        expires (int): The Unix time until which the URL is valid.
+        encoded_scope (str): The scope as encoded by `encode_scope`.
+        signature (str): The signature from the URL.
+        path (str): The requested path relative to MEDIA_ROOT.
+    Returns:
+        bool: True if the URL has not expired, the signature is valid and the path is in the signed scope.
+    """
+    if expires < time.time():
+        return False
+    try:
+        scope = decode_scope(encoded_scope)
+    except ValueError:
+        return False
+    return hmac.compare_digest(sign_scope(expires, scope), signature) and in_scope(path, scope)
+
+
+def signed_media_url(path, expires):
+    """
+    Returns a signed URL for a rendition playlist that is valid until `expires`.
+    The URL has the form '<MEDIA_URL>s/<expires>/<scope>/<signature>/<path>', where the scope is the playlist path
+    without its extension. Segment URIs in the playlist are relative, so players resolve them below the same
+    signed prefix, and the one signature covers the playlist and all its segments.
+    """
+    scope = os.path.splitext(path)[0]
+    return f'{settings.MEDIA_URL}s/{expires}/{encode_scope(scope)}/{sign_scope(expires, scope)}/{path}'
+
+
+def sign_master_playlist(content, playlist_path, ttl=None):
+    """
+    Rewrites the URIs of a master playlist to signed media URLs.
+    Args:
+        content (str): The master playlist as written by `create_master_playlist`.
+        playlist_path (str): The path of the master playlist relative to MEDIA_ROOT, used to resolve its URIs.
+        ttl (int, optional): The validity of the URLs in seconds. Defaults to `MEDIA_SIGNED_URL_TTL`.
+    Returns:
+        str: The playlist with every rendition URI, including URI attributes of tags, replaced by a signed URL.
+    """
+    if ttl is None:
+        ttl = getattr(settings, 'MEDIA_SIGNED_URL_TTL', 4 * 60 * 60)
+    expires = int(time.time()) + ttl
+    directory = os.path.dirname(playlist_path)
+
+    def sign(uri):
+        return signed_media_url(os.path.normpath(os.path.join(directory, uri)), expires)
+
+    lines = []
+    for line in content.splitlines():
+        if line.startswith('#'):
+            line = URI_ATTRIBUTE_PATTERN.sub(lambda match: f'URI="{sign(match.group(1))}"', line)
+        elif line.strip():
+            line = sign(line.strip())
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
@@ -1,34 +1,131 @@
-import subprocess
 import os
+import re
+import glob
+import json
+import math
+import django_rq
+from rq.job import Dependency
 from PIL import Image
 from django.conf import settings
 from django.core.files import File
-from .models import Video
+from django.db import transaction
+from django.utils import timezone
+from .cache import invalidate_video
+from .dash import build_mpd
+from .models import ProcessingStatus, RenditionKind, Video, VideoRendition
+from .process import run_process
+from .progress import progress_recorder, stage_timer
 
 
-def run_command(cmd):
+KEYFRAME_INTERVAL = 2
+JOB_TIMEOUT_MARGIN = 300
+DEFAULT_FFMPEG_TIMEOUT = 6 * 60 * 60
+HLS_SEGMENT_DURATION = 10
+FFMPEG_PROGRESS_KEYS = {
+    'frame', 'fps', 'bitrate', 'total_size', 'out_time_us', 'out_time_ms', 'out_time', 'dup_frames',
+    'drop_frames', 'speed', 'progress',
+}
+
+HLS_ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+VIDEO_CODEC = 'h264'
+# H.264 sources that every player decodes, and which may therefore be stream-copied into a rung
+COPY_PROFILES = {'Constrained Baseline', 'Baseline', 'Main', 'High'}
+COPY_PIXEL_FORMATS = {'yuv420p'}
+VBV_BUFFER_SECONDS = 2
+
+AUDIO_CODEC = 'aac'
+AUDIO_RENDITION = 'audio'
+AUDIO_BITRATE = 128000
+AUDIO_GROUP_ID = 'audio'
+
+# profile_idc and constraint flags of the H.264 profiles reported by ffprobe, for 'avc1.PPCCLL' codec strings
+H264_PROFILES = {
+    'Constrained Baseline': (0x42, 0xE0),
+    'Baseline': (0x42, 0x00),
+    'Main': (0x4D, 0x40),
+    'Extended': (0x58, 0x00),
+    'High': (0x64, 0x00),
+    'High 10': (0x6E, 0x00),
+    'High 4:2:2': (0x7A, 0x00),
+    'High 4:4:4 Predictive': (0xF4, 0x00),
+}
+# MPEG-4 audio object types of the AAC profiles reported by ffprobe, for 'mp4a.40.N' codec strings
+AAC_OBJECT_TYPES = {'Main': 1, 'LC': 2, 'HE-AAC': 5, 'HE-AACv2': 29}
+
+TRICKPLAY_INTERVAL = 10
+TRICKPLAY_WIDTH = 160
+TRICKPLAY_COLUMNS = 5
+TRICKPLAY_ROWS = 5
+
+VIDEO_LADDER = [
+    {'resolution': '360p', 'width': 640, 'height': 360, 'bandwidth': 800000},
+    {'resolution': '720p', 'width': 1280, 'height': 720, 'bandwidth': 2800000},
+    {'resolution': '1080p', 'width': 1920, 'height': 1080, 'bandwidth': 5000000},
+]
+
+
+def run_command(args, on_progress=None, timeout=None):
     """
-    Executes a shell command and prints its output.
-    This function executes the specified command in the system shell. If the command executes successfully, it prints the standard output and standard error (if any) to the console.
-    If the command execution fails, it catches the exception and prints the error message from standard error.
+    Runs a program with `run_process`, prints its output and returns the result.
+    The program is run without a shell under the wall-clock limit `FFMPEG_TIMEOUT` and the CPU limit
+    `FFMPEG_CPU_LIMIT`. Only the last lines of its output are kept, so long ffmpeg runs cannot fill the worker's
+    memory with log output. If the program fails, the reason and the tail of its standard error are printed.
+    If `on_progress` is given, the command has to be an ffmpeg command. It is run with ffmpeg's machine-readable
+    progress output (`-progress pipe:1`), and `on_progress` is called with a dict of every progress report while
+    ffmpeg is still running.
     Parameters:
-    cmd (str): The shell command to execute.
+    args (list): The program and its arguments, e.g. ['ffmpeg', '-i', 'input.mp4', 'output.png'].
+    on_progress (callable, optional): Receives ffmpeg's progress reports, e.g. {'out_time_us': '5000000', 'speed': '2.1x'}.
+    timeout (float, optional): The wall-clock limit in seconds. Defaults to the `FFMPEG_TIMEOUT` setting.
     Returns:
-    None
-    Raises:
-    subprocess.CalledProcessError: If the command execution fails, this exception is caught and handled by printing the error message from standard error.
+    ProcessResult: The result of the run; `result.ok` tells whether the program succeeded.
     Examples:
-    >>> run_command('echo "Hello, World!"')
-    Hello, World!
-    >>> run_command('cat nonexistentfile.txt')
-    Error: cat: nonexistentfile.txt: No such file or directory
+    >>> run_command(['echo', 'Hello, World!']).stdout
+    'Hello, World!\\n'
+    >>> run_command(['cat', 'nonexistentfile.txt']).ok
+    Error: Exit-Code 1: cat: nonexistentfile.txt: No such file or directory
+    False
     """
-    try:
-        result = subprocess.run(cmd, capture_output=True, shell=True, check=True)
-        print(result.stdout.decode())
-        print(result.stderr.decode())
-    except subprocess.CalledProcessError as e:
-        print(f"Error: {e.stderr.decode()}")
+    args = list(args)
+    on_line = None
+    if on_progress is not None:
+        if args[0] == 'ffmpeg':
+            args[1:1] = ['-progress', 'pipe:1', '-nostats']
+        on_line = ffmpeg_progress_parser(on_progress)
+    result = run_process(
+        args,
+        timeout=timeout if timeout is not None else getattr(settings, 'FFMPEG_TIMEOUT', None),
+        cpu_limit=getattr(settings, 'FFMPEG_CPU_LIMIT', None),
+        on_stdout_line=on_line,
+    )
+    if not result.ok:
+        print(f"Error: {result.describe()}")
+    elif on_progress is None and result.stdout:
+        print(result.stdout)
+    return result
+
+def ffmpeg_progress_parser(on_progress):
+    """
+    Returns a line callback for `run_process` that collects ffmpeg's progress reports.
+    ffmpeg writes its progress as blocks of 'key=value' lines to standard output, each block ending with a
+    'progress=continue' or 'progress=end' line.
+    Parameters:
+    on_progress (callable): Called with a dict of every complete progress block.
+    Returns:
+    callable: Takes one line of ffmpeg's standard output.
+    """
+    report = {}
+
+    def on_line(line):
+        nonlocal report
+        key, separator, value = line.strip().partition('=')
+        if separator and key in FFMPEG_PROGRESS_KEYS:
+            report[key] = value.strip()
+            if key == 'progress':
+                on_progress(report)
+                report = {}
+    return on_line
 
 def generate_thumbnail(video_file, thumbnail_file, compression_level=6):
     """
@@ -53,8 +150,7 @@ def generate_thumbnail(video_file, thumbnail_file, compression_level=6):
         >>> print(thumbnail_path)
         'example_thumbnail.png'
     """
-    cmd = f'ffmpeg -i "{video_file}" -ss 00:00:01.000 -vframes 1 "{thumbnail_file}"'
-    run_command(cmd)
+    run_command(['ffmpeg', '-i', video_file, '-ss', '00:00:01.000', '-vframes', '1', thumbnail_file])
     if os.path.exists(thumbnail_file):
         with Image.open(thumbnail_file) as img:
             img.save(thumbnail_file, 'PNG', compress_level=compression_level, optimize=True)
@@ -62,14 +158,29 @@ def generate_thumbnail(video_file, thumbnail_file, compression_level=6):
     else:
         return None
 
+def update_video(video_id, **fields):
+    """
+    Writes fields of a video with a queryset update and invalidates its cached catalog responses.
+    Only the given fields are written, so concurrent jobs updating other fields of the same video are not
+    overwritten. `updated_at` is set as well, since `auto_now` only applies to `Model.save`. Without fields, only
+    `updated_at` is set, e.g. after a change to one of the video's renditions.
+    Args:
+        video_id (int): The ID of the video.
+        **fields: The field values to write.
+    """
+    Video.objects.filter(id=video_id).update(updated_at=timezone.now(), **fields)
+    invalidate_video(video_id)
+
+
 def save_thumbnail_to_model(video_id, thumbnail_file):
     """
     Saves a thumbnail image file to the associated video model.
     This function retrieves a video instance from the database using the provided video_id.
     It then opens the specified thumbnail file in binary read mode and saves the file to the
     thumbnails field of the video instance. It uses the basename of the thumbnail file as the
-    name under which the file is saved in the database. The function prints a confirmation
-    message indicating that the thumbnail has been successfully saved.
+    name under which the file is saved in the database. The dimensions of the image are stored with it,
+    so `build_srcset` never has to open the image. Only the thumbnail fields are written
+    to the database, so conversion jobs updating the same video at the same time are not overwritten.
     :param video_id: The ID of the video to which the thumbnail will be attached.
     :type video_id: int
     :param thumbnail_file: The path to the thumbnail image file.
@@ -77,99 +188,690 @@ def save_thumbnail_to_model(video_id, thumbnail_file):
     """
     video = Video.objects.get(id=video_id)
     with open(thumbnail_file, 'rb') as f:
-        video.thumbnails.save(os.path.basename(thumbnail_file), File(f), save=True)
-    
+        video.thumbnails.save(os.path.basename(thumbnail_file), File(f), save=False)
+    update_video(
+        video_id, thumbnails=video.thumbnails.name, thumbnail_width=video.thumbnails.width,
+        thumbnail_height=video.thumbnails.height, thumbnail_status=ProcessingStatus.READY,
+    )
 
 
-def convert_360p(source, video_id):
+def create_thumbnail(source, video_id):
     """
-    Converts a given video file to 360p resolution using ffmpeg.
-    This function takes a source video file and a video ID, converts the video to 360p resolution,
-    and then optionally transcodes it into HLS format if the conversion is successful.
+    Pipeline stage that creates the thumbnail of a video in an RQ worker.
+    Extracting the frame with ffmpeg and compressing it with Pillow are CPU-bound, so they run as a queued
+    job instead of inside the upload request. The stage's progress is recorded in `Video.thumbnail_status`.
     Parameters:
-    source (str): The file path of the source video to be converted.
-    video_id (str): A unique identifier for the video, used in subsequent processing.
-    The conversion process involves the following steps:
-    1. Generating a new filename for the 360p video by appending '_360p.mp4' to the original filename.
-    2. Constructing and running an ffmpeg command to convert the video resolution to 640x360, encode video using libx264,
-       set the CRF (constant rate factor) to 23, and encode audio using AAC.
-    3. Checking if the converted file exists. If it does, the function calls `convert_hls` to transcode it to HLS format.
-       If the file does not exist, it logs an error message indicating the failure of file creation.
-    Notes:
-    The function assumes ffmpeg is installed and available in the system path.
-    Errors in the ffmpeg conversion process are handled by checking the existence of the output file but are not explicitly
-    caught in the command execution.
-    Raises:
-    FileNotFoundError: If the ffmpeg command fails to create the output file, indicated by the absence of the expected output file.
-    """
-    print(f"Converting {source} to 360p")
-    target = source.replace('.mp4', '_360p.mp4')
-    cmd = f'ffmpeg -i "{source}" -s 640x360 -c:v libx264 -crf 23 -c:a aac -strict -2 "{target}"'
-    run_command(cmd)
-    if os.path.exists(target):
-        convert_hls(target, '360p', video_id)
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    """
+    update_video(video_id, thumbnail_status=ProcessingStatus.PROCESSING)
+    thumbnail_file = source.replace('.mp4', '_thumbnail.png')
+    with stage_timer(video_id, 'thumbnail') as timer:
+        generated_thumbnail = generate_thumbnail(source, thumbnail_file)
+        if not generated_thumbnail:
+            timer.fail()
+    if generated_thumbnail:
+        save_thumbnail_to_model(video_id, generated_thumbnail)
     else:
-        print(f"Fehler: 360p Datei {target} wurde nicht erstellt.")
+        print(f"Fehler: Thumbnail {thumbnail_file} wurde nicht erstellt.")
+        update_video(video_id, thumbnail_status=ProcessingStatus.FAILED)
+
 
-def convert_720p(source, video_id):
+
+def format_vtt_timestamp(seconds):
+    """
+    Formats a number of seconds as a WebVTT timestamp ('HH:MM:SS.mmm').
     """
-    Converts a given video file to 720p resolution using ffmpeg.
-    This function takes a source video file and a video ID, converts the video to 720p resolution,
-    and then optionally transcodes it into HLS format if the conversion is successful.
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}'
+
+
+def build_trickplay_vtt(duration, sprite_names, tile_width, tile_height, interval=TRICKPLAY_INTERVAL,
+                        columns=TRICKPLAY_COLUMNS, rows=TRICKPLAY_ROWS):
+    """
+    Builds a WebVTT thumbnail track that maps time ranges to tiles of the trickplay sprite sheets.
+    Every cue covers `interval` seconds and points to its tile with a media fragment ('#xywh=x,y,w,h'),
+    which players use to show seek previews.
+    Parameters:
+    duration (float): The duration of the video in seconds.
+    sprite_names (list): The file names of the sprite sheets in order, relative to the WebVTT file.
+    tile_width (int): The width of a tile in pixels.
+    tile_height (int): The height of a tile in pixels.
+    interval (int, optional): The number of seconds covered by one tile. Defaults to `TRICKPLAY_INTERVAL`.
+    columns (int, optional): The number of tiles per row of a sheet. Defaults to `TRICKPLAY_COLUMNS`.
+    rows (int, optional): The number of rows of a sheet. Defaults to `TRICKPLAY_ROWS`.
+    Returns:
+    str: The content of the WebVTT file.
+    """
+    tiles_per_sheet = columns * rows
+    count = min(math.ceil(duration / interval), len(sprite_names) * tiles_per_sheet)
+    lines = ['WEBVTT', '']
+    for index in range(count):
+        sheet, position = divmod(index, tiles_per_sheet)
+        x = (position % columns) * tile_width
+        y = (position // columns) * tile_height
+        start = index * interval
+        end = min(start + interval, duration)
+        lines.append(f'{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}')
+        lines.append(f'{sprite_names[sheet]}#xywh={x},{y},{tile_width},{tile_height}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def create_trickplay(source, video_id):
+    """
+    Pipeline stage that creates seek preview sprite sheets and their WebVTT index.
+    A single ffmpeg pass samples one frame every `TRICKPLAY_INTERVAL` seconds, scales it to `TRICKPLAY_WIDTH`
+    pixels and tiles the frames into sheets of `TRICKPLAY_COLUMNS` x `TRICKPLAY_ROWS`. The sheets are written
+    as JPEG, or in the format of the `VIDEO_TRICKPLAY_FORMAT` setting (e.g. 'webp'). The WebVTT file is saved to
+    the `trickplay_vtt` field of the video. Duration and resolution are read from the probed metadata.
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    """
+    video = Video.objects.get(id=video_id)
+    if not (video.duration and video.width and video.height):
+        print(f"Fehler: Für {source} fehlen die Metadaten für die Vorschaubilder.")
+        return
+    image_format = getattr(settings, 'VIDEO_TRICKPLAY_FORMAT', 'jpg')
+    tile_width = TRICKPLAY_WIDTH
+    tile_height = round(tile_width * video.height / video.width / 2) * 2
+    pattern = source.replace('.mp4', f'_sprite%03d.{image_format}')
+    video_filter = (
+        f'fps=1/{TRICKPLAY_INTERVAL},scale={tile_width}:{tile_height},tile={TRICKPLAY_COLUMNS}x{TRICKPLAY_ROWS}'
+    )
+    args = ['ffmpeg', '-i', source, '-an', '-vf', video_filter, '-q:v', '5', pattern]
+    with stage_timer(video_id, 'trickplay') as timer:
+        if not run_command(args, on_progress=progress_recorder(video_id, 'trickplay')).ok:
+            timer.fail()
+    sprites = sorted(glob.glob(source.replace('.mp4', f'_sprite[0-9][0-9][0-9].{image_format}')))
+    if not sprites:
+        print(f"Fehler: Vorschaubilder für {source} wurden nicht erstellt.")
+        return
+    vtt_file = source.replace('.mp4', '_trickplay.vtt')
+    with open(vtt_file, 'w') as f:
+        f.write(build_trickplay_vtt(
+            video.duration, [os.path.basename(sprite) for sprite in sprites], tile_width, tile_height
+        ))
+    relative_path = os.path.relpath(vtt_file, settings.MEDIA_ROOT)
+    update_video(video_id, trickplay_vtt=relative_path)
+
+
+def hls_options(hls_target):
+    """
+    Returns the ffmpeg output options that write a complete VOD playlist with `HLS_SEGMENT_DURATION` second segments.
+    The `VIDEO_HLS_SEGMENT_TYPE` setting selects the container of the segments. With 'mpegts' (the default) every
+    segment is its own .ts file. With 'fmp4', the rendition is written as fragmented MP4 (CMAF) into a single
+    file, and the playlist addresses the segments with `EXT-X-BYTERANGE`. The init segment gets a name derived
+    from the playlist, so renditions sharing a directory never overwrite each other's init segment.
+    Parameters:
+    hls_target (str): The file path of the .m3u8 playlist that ffmpeg writes.
+    Returns:
+    list: The output options, to be placed right before the playlist path.
+    """
+    options = ['-start_number', '0', '-hls_time', str(HLS_SEGMENT_DURATION), '-hls_list_size', '0']
+    if getattr(settings, 'VIDEO_HLS_SEGMENT_TYPE', 'mpegts') == 'fmp4':
+        init_name = os.path.basename(hls_target).replace('.m3u8', '.init.mp4')
+        options += [
+            '-hls_segment_type', 'fmp4', '-hls_flags', 'single_file', '-hls_fmp4_init_filename', init_name,
+        ]
+    return options + ['-f', 'hls']
+
+
+def build_encode_command(source, ladder, direct_hls=False, separate_audio=False):
+    """
+    Builds a single ffmpeg command that decodes the source once and encodes every rung of the ladder.
+    The decoded video stream is split with the `split` filter and scaled once per rendition, so all
+    renditions share one decode of the source. Keyframes are forced every `KEYFRAME_INTERVAL` seconds
+    and scene-cut detection is disabled, which keeps the GOPs of all renditions aligned and lets players
+    switch between them on segment boundaries. The quality-based encode is capped with a VBV buffer at the rung's
+    'bandwidth' (over `VBV_BUFFER_SECONDS`), so complex scenes cannot push the peak far above the ladder.
+    Parameters:
+    source (str): The file path of the source video.
+    ladder (list): The renditions to produce, each a dict with 'resolution', 'width', 'height' and 'bandwidth'.
+    direct_hls (bool, optional): If True, every rendition is written straight into HLS segments and an
+        .m3u8 playlist instead of an intermediate MP4 file. Defaults to False.
+    separate_audio (bool, optional): If True, the renditions are video-only, since the audio is encoded once
+        by `encode_audio`. Otherwise the audio is encoded into every rendition. Defaults to False.
+    Returns:
+    tuple: The ffmpeg arguments (list) and a list of (resolution, target) tuples for the produced files.
+    """
+    labels = [f'[v{index}]' for index in range(len(ladder))]
+    filters = [f"[0:v]split={len(ladder)}{''.join(labels)}"]
+    outputs = []
+    targets = []
+    for index, rung in enumerate(ladder):
+        filters.append(f"{labels[index]}scale=-2:{rung['height']}[out{index}]")
+        outputs += [
+            '-map', f'[out{index}]', '-c:v', 'libx264', '-crf', '23',
+            '-maxrate', str(rung['bandwidth']), '-bufsize', str(rung['bandwidth'] * VBV_BUFFER_SECONDS),
+            '-force_key_frames', f'expr:gte(t,n_forced*{KEYFRAME_INTERVAL})', '-sc_threshold', '0',
+        ]
+        outputs += ['-an'] if separate_audio else ['-map', '0:a?', '-c:a', 'aac', '-strict', '-2']
+        if direct_hls:
+            target = source.replace('.mp4', f"_{rung['resolution']}.m3u8")
+            outputs += hls_options(target)
+        else:
+            target = source.replace('.mp4', f"_{rung['resolution']}.mp4")
+        outputs.append(target)
+        targets.append((rung['resolution'], target))
+    args = ['ffmpeg', '-i', source, '-filter_complex', ';'.join(filters)] + outputs
+    return args, targets
+
+
+def encode_renditions(source, video_id, ladder=VIDEO_LADDER, separate_audio=False):
+    """
+    Encodes a video into every rendition of the ladder with a single ffmpeg process.
+    This replaces one job per resolution, each of which decoded the whole source again. The source is
+    decoded once and fanned out to all renditions.
+    With the `VIDEO_DIRECT_HLS` setting enabled (the default), ffmpeg writes the HLS segments and playlists
+    directly and each playlist is saved to the model. Otherwise every rendition is first written as an MP4
+    file, which is then transcoded into HLS format by `convert_hls`.
     Parameters:
     source (str): The file path of the source video to be converted.
-    video_id (str): A unique identifier for the video, used in subsequent processing.
-    The conversion process involves the following steps:
-    1. Generating a new filename for the 720p video by appending '_720p.mp4' to the original filename.
-    2. Constructing and running an ffmpeg command to convert the video resolution to 640x360, encode video using libx264,
-       set the CRF (constant rate factor) to 23, and encode audio using AAC.
-    3. Checking if the converted file exists. If it does, the function calls `convert_hls` to transcode it to HLS format.
-       If the file does not exist, it logs an error message indicating the failure of file creation.
+    video_id (int): The database ID of the video, used in subsequent processing.
+    ladder (list, optional): The renditions to produce. Defaults to `VIDEO_LADDER`.
+    separate_audio (bool, optional): If True, the renditions are video-only. See `encode_audio`.
     Notes:
     The function assumes ffmpeg is installed and available in the system path.
-    Errors in the ffmpeg conversion process are handled by checking the existence of the output file but are not explicitly
-    caught in the command execution.
-    Raises:
-    FileNotFoundError: If the ffmpeg command fails to create the output file, indicated by the absence of the expected output file.
-    """
-    print(f"Converting {source} to 720p")
-    target = source.replace('.mp4', '_720p.mp4')
-    cmd = f'ffmpeg -i "{source}" -s hd720 -c:v libx264 -crf 23 -c:a aac -strict -2 "{target}"'
-    run_command(cmd)
-    if os.path.exists(target):
-        convert_hls(target, '720p', video_id)
+    If ffmpeg fails or times out, a partial output is never published: every rendition is marked as failed.
+    Renditions whose output file was not created are reported on the console and skipped.
+    """
+    direct_hls = getattr(settings, 'VIDEO_DIRECT_HLS', True)
+    print(f"Converting {source} to {', '.join(rung['resolution'] for rung in ladder)}")
+    args, targets = build_encode_command(source, ladder, direct_hls=direct_hls, separate_audio=separate_audio)
+    stage = 'encode_' + '_'.join(rung['resolution'] for rung in ladder)
+    with stage_timer(video_id, stage) as timer:
+        result = run_command(args, on_progress=progress_recorder(video_id, stage))
+        if not result.ok:
+            timer.fail()
+    for resolution, target in targets:
+        if not result.ok or not os.path.exists(target):
+            print(f"Fehler: {resolution} Datei {target} wurde nicht erstellt.")
+            mark_rendition_failed(video_id, resolution)
+        elif direct_hls:
+            save_to_model(video_id, target, resolution)
+        else:
+            convert_hls(target, resolution, video_id)
+
+
+def parse_probe(output):
+    """
+    Extracts the metadata stored on the `Video` model from ffprobe's JSON output.
+    Parameters:
+    output (str): The output of `ffprobe -print_format json -show_format -show_streams`, pretty-printed or compact.
+    Returns:
+    dict: The keys 'duration', 'width', 'height', 'frame_rate', 'video_codec', 'video_profile', 'pixel_format',
+        'audio_codec' and 'bitrate'. Values that ffprobe did not report are `None`.
+    """
+    data = json.loads(output)
+    streams = data.get('streams', [])
+    video_stream = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio_stream = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    format_info = data.get('format', {})
+    frame_rate = None
+    numerator, _, denominator = video_stream.get('avg_frame_rate', '').partition('/')
+    if numerator and denominator and float(denominator):
+        frame_rate = round(float(numerator) / float(denominator), 3)
+    duration = format_info.get('duration')
+    bitrate = format_info.get('bit_rate')
+    return {
+        'duration': float(duration) if duration else None,
+        'width': video_stream.get('width'),
+        'height': video_stream.get('height'),
+        'frame_rate': frame_rate,
+        'video_codec': video_stream.get('codec_name'),
+        'video_profile': video_stream.get('profile'),
+        'pixel_format': video_stream.get('pix_fmt'),
+        'audio_codec': audio_stream.get('codec_name'),
+        'bitrate': int(bitrate) if bitrate else None,
+    }
+
+
+def probe_video(source, video_id):
+    """
+    Reads duration, resolution, frame rate, codecs and bitrate of a video with ffprobe and stores them on the model.
+    Parameters:
+    source (str): The file path of the video.
+    video_id (int): The database ID of the video.
+    Returns:
+    dict or None: The metadata as returned by `parse_probe`, or `None` if the video could not be probed.
+    """
+    args = ['ffprobe', '-v', 'error', '-print_format', 'json=compact=1', '-show_format', '-show_streams', source]
+    with stage_timer(video_id, 'probe') as timer:
+        result = run_command(args)
+        if not result.ok:
+            timer.fail()
+    try:
+        metadata = parse_probe(result.stdout if result.ok else None)
+    except (TypeError, ValueError):
+        print(f"Fehler: {source} konnte nicht analysiert werden.")
+        return None
+    update_video(video_id, **metadata)
+    return metadata
+
+
+def select_ladder(height, width=None, ladder=VIDEO_LADDER):
+    """
+    Chooses the renditions to produce for a source of the given size.
+    Rungs above the source's short side are skipped, since upscaling costs CPU and storage without improving the
+    picture. The encoder scales to the rung's height and keeps the aspect ratio (see `build_encode_command`), so
+    a rung never gets wider than its height allows: portrait and 4:3 sources keep all rungs up to their short
+    side. The lowest rung is always kept, so even very small sources remain playable. If the height of the source
+    is unknown, the full ladder is returned; without a width, the height is compared alone.
+    Parameters:
+    height (int or None): The height of the source video in pixels.
+    width (int or None, optional): The width of the source video in pixels. Defaults to None.
+    ladder (list, optional): The full ladder. Defaults to `VIDEO_LADDER`.
+    Returns:
+    list: The rungs of the ladder to produce.
+    """
+    if not height:
+        return list(ladder)
+    short_side = min(height, width) if width else height
+    selected = [rung for rung in ladder if rung['height'] <= short_side]
+    return selected or list(ladder[:1])
+
+
+def find_copy_rung(metadata, ladder, separate_audio=False):
+    """
+    Finds the rung of the ladder that the source already matches, so it can be produced by stream copy.
+    A source matches a rung if its video is H.264 at exactly the rung's resolution and its audio, if any, is AAC.
+    With a separate audio rendition, the rung is video-only and the audio codec does not matter.
+    A copied rung skips the encoder and its VBV cap, so the source must also be decodable by every player and
+    within the rung's budget: 8-bit 4:2:0 (`COPY_PIXEL_FORMATS`) in one of `COPY_PROFILES`, with a known bitrate
+    of at most the rung's bandwidth. High 10, 4:2:2 and 4:4:4 or high-bitrate sources are encoded instead.
+    Parameters:
+    metadata (dict): The source metadata as returned by `parse_probe`.
+    ladder (list): The rungs of the ladder to produce.
+    separate_audio (bool, optional): Whether the audio is encoded into its own rendition. Defaults to False.
+    Returns:
+    dict or None: The matching rung, or `None` if the source has to be re-encoded for every rung.
+    """
+    if metadata.get('video_codec') != 'h264':
+        return None
+    if metadata.get('video_profile') not in COPY_PROFILES or metadata.get('pixel_format') not in COPY_PIXEL_FORMATS:
+        return None
+    if not separate_audio and metadata.get('audio_codec') not in ('aac', None):
+        return None
+    for rung in ladder:
+        if metadata.get('width') == rung['width'] and metadata.get('height') == rung['height']:
+            bitrate = metadata.get('bitrate')
+            return rung if bitrate and bitrate <= rung['bandwidth'] else None
+    return None
+
+
+def build_copy_command(source, rung, separate_audio=False):
+    """
+    Builds the ffmpeg command that packages the streams of a source into an HLS rendition without re-encoding.
+    Parameters:
+    source (str): The file path of the source video.
+    rung (dict): The rung of the ladder that the source matches.
+    separate_audio (bool, optional): If True, only the video stream is copied. Defaults to False.
+    Returns:
+    tuple: The ffmpeg arguments (list) and the file path of the .m3u8 playlist.
+    """
+    hls_target = source.replace('.mp4', f"_{rung['resolution']}.m3u8")
+    streams = ['-map', '0:v:0'] if separate_audio else ['-map', '0:v:0', '-map', '0:a?']
+    args = ['ffmpeg', '-i', source] + streams + ['-c', 'copy'] + hls_options(hls_target) + [hls_target]
+    return args, hls_target
+
+
+def copy_rendition(source, video_id, rung, separate_audio=False):
+    """
+    Produces a rendition by stream copy and HLS segmentation only, without re-encoding.
+    This turns an encode of several minutes into a remux of a few seconds and avoids a generation of
+    quality loss. Since the source's own keyframes are used, segment boundaries of this rendition follow
+    the source's GOP structure instead of `KEYFRAME_INTERVAL`.
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    rung (dict): The rung of the ladder that the source matches.
+    separate_audio (bool, optional): If True, only the video stream is copied. Defaults to False.
+    """
+    resolution = rung['resolution']
+    print(f"Copying {source} to {resolution}")
+    args, hls_target = build_copy_command(source, rung, separate_audio=separate_audio)
+    with stage_timer(video_id, f'copy_{resolution}') as timer:
+        result = run_command(args, on_progress=progress_recorder(video_id, f'copy_{resolution}'))
+        if not result.ok:
+            timer.fail()
+    if result.ok and os.path.exists(hls_target):
+        save_to_model(video_id, hls_target, resolution)
     else:
-        print(f"Fehler: 720p Datei {target} wurde nicht erstellt.")
+        print(f"Fehler: HLS-Datei {hls_target} wurde nicht erstellt.")
+        mark_rendition_failed(video_id, resolution)
 
-def convert_1080p(source, video_id):
+
+def build_audio_command(source, copy=False):
     """
-    Converts a given video file to 1080p resolution using ffmpeg.
-    This function takes a source video file and a video ID, converts the video to 1080p resolution,
-    and then optionally transcodes it into HLS format if the conversion is successful.
+    Builds the ffmpeg command that packages the first audio stream of a source into the audio rendition.
     Parameters:
-    source (str): The file path of the source video to be converted.
-    video_id (str): A unique identifier for the video, used in subsequent processing.
-    The conversion process involves the following steps:
-    1. Generating a new filename for the 1080p video by appending '_1080p.mp4' to the original filename.
-    2. Constructing and running an ffmpeg command to convert the video resolution to 640x360, encode video using libx264,
-       set the CRF (constant rate factor) to 23, and encode audio using AAC.
-    3. Checking if the converted file exists. If it does, the function calls `convert_hls` to transcode it to HLS format.
-       If the file does not exist, it logs an error message indicating the failure of file creation.
-    Notes:
-    The function assumes ffmpeg is installed and available in the system path.
-    Errors in the ffmpeg conversion process are handled by checking the existence of the output file but are not explicitly
-    caught in the command execution.
-    Raises:
-    FileNotFoundError: If the ffmpeg command fails to create the output file, indicated by the absence of the expected output file.
-    """
-    print(f"Converting {source} to 1080p")
-    target = source.replace('.mp4', '_1080p.mp4')
-    cmd = f'ffmpeg -i "{source}" -s hd1080 -c:v libx264 -crf 23 -c:a aac -strict -2 "{target}"'
-    run_command(cmd)
-    if os.path.exists(target):
-        convert_hls(target, '1080p', video_id)
+    source (str): The file path of the source video.
+    copy (bool, optional): If True, the audio stream is copied instead of encoded. Defaults to False.
+    Returns:
+    tuple: The ffmpeg arguments (list) and the file path of the .m3u8 playlist.
+    """
+    hls_target = source.replace('.mp4', f'_{AUDIO_RENDITION}.m3u8')
+    codec = ['-c:a', 'copy'] if copy else ['-c:a', 'aac', '-b:a', str(AUDIO_BITRATE), '-ac', '2']
+    args = ['ffmpeg', '-i', source, '-map', '0:a:0', '-vn'] + codec + hls_options(hls_target) + [hls_target]
+    return args, hls_target
+
+
+def encode_audio(source, video_id, copy=False):
+    """
+    Produces the audio rendition that all video renditions of a video share.
+    The first audio stream is packaged into its own HLS rendition, which the master playlist references as an
+    `EXT-X-MEDIA` audio group. The audio is therefore encoded and stored once per video instead of once per rung,
+    and players keep their audio buffer when they switch between video renditions. AAC sources are copied, other
+    sources are encoded to stereo AAC at `AUDIO_BITRATE`.
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    copy (bool, optional): If True, the audio stream is copied instead of encoded. Defaults to False.
+    """
+    print(f"Converting {source} to {AUDIO_RENDITION}")
+    args, hls_target = build_audio_command(source, copy=copy)
+    stage = f'encode_{AUDIO_RENDITION}'
+    with stage_timer(video_id, stage) as timer:
+        result = run_command(args, on_progress=progress_recorder(video_id, stage))
+        if not result.ok:
+            timer.fail()
+    if result.ok and os.path.exists(hls_target):
+        save_to_model(video_id, hls_target, AUDIO_RENDITION, codec=AUDIO_CODEC, kind=RenditionKind.AUDIO)
     else:
-        print(f"Fehler: 1080p Datei {target} wurde nicht erstellt.")
+        print(f"Fehler: HLS-Datei {hls_target} wurde nicht erstellt.")
+        mark_rendition_failed(video_id, AUDIO_RENDITION, codec=AUDIO_CODEC, kind=RenditionKind.AUDIO)
+
+
+def priority_groups(ladder):
+    """
+    Splits the ladder into groups of rungs and the queue each group is encoded on.
+    With the `VIDEO_PRIORITIZE_FIRST_RUNG` setting enabled (the default), the lowest rung goes to the 'high' queue
+    on its own, so a new video becomes playable as soon as its cheapest rendition is done, and the remaining rungs
+    follow in one job on the 'low' queue. This costs one additional decode of the source per video. Otherwise all
+    rungs are encoded together on the 'default' queue.
+    Parameters:
+    ladder (list): The rungs to produce.
+    Returns:
+    list: (queue name, rungs) tuples, skipping empty groups.
+    """
+    if not getattr(settings, 'VIDEO_PRIORITIZE_FIRST_RUNG', True):
+        return [('default', list(ladder))] if ladder else []
+    groups = [('high', list(ladder[:1])), ('low', list(ladder[1:]))]
+    return [(queue_name, rungs) for queue_name, rungs in groups if rungs]
+
+
+def job_timeout(duration=None, outputs=1):
+    """
+    Returns the RQ `job_timeout` of a pipeline job that runs ffmpeg over `duration` seconds of video.
+    Without it, every job would run under the queue's `DEFAULT_TIMEOUT` of a few minutes, which long encodes
+    exceed. The budget is `VIDEO_JOB_TIMEOUT_FACTOR` seconds per second of video and output, at least
+    `VIDEO_JOB_MIN_TIMEOUT` and at most `FFMPEG_TIMEOUT`. `JOB_TIMEOUT_MARGIN` seconds are added for probing and
+    database writes, so a hanging ffmpeg process is stopped by its own `FFMPEG_TIMEOUT` before RQ kills the job.
+    If the duration is unknown, the budget is `FFMPEG_TIMEOUT`.
+    Parameters:
+    duration (float, optional): The length of the video or chunk in seconds.
+    outputs (int, optional): The number of renditions the job encodes. Defaults to 1.
+    Returns:
+    int: The timeout in seconds.
+    """
+    ffmpeg_timeout = getattr(settings, 'FFMPEG_TIMEOUT', None) or DEFAULT_FFMPEG_TIMEOUT
+    if not duration:
+        return int(ffmpeg_timeout) + JOB_TIMEOUT_MARGIN
+    budget = duration * getattr(settings, 'VIDEO_JOB_TIMEOUT_FACTOR', 3) * max(outputs, 1)
+    budget = min(max(budget, getattr(settings, 'VIDEO_JOB_MIN_TIMEOUT', 600)), ffmpeg_timeout)
+    return math.ceil(budget) + JOB_TIMEOUT_MARGIN
+
+
+def enqueue_job(queue_name, func, *args, media_duration=None, outputs=1, video_id=None, resolutions=(), files=(),
+                depends_on=None, **kwargs):
+    """
+    Enqueues a pipeline job with a `job_timeout` from `job_timeout` and `on_job_failure` as failure callback.
+    What the callback cleans up is stored in the job's meta data.
+    Parameters:
+    queue_name (str): The RQ queue, e.g. 'high'.
+    func (callable): The job function; `args` and `kwargs` are passed to it.
+    media_duration (float, optional): The length of the video the job processes, see `job_timeout`.
+    outputs (int, optional): The number of renditions the job encodes, see `job_timeout`.
+    video_id (int, optional): The video whose renditions the job produces.
+    resolutions (list or None, optional): The renditions to mark as failed if the job fails. `None` stands for
+        all renditions of the video that are still pending.
+    files (list, optional): Files to remove if the job fails, e.g. its partial outputs.
+    depends_on (optional): The jobs, or a `Dependency`, that must finish first.
+    Returns:
+    Job: The enqueued job.
+    """
+    meta = {
+        'video_id': video_id,
+        'resolutions': None if resolutions is None else list(resolutions),
+        'files': list(files),
+    }
+    return django_rq.get_queue(queue_name, autocommit=True).enqueue(
+        func, *args, job_timeout=job_timeout(media_duration, outputs), depends_on=depends_on, meta=meta,
+        on_failure=on_job_failure, **kwargs
+    )
+
+
+def fail_pending_renditions(video_id, resolutions=None):
+    """
+    Marks the renditions of a video that are still pending or processing as failed and republishes the master
+    playlist, so the video is published with the renditions that did succeed instead of waiting forever.
+    Parameters:
+    video_id (int): The ID of the video.
+    resolutions (list or None, optional): The renditions to consider. Defaults to all renditions of the video.
+    """
+    renditions = VideoRendition.objects.filter(
+        video_id=video_id, status__in=[VideoRendition.Status.PENDING, VideoRendition.Status.PROCESSING]
+    )
+    if resolutions is not None:
+        renditions = renditions.filter(resolution__in=resolutions)
+    if renditions.update(status=VideoRendition.Status.FAILED):
+        update_video(video_id)
+        publish_master_playlist(video_id)
+
+
+def on_job_failure(job, connection, type, value, traceback):
+    """
+    RQ failure callback of the pipeline jobs, see `enqueue_job`. RQ calls it when a job raises and when it kills a
+    job after its `job_timeout`. The partial outputs in the job's meta data are removed and its renditions are
+    marked as failed with `fail_pending_renditions`.
+    """
+    meta = job.meta or {}
+    print(f"Fehler: Job {job.func_name} ist fehlgeschlagen: {value}")
+    remove_files(meta.get('files', []))
+    if meta.get('video_id') is not None and meta.get('resolutions') != []:
+        fail_pending_renditions(meta['video_id'], meta.get('resolutions'))
+
+
+def process_video(source, video_id):
+    """
+    Entry point of the conversion pipeline for a newly uploaded video.
+    The source is probed first, then the seek previews are enqueued with `create_trickplay` and the ladder is
+    chosen from the source resolution with `select_ladder`. A pending
+    `VideoRendition` is registered for every chosen rung. If the
+    source already matches a rung (see `find_copy_rung`), that rung is produced by stream copy in its own job.
+    The remaining rungs of videos that are at least `VIDEO_CHUNKED_MIN_DURATION` seconds long are transcoded
+    in chunks that are spread across the RQ workers, so the wall-clock time of long titles scales with the
+    number of workers. Shorter videos are encoded in one job per group of `priority_groups`, so the lowest rung
+    of every new video is encoded first.
+    With the `VIDEO_SEPARATE_AUDIO` setting enabled (the default) and a source with audio, the audio is produced
+    once by `encode_audio` on the 'high' queue and all video rungs are encoded without it.
+    This job only probes and enqueues; every ffmpeg run over the whole source happens in a job of its own, with a
+    `job_timeout` derived from the duration (see `enqueue_job`).
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    """
+    min_duration = getattr(settings, 'VIDEO_CHUNKED_MIN_DURATION', 600)
+    metadata = probe_video(source, video_id) or {}
+    duration = metadata.get('duration')
+    if metadata:
+        enqueue_job('low', create_trickplay, source, video_id, media_duration=duration)
+    ladder = select_ladder(metadata.get('height'), metadata.get('width'))
+    separate_audio = bool(getattr(settings, 'VIDEO_SEPARATE_AUDIO', True) and metadata.get('audio_codec'))
+    register_renditions(video_id, ladder, audio=separate_audio)
+    if separate_audio:
+        enqueue_job(
+            'high', encode_audio, source, video_id, copy=metadata['audio_codec'] == AUDIO_CODEC,
+            media_duration=duration, video_id=video_id, resolutions=[AUDIO_RENDITION],
+        )
+    copy_rung = find_copy_rung(metadata, ladder, separate_audio=separate_audio)
+    if copy_rung:
+        enqueue_job(
+            'high', copy_rendition, source, video_id, copy_rung, separate_audio=separate_audio,
+            media_duration=duration, video_id=video_id, resolutions=[copy_rung['resolution']],
+        )
+        ladder = [rung for rung in ladder if rung is not copy_rung]
+    if not ladder:
+        return
+    resolutions = [rung['resolution'] for rung in ladder]
+    if duration is not None and duration >= min_duration:
+        enqueue_job(
+            'default', transcode_in_chunks, source, video_id, ladder, separate_audio=separate_audio,
+            duration=duration, media_duration=duration, video_id=video_id, resolutions=resolutions,
+        )
+        return
+    for queue_name, rungs in priority_groups(ladder):
+        enqueue_job(
+            queue_name, encode_renditions, source, video_id, rungs, separate_audio=separate_audio,
+            media_duration=duration, outputs=len(rungs), video_id=video_id,
+            resolutions=[rung['resolution'] for rung in rungs],
+        )
+
+
+def split_source(source, chunk_duration):
+    """
+    Cuts a video into chunks of roughly `chunk_duration` seconds without re-encoding.
+    The segment muxer only cuts on keyframes, so every chunk starts with a keyframe and can be encoded
+    independently. Timestamps are reset so that each chunk starts at zero.
+    Parameters:
+    source (str): The file path of the source video.
+    chunk_duration (int): The target length of a chunk in seconds.
+    Returns:
+    list: The file paths of the created chunks in playback order.
+    """
+    pattern = source.replace('.mp4', '_chunk%03d.mp4')
+    run_command([
+        'ffmpeg', '-i', source, '-map', '0', '-c', 'copy', '-f', 'segment', '-segment_time', str(chunk_duration),
+        '-reset_timestamps', '1', pattern,
+    ])
+    return sorted(glob.glob(source.replace('.mp4', '_chunk[0-9][0-9][0-9].mp4')))
+
+
+def transcode_in_chunks(source, video_id, ladder=VIDEO_LADDER, separate_audio=False, duration=None):
+    """
+    Pipeline stage that splits a video into chunks and enqueues one encode job per chunk plus a job that stitches
+    the results. It runs as a job of its own, since splitting a long title takes a while.
+    This happens once per group of `priority_groups`, on the group's queue. Each stitch job depends on the chunk
+    jobs of its group, so RQ only runs it once the last chunk has been encoded or has failed; the stitch job
+    marks the renditions with missing parts as failed. The chunks are removed by a final job that depends on all
+    stitch jobs, whether they succeeded or not.
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    ladder (list, optional): The renditions to produce. Defaults to `VIDEO_LADDER`.
+    separate_audio (bool, optional): If True, the chunks are encoded without audio. Defaults to False.
+    duration (float, optional): The length of the video in seconds, for the `job_timeout` of the stitch jobs.
+    """
+    chunk_duration = getattr(settings, 'VIDEO_CHUNK_DURATION', 120)
+    chunks = split_source(source, chunk_duration)
+    if not chunks:
+        print(f"Fehler: {source} konnte nicht in Teile zerlegt werden.")
+        for rung in ladder:
+            mark_rendition_failed(video_id, rung['resolution'])
+        return
+    print(f"Converting {source} in {len(chunks)} chunks")
+    stitch_jobs = []
+    for queue_name, rungs in priority_groups(ladder):
+        resolutions = [rung['resolution'] for rung in rungs]
+        jobs = [
+            enqueue_job(
+                queue_name, encode_chunk, chunk, video_id, rungs, separate_audio=separate_audio,
+                media_duration=chunk_duration, outputs=len(rungs),
+                files=[chunk.replace('.mp4', f'_{resolution}.mp4') for resolution in resolutions],
+            )
+            for chunk in chunks
+        ]
+        stitch_jobs.append(enqueue_job(
+            queue_name, stitch_chunks, source, video_id, chunks, rungs, media_duration=duration,
+            outputs=len(rungs), video_id=video_id, resolutions=resolutions,
+            depends_on=Dependency(jobs=jobs, allow_failure=True),
+        ))
+    enqueue_job('low', remove_files, chunks, depends_on=Dependency(jobs=stitch_jobs, allow_failure=True))
+
+
+def encode_chunk(chunk, video_id, ladder=VIDEO_LADDER, separate_audio=False):
+    """
+    Encodes one chunk of a video into an MP4 file per rendition of the ladder.
+    If ffmpeg fails, partial outputs are removed, so `stitch_chunks` reports the renditions as failed.
+    Parameters:
+    chunk (str): The file path of the chunk.
+    video_id (int): The database ID of the video, used to report the progress of the chunk.
+    ladder (list, optional): The renditions to produce. Defaults to `VIDEO_LADDER`.
+    separate_audio (bool, optional): If True, the chunk is encoded without audio. Defaults to False.
+    """
+    args, targets = build_encode_command(chunk, ladder, separate_audio=separate_audio)
+    stage = '_'.join(
+        ['encode', os.path.splitext(chunk)[0].rsplit('_', 1)[-1]] + [rung['resolution'] for rung in ladder]
+    )
+    with stage_timer(video_id, stage) as timer:
+        result = run_command(args, on_progress=progress_recorder(video_id, stage))
+        if not result.ok:
+            timer.fail()
+    if not result.ok:
+        remove_files([target for _, target in targets])
+
+
+def stitch_chunks(source, video_id, chunks, ladder=VIDEO_LADDER):
+    """
+    Merges the encoded chunks of every rendition into one continuous HLS rendition.
+    For each rung, the encoded chunks are concatenated with ffmpeg's concat demuxer and segmented into
+    HLS without re-encoding. The encoded parts are deleted afterwards, the chunks themselves by `remove_files`.
+    Parameters:
+    source (str): The file path of the source video.
+    video_id (int): The database ID of the video.
+    chunks (list): The file paths of the chunks in playback order.
+    ladder (list, optional): The renditions that were produced. Defaults to `VIDEO_LADDER`.
+    """
+    for rung in ladder:
+        resolution = rung['resolution']
+        parts = [chunk.replace('.mp4', f'_{resolution}.mp4') for chunk in chunks]
+        if not all(os.path.exists(part) for part in parts):
+            print(f"Fehler: {resolution} Teile von {source} fehlen.")
+            mark_rendition_failed(video_id, resolution)
+            continue
+        concat_list = source.replace('.mp4', f'_{resolution}_chunks.txt')
+        with open(concat_list, 'w') as f:
+            for part in parts:
+                f.write(f"file '{part}'\n")
+        hls_target = source.replace('.mp4', f'_{resolution}.m3u8')
+        args = ['ffmpeg', '-f', 'concat', '-safe', '0', '-i', concat_list, '-c', 'copy'] + hls_options(hls_target) + [hls_target]
+        with stage_timer(video_id, f'package_{resolution}') as timer:
+            result = run_command(args)
+            if not result.ok:
+                timer.fail()
+        if result.ok and os.path.exists(hls_target):
+            save_to_model(video_id, hls_target, resolution)
+        else:
+            print(f"Fehler: HLS-Datei {hls_target} wurde nicht erstellt.")
+            mark_rendition_failed(video_id, resolution)
+        remove_files(parts + [concat_list])
+
+
+def remove_files(paths):
+    """
+    Deletes the given files, skipping those that do not exist.
+    Parameters:
+    paths (list): The file paths to delete.
+    """
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
 
 def convert_hls(target, resolution, video_id):
     """
@@ -189,83 +891,401 @@ def convert_hls(target, resolution, video_id):
     """
     print(f"Converting {target} to HLS")
     hls_target = target.replace('.mp4', '.m3u8')
-    cmd_hls = f'ffmpeg -i "{target}" -codec: copy -start_number 0 -hls_time 10 -hls_list_size 0 -f hls "{hls_target}"'
-    run_command(cmd_hls)
-    if os.path.exists(hls_target):
+    with stage_timer(video_id, f'package_{resolution}') as timer:
+        result = run_command(['ffmpeg', '-i', target, '-codec:', 'copy'] + hls_options(hls_target) + [hls_target])
+        if not result.ok:
+            timer.fail()
+    if result.ok and os.path.exists(hls_target):
         save_to_model(video_id, hls_target, resolution)
     else:
         print(f"Fehler: HLS-Datei {hls_target} wurde nicht erstellt.")
+        mark_rendition_failed(video_id, resolution)
+
+def get_rung(resolution):
+    """
+    Returns the rung of `VIDEO_LADDER` with the given resolution name, or `None` if there is none.
+    """
+    return next((rung for rung in VIDEO_LADDER if rung['resolution'] == resolution), None)
+
+
+def register_renditions(video_id, ladder, audio=False):
+    """
+    Creates a pending `VideoRendition` for every rung of the ladder that the pipeline is about to produce.
+    A pending audio rendition holds back the master playlist until the audio is ready, see `publish_master_playlist`.
+    Parameters:
+    video_id (int): The ID of the video.
+    ladder (list): The rungs of the ladder that will be produced.
+    audio (bool, optional): If True, the shared audio rendition is registered as well. Defaults to False.
+    """
+    renditions = [
+        VideoRendition(
+            video_id=video_id, codec=VIDEO_CODEC, resolution=rung['resolution'],
+            width=rung['width'], height=rung['height'],
+        )
+        for rung in ladder
+    ]
+    if audio:
+        renditions.append(VideoRendition(
+            video_id=video_id, kind=RenditionKind.AUDIO, codec=AUDIO_CODEC, resolution=AUDIO_RENDITION,
+        ))
+    VideoRendition.objects.bulk_create(renditions, ignore_conflicts=True)
 
-def save_to_model(video_id, hls_target, resolution):
+
+def parse_attributes(attribute_list):
+    """
+    Parses the attribute list of an HLS tag, e.g. 'URI="video_360p.init.mp4",BYTERANGE="812@0"'.
+    Returns:
+    dict: The attribute values by name, with the quotes of quoted strings removed.
+    """
+    return {name: value.strip('"') for name, value in HLS_ATTRIBUTE_PATTERN.findall(attribute_list)}
+
+
+def parse_media_playlist(hls_target):
+    """
+    Reads the segments of an HLS media playlist.
+    Both playlists with one file per segment and single-file playlists with `EXT-X-BYTERANGE` are supported. A byte
+    range without an offset starts where the previous range of the same file ended, as defined by RFC 8216.
+    Parameters:
+    hls_target (str): The absolute file path of the .m3u8 playlist.
+    Returns:
+    dict: 'init' (the init segment of an fMP4 playlist, or `None`) and 'segments' (in playback order). Every segment
+        is a dict with 'path', 'duration', 'offset' and 'length'; 'offset' and 'length' are `None` if the segment is
+        a whole file.
+    """
+    directory = os.path.dirname(hls_target)
+    playlist = {'init': None, 'segments': []}
+    next_offsets = {}
+    duration = 0.0
+    byte_range = None
+
+    def resolve(uri, byte_range):
+        path = os.path.join(directory, uri)
+        if not byte_range:
+            return {'path': path, 'offset': None, 'length': None}
+        length, _, offset = byte_range.partition('@')
+        offset = int(offset) if offset else next_offsets.get(path, 0)
+        next_offsets[path] = offset + int(length)
+        return {'path': path, 'offset': offset, 'length': int(length)}
+
+    with open(hls_target) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('#EXTINF:'):
+                duration = float(line[len('#EXTINF:'):].split(',')[0])
+            elif line.startswith('#EXT-X-BYTERANGE:'):
+                byte_range = line[len('#EXT-X-BYTERANGE:'):]
+            elif line.startswith('#EXT-X-MAP:'):
+                attributes = parse_attributes(line[len('#EXT-X-MAP:'):])
+                playlist['init'] = resolve(attributes['URI'], attributes.get('BYTERANGE'))
+            elif line and not line.startswith('#'):
+                segment = resolve(line, byte_range)
+                segment['duration'] = duration
+                playlist['segments'].append(segment)
+                duration = 0.0
+                byte_range = None
+    return playlist
+
+
+def segment_size(segment):
+    """
+    Returns the size of a segment in bytes: the length of its byte range, or the size of its file (0 if it is missing).
+    """
+    if segment['length'] is not None:
+        return segment['length']
+    return os.path.getsize(segment['path']) if os.path.exists(segment['path']) else 0
+
+
+def playlist_stats(hls_target):
+    """
+    Measures an HLS playlist and the segments it references.
+    Parameters:
+    hls_target (str): The absolute file path of the .m3u8 playlist.
+    Returns:
+    dict: 'segment_count', 'size_bytes' (total size of all segments including the init segment), 'bitrate'
+        (average bits per second of the media segments) and 'peak_bitrate' (bits per second of the largest segment
+        relative to its duration, which is what HLS's BANDWIDTH attribute describes). The bitrates are `None` if the
+        playlist has no duration.
+    """
+    playlist = parse_media_playlist(hls_target)
+    segments = playlist['segments']
+    sizes = [segment_size(segment) for segment in segments]
+    media_bytes = sum(sizes)
+    duration = sum(segment['duration'] for segment in segments)
+    init_bytes = segment_size(playlist['init']) if playlist['init'] else 0
+    segment_bitrates = [
+        size * 8 / segment['duration'] for size, segment in zip(sizes, segments) if segment['duration']
+    ]
+    return {
+        'segment_count': len(segments),
+        'size_bytes': media_bytes + init_bytes,
+        'bitrate': round(media_bytes * 8 / duration) if duration else None,
+        'peak_bitrate': round(max(segment_bitrates)) if segment_bitrates else None,
+    }
+
+
+def codec_string(stream):
+    """
+    Returns the RFC 6381 codec string of an ffprobe stream, e.g. 'avc1.64001F' or 'mp4a.40.2'.
+    Returns:
+    str or None: The codec string, or `None` if the codec, profile or level is not known.
+    """
+    if stream.get('codec_name') == 'h264':
+        profile = H264_PROFILES.get(stream.get('profile'))
+        level = stream.get('level')
+        if profile is None or not isinstance(level, int) or level <= 0:
+            return None
+        return f'avc1.{profile[0]:02X}{profile[1]:02X}{level:02X}'
+    if stream.get('codec_name') == 'aac':
+        object_type = AAC_OBJECT_TYPES.get(stream.get('profile'))
+        return f'mp4a.40.{object_type}' if object_type else None
+    return None
+
+
+def probe_rendition(hls_target):
+    """
+    Reads the codec strings and the frame rate of an encoded rendition with ffprobe.
+    Parameters:
+    hls_target (str): The absolute file path of the .m3u8 playlist.
+    Returns:
+    dict: 'codecs' (the comma-separated codec strings for HLS's CODECS attribute, or `None` if any stream's
+        codec string is unknown, since a wrong CODECS attribute makes players skip the rendition) and 'frame_rate'.
+        For video renditions also the encoded 'width' and 'height', which differ from the rung's 16:9 size for
+        sources with another aspect ratio. Empty if the rendition could not be probed.
+    """
+    args = ['ffprobe', '-v', 'error', '-print_format', 'json=compact=1', '-show_format', '-show_streams', hls_target]
+    result = run_command(args)
+    if not result.ok:
+        return {}
+    try:
+        metadata = parse_probe(result.stdout)
+        streams = json.loads(result.stdout).get('streams', [])
+    except ValueError:
+        print(f"Fehler: {hls_target} konnte nicht analysiert werden.")
+        return {}
+    codecs = [codec_string(stream) for stream in streams if stream.get('codec_type') in ('video', 'audio')]
+    rendition = {
+        'codecs': ','.join(codecs) if codecs and all(codecs) else None,
+        'frame_rate': metadata['frame_rate'],
+    }
+    if metadata['width'] and metadata['height']:
+        rendition.update(width=metadata['width'], height=metadata['height'])
+    return rendition
+
+
+def save_to_model(video_id, hls_target, resolution, codec=VIDEO_CODEC, kind=RenditionKind.VIDEO):
     """
-    Saves the HLS file path relative to the MEDIA_ROOT setting into the corresponding resolution field in the Video model.
+    Saves the HLS playlist of a finished rendition as a `VideoRendition` and republishes the master playlist.
     Args:
         video_id (int): The ID of the video object to update.
         hls_target (str): The absolute file path of the HLS file to be saved.
-        resolution (str): The resolution of the video file ('360p', '720p', '1080p').
-    The function first retrieves the video from the database using its `video_id`. It then computes the relative path
-    of the `hls_target` using the MEDIA_ROOT setting. Based on the `resolution` provided, it updates the respective
-    field of the video object (`video_360p_m3u8`, `video_720p_m3u8`, `video_1080p_m3u8`).
-    If all three resolution fields are set, it creates a master playlist for the video. Finally, the updated video
-    object is saved back to the database.
+        resolution (str): The resolution of the video file ('360p', '720p', '1080p'), or `AUDIO_RENDITION`.
+        codec (str, optional): The codec of the rendition. Defaults to `VIDEO_CODEC`.
+        kind (str, optional): The kind of the rendition, one of `RenditionKind`. Defaults to video.
+    The playlist path is stored relative to the MEDIA_ROOT setting together with the segment count, total size,
+    measured average and peak bitrate, codec strings and frame rate of the rendition. Each rendition is written to
+    its own row with `update_or_create`, so jobs that finish at the same time cannot overwrite each other's results. See `publish_master_playlist` for the master playlist.
+    The video's `updated_at` is set and its cached catalog responses are invalidated with `update_video`.
     """
-    video = Video.objects.get(id=video_id)
+    rung = get_rung(resolution) or {}
     relative_path = os.path.relpath(hls_target, settings.MEDIA_ROOT)
-    if resolution == '360p':
-        video.video_360p_m3u8 = relative_path
-    elif resolution == '720p':
-        video.video_720p_m3u8 = relative_path
-    elif resolution == '1080p':
-        video.video_1080p_m3u8 = relative_path
+    defaults = {
+        'kind': kind,
+        'width': rung.get('width'),
+        'height': rung.get('height'),
+        'playlist': relative_path,
+        'status': VideoRendition.Status.READY,
+    }
+    defaults.update(playlist_stats(hls_target))
+    defaults.update(probe_rendition(hls_target))
+    with transaction.atomic():
+        VideoRendition.objects.update_or_create(
+            video_id=video_id, codec=codec, resolution=resolution, defaults=defaults
+        )
+    update_video(video_id)
+    publish_master_playlist(video_id)
+
+
+def mark_rendition_failed(video_id, resolution, codec=VIDEO_CODEC, kind=RenditionKind.VIDEO):
+    """
+    Marks a rendition as failed, so the master playlist is published with the renditions that did succeed.
+    Args:
+        video_id (int): The ID of the video.
+        resolution (str): The resolution of the failed rendition.
+        codec (str, optional): The codec of the rendition. Defaults to `VIDEO_CODEC`.
+        kind (str, optional): The kind of the rendition, one of `RenditionKind`. Defaults to video.
+    """
+    VideoRendition.objects.update_or_create(
+        video_id=video_id, codec=codec, resolution=resolution,
+        defaults={'kind': kind, 'status': VideoRendition.Status.FAILED},
+    )
+    update_video(video_id)
+    publish_master_playlist(video_id)
+
+
+def publish_master_playlist(video_id):
+    """
+    Rewrites the master playlist with every rendition of the video that is ready so far.
+    With fMP4 renditions (`VIDEO_HLS_SEGMENT_TYPE = 'fmp4'`), a DASH manifest of the same renditions is
+    written as well. This runs after each rendition lands, so a video is playable as soon as its first rung is
+    done, and higher rungs are added to the master playlist as they finish. The video row is locked with `select_for_update`
+    while the playlist is written, so renditions finishing at the same time rewrite it one after the other and
+    the last write always contains all of them.
+    While the shared audio rendition is still pending, nothing is published, since the video renditions are
+    video-only and would play silently. If the audio failed, the video renditions are published without it.
+    Args:
+        video_id (int): The ID of the video.
+    """
+    with transaction.atomic():
+        video = Video.objects.select_for_update().get(id=video_id)
+        audio_pending = video.renditions.filter(
+            kind=RenditionKind.AUDIO,
+            status__in=[VideoRendition.Status.PENDING, VideoRendition.Status.PROCESSING],
+        ).exists()
+        video_ready = video.renditions.filter(kind=RenditionKind.VIDEO, status=VideoRendition.Status.READY).exists()
+        if video_ready and not audio_pending:
+            with stage_timer(video_id, 'publish'):
+                create_master_playlist(video)
+                if getattr(settings, 'VIDEO_HLS_SEGMENT_TYPE', 'mpegts') == 'fmp4':
+                    create_dash_manifest(video)
 
-    if video.video_360p_m3u8 and video.video_720p_m3u8 and video.video_1080p_m3u8:
-        create_master_playlist(video)
+def stream_inf_attributes(rendition, audio=None):
+    """
+    Builds the attribute list of a rendition's EXT-X-STREAM-INF tag.
+    BANDWIDTH is the measured peak segment bitrate and AVERAGE-BANDWIDTH the measured average. Renditions measured
+    before peaks were recorded fall back to the ladder's bandwidth. CODECS and FRAME-RATE are only written if
+    they are known. With a shared audio rendition, its bitrate and codec are added, since players download both,
+    and the stream refers to the audio group.
+    Parameters:
+    rendition (VideoRendition): A ready video rendition.
+    audio (VideoRendition, optional): The ready audio rendition of the video.
+    Returns:
+    str: The attributes, e.g. 'BANDWIDTH=912000,AVERAGE-BANDWIDTH=701000,CODECS="avc1.64001E,mp4a.40.2",...'.
+    """
+    rung = get_rung(rendition.resolution) or {}
+    bandwidth = rendition.peak_bitrate or rung.get('bandwidth') or rendition.bitrate
+    average_bandwidth = rendition.bitrate if rendition.peak_bitrate else None
+    codecs = rendition.codecs
+    if audio is not None:
+        bandwidth += audio.peak_bitrate or audio.bitrate or AUDIO_BITRATE
+        if average_bandwidth:
+            average_bandwidth += audio.bitrate or AUDIO_BITRATE
+        codecs = f'{codecs},{audio.codecs}' if codecs and audio.codecs else None
+    attributes = [f'BANDWIDTH={bandwidth}']
+    if average_bandwidth:
+        attributes.append(f'AVERAGE-BANDWIDTH={average_bandwidth}')
+    if codecs:
+        attributes.append(f'CODECS="{codecs}"')
+    attributes.append(f'RESOLUTION={rendition.width}x{rendition.height}')
+    if rendition.frame_rate:
+        attributes.append(f'FRAME-RATE={rendition.frame_rate:.3f}')
+    if audio is not None:
+        attributes.append(f'AUDIO="{AUDIO_GROUP_ID}"')
+    return ','.join(attributes)
 
-    video.save()
 
 def create_master_playlist(video):
     """
     Generates a master playlist for a given video object with multiple streaming qualities.
-    This function takes a video object that has paths to its various quality versions and 
-    creates a master playlist file ('.m3u8') for use in streaming applications. The function
-    replaces the '.mp4' extension in the source video file path with '_master.m3u8' to
-    denote the master playlist. It writes the playlist directives and the relative paths to
-    different quality streams (360p, 720p, 1080p) if they exist.
+    This function takes a video object and creates a master playlist file ('.m3u8') for use in
+    streaming applications from its ready renditions. The function replaces the '.mp4' extension
+    in the source video file path with '_master.m3u8' to denote the master playlist. It writes
+    the playlist directives and the relative paths of every rendition that was actually produced.
+    A ready audio rendition is written as an `EXT-X-MEDIA` audio group that every video rendition refers to.
     Parameters:
-    - video (object): An object containing attributes of the video and its different quality versions.
+    - video (Video): The video whose master playlist is written.
       Expected attributes include:
       - video_file.path (str): Path to the source video file.
-      - video_360p_m3u8 (str, optional): Path to the 360p version playlist.
-      - video_720p_m3u8 (str, optional): Path to the 720p version playlist.
-      - video_1080p_m3u8 (str, optional): Path to the 1080p version playlist.
-      - video_master_m3u8 (str, optional): Path to the master playlist to be updated after creation.
+      - renditions: The `VideoRendition` records of the video.
     Outputs:
     - A master playlist file is created at the same location as the source video with a name ending in '_master.m3u8'.
-    - If successful, updates the video object's 'video_master_m3u8' attribute with the relative path of the master playlist.
+      It is written to a temporary file first and moved into place, so players never read a partial playlist.
+    - If successful, updates the 'video_master_m3u8' field with the relative path of the master playlist. The field
+      is written with a single UPDATE, so concurrent changes to other fields of the video are not overwritten,
+      and the cached catalog responses of the video are invalidated.
     Raises:
     - Prints an error message if the master playlist file cannot be created.
     """
     source = video.video_file.path
     master_playlist_path = source.replace('.mp4', '_master.m3u8')
+    temporary_path = f'{master_playlist_path}.tmp'
+    renditions = video.renditions.filter(status=VideoRendition.Status.READY)
+    audio = next((rendition for rendition in renditions if rendition.kind == RenditionKind.AUDIO), None)
 
-    with open(master_playlist_path, 'w') as f:
+    with open(temporary_path, 'w') as f:
         f.write('#EXTM3U\n')
+        if audio is not None:
+            f.write(
+                f'#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP_ID}",NAME="Audio",DEFAULT=YES,AUTOSELECT=YES,'
+                f'URI="../{audio.playlist}"\n'
+            )
 
-        if video.video_360p_m3u8:
-            f.write('#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n')
-            f.write(f"../{video.video_360p_m3u8}\n")
-
-        if video.video_720p_m3u8:
-            f.write('#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720\n')
-            f.write(f"../{video.video_720p_m3u8}\n")
-
-        if video.video_1080p_m3u8:
-            f.write('#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080\n')
-            f.write(f"../{video.video_1080p_m3u8}\n")
+        for rendition in renditions:
+            if rendition.kind != RenditionKind.VIDEO:
+                continue
+            f.write(f"#EXT-X-STREAM-INF:{stream_inf_attributes(rendition, audio)}\n")
+            f.write(f"../{rendition.playlist}\n")
+    os.replace(temporary_path, master_playlist_path)
 
     if os.path.exists(master_playlist_path):
         relative_path = os.path.relpath(master_playlist_path, settings.MEDIA_ROOT)
         video.video_master_m3u8 = relative_path
-        video.save()
+        update_video(video.id, video_master_m3u8=relative_path)
     else:
         print(f"Fehler: Master-Playlist {master_playlist_path} wurde nicht erstellt.")
+
+
+def create_dash_manifest(video):
+    """
+    Writes an MPEG-DASH manifest next to the master playlist that references the fMP4 files of the HLS renditions.
+    The manifest is built from the segments and byte ranges of each ready rendition's HLS playlist, so no media is
+    encoded or copied. Only renditions packaged as a single fragmented MP4 file with an init segment can be
+    described this way; if any ready rendition is not, no manifest is written.
+    Like the master playlist, the manifest is written to a temporary file and moved into place, and the
+    'video_dash_mpd' field is updated with a single UPDATE.
+    Parameters:
+    - video (Video): The video whose manifest is written.
+    Returns:
+    - str or None: The relative path of the manifest, or `None` if it could not be created.
+    """
+    manifest_path = video.video_file.path.replace('.mp4', '_manifest.mpd')
+    directory = os.path.dirname(manifest_path)
+    representations = []
+    duration = 0.0
+    for rendition in video.renditions.filter(status=VideoRendition.Status.READY):
+        playlist = parse_media_playlist(rendition.playlist.path)
+        segments = playlist['segments']
+        media_paths = {segment['path'] for segment in segments}
+        if playlist['init'] is None or len(media_paths) != 1 or any(segment['length'] is None for segment in segments):
+            print(f"Fehler: {rendition.playlist.name} ist keine fMP4-Playlist, DASH-Manifest wird nicht erstellt.")
+            return None
+        init = playlist['init']
+        is_video = rendition.kind == RenditionKind.VIDEO
+        fallback_bandwidth = (get_rung(rendition.resolution) or {}).get('bandwidth') if is_video else AUDIO_BITRATE
+        representations.append({
+            'id': rendition.resolution,
+            'content_type': rendition.kind,
+            'width': rendition.width,
+            'height': rendition.height,
+            'bandwidth': rendition.peak_bitrate or rendition.bitrate or fallback_bandwidth,
+            'codecs': rendition.codecs,
+            'frame_rate': (rendition.frame_rate or video.frame_rate) if is_video else None,
+            'media': os.path.relpath(media_paths.pop(), directory),
+            'init': {
+                'media': os.path.relpath(init['path'], directory),
+                'offset': init['offset'] or 0,
+                'length': segment_size(init),
+            },
+            'segments': segments,
+        })
+        duration = max(duration, sum(segment['duration'] for segment in segments))
+    if not representations:
+        return None
+    representations.sort(key=lambda representation: representation['bandwidth'] or 0)
+    temporary_path = f'{manifest_path}.tmp'
+    with open(temporary_path, 'w') as f:
+        f.write(build_mpd(representations, video.duration or duration))
+    os.replace(temporary_path, manifest_path)
+    relative_path = os.path.relpath(manifest_path, settings.MEDIA_ROOT)
+    video.video_dash_mpd = relative_path
+    update_video(video.id, video_dash_mpd=relative_path)
+    return relative_path
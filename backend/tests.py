@@ -1,26 +1,70 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
-from .models import Video
+from .models import ProcessingStatus, UploadSession, Video, VideoRendition
 from .serializer import VideoViewSerializer
 from unittest.mock import patch, MagicMock, mock_open
 
 import os
+import io
+import json
+import shutil
+import tempfile
+from xml.etree import ElementTree
+from PIL import Image
 import subprocess
+import time
 import unittest
+from datetime import date
 from django.core.files import File
+from django.db import DatabaseError
 from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
 from backend.models import Video
 from backend.tasks import (
-    convert_360p, convert_720p, convert_1080p, generate_thumbnail,
-    save_thumbnail_to_model, run_command, convert_hls, save_to_model, create_master_playlist
+    build_encode_command, encode_renditions, generate_thumbnail, create_thumbnail,
+    build_trickplay_vtt, create_trickplay,
+    save_thumbnail_to_model, run_command, convert_hls, save_to_model, create_master_playlist,
+    VIDEO_LADDER, playlist_stats, register_renditions, mark_rendition_failed, parse_probe, probe_video, select_ladder, find_copy_rung, copy_rendition, process_video, split_source, transcode_in_chunks, stitch_chunks,
+    remove_files, priority_groups, hls_options, parse_media_playlist, create_dash_manifest,
+    codec_string, probe_rendition, encode_audio, update_video, job_timeout, on_job_failure
 )
+from backend.progress import progress_recorder, stage_timer
+from backend.process import ProcessResult, run_process
+from backend.thumbnails import get_thumbnail_variant, evict_cache
 from backend.signals import video_post_save, auto_delete_file_on_delete
+from backend.cache import (
+    acquire_lock, cache_stats, invalidate_video, local_stats, refresh_early, release_lock, response_key,
+    version_listener
+)
+from backend.local_cache import LocalCache, VersionListener
+from backend.views import VideoList
+from backend.pagination import keyset_filter
+from backend.management.commands.benchmark_pipeline import benchmark_clip, build_clip_command, compare_baselines
+
+class TemporaryMediaRootMixin:
+    """
+    Runs every test against its own empty MEDIA_ROOT in a temporary directory, which is removed afterwards.
+    Settings that the whole test class needs next to it are given in `media_settings`.
+    """
+    media_settings = {}
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, **self.media_settings)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
 
 class VideoAPITests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.video = Video.objects.create(title="Test Video", genre="Action", description="Action video")
 
     def test_video_create(self):
@@ -49,49 +93,363 @@ class VideoAPITests(APITestCase):
         videos = Video.objects.filter(genre='Action')
         serializer = VideoViewSerializer(videos, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.json()['results'], serializer.data)
 
     def test_video_by_genre_list_not_found(self):
         response = self.client.get(reverse('video-by-genre', args=['NonExistentGenre']))
         videos = Video.objects.filter(genre='NonExistentGenre')
         serializer = VideoViewSerializer(videos, many=True)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, serializer.data)
+        self.assertEqual(response.json()['results'], serializer.data)
+
+
+class VideoPaginationTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.videos = [
+            Video.objects.create(title=f'Video {index}', genre='Action', description='', created_at=created_at)
+            for index, created_at in enumerate([
+                date(2024, 1, 1), date(2024, 1, 2), date(2024, 1, 2), date(2024, 1, 2), date(2024, 1, 3),
+            ])
+        ]
+        self.newest_first = [video.id for video in reversed(self.videos)]
+
+    def test_pages_follow_created_at_and_id(self):
+        url = reverse('video-list') + '?page_size=2'
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.json()['results']), 2)
+            ids += [video['id'] for video in response.json()['results']]
+            url = response.json()['next']
+        self.assertEqual(ids, self.newest_first)
+
+    def test_previous_link_returns_earlier_page(self):
+        first = self.client.get(reverse('video-list') + '?page_size=2')
+        self.assertIsNone(first.json()['previous'])
+        second = self.client.get(first.json()['next'])
+        self.assertEqual([video['id'] for video in second.json()['results']], self.newest_first[2:4])
+        back = self.client.get(second.json()['previous'])
+        self.assertEqual(back.json()['results'], first.json()['results'])
+        self.assertIsNotNone(back.json()['next'])
+
+    def test_new_video_does_not_shift_later_pages(self):
+        first = self.client.get(reverse('video-list') + '?page_size=2')
+        Video.objects.create(title='New', genre='Action', description='', created_at=date(2024, 1, 4))
+        second = self.client.get(first.json()['next'])
+        self.assertEqual([video['id'] for video in second.json()['results']], self.newest_first[2:4])
+
+    def test_keyset_filter(self):
+        position = Video.objects.get(id=self.newest_first[2])
+        ids = keyset_filter(Video.objects.order_by('-created_at', '-id'), position.created_at, position.id)
+        self.assertEqual(list(ids.values_list('id', flat=True)), self.newest_first[3:])
+        ids = keyset_filter(Video.objects.order_by('created_at', 'id'), position.created_at, position.id, reverse=True)
+        self.assertEqual(list(ids.values_list('id', flat=True)), self.newest_first[:2][::-1])
+
+    @override_settings(VIDEO_PAGE_SIZE=3, VIDEO_MAX_PAGE_SIZE=4)
+    def test_page_size_limits(self):
+        self.assertEqual(len(self.client.get(reverse('video-list')).json()['results']), 3)
+        response = self.client.get(reverse('video-list') + '?page_size=1000')
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_genre_list_is_paginated(self):
+        Video.objects.create(title='Drama', genre='Drama', description='')
+        response = self.client.get(reverse('video-by-genre', args=['Action']) + '?page_size=10')
+        self.assertEqual([video['id'] for video in response.json()['results']], self.newest_first)
+        self.assertIsNone(response.json()['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('video-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class CatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.video = Video.objects.create(title='Cached', genre='Action', description='')
+        self.other = Video.objects.create(title='Other', genre='Drama', description='')
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(reverse('video-list'))
+        second = self.client.get(reverse('video-list'))
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(first.content, second.content)
+        with self.assertNumQueries(0):
+            self.client.get(reverse('video-list'))
+
+    def test_unused_query_parameters_share_the_cache_entry(self):
+        self.client.get(reverse('video-list') + '?page_size=1')
+        response = self.client.get(reverse('video-list') + '?page_size=1&x=random')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertNotIn('x=random', response.json()['next'])
+        self.assertEqual(self.client.get(reverse('video-detail', args=[self.video.id]) + '?x=1')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(reverse('video-detail', args=[self.video.id]) + '?x=2')['X-Cache'], 'HIT')
+
+    def test_invalidate_video_refreshes_lists_and_detail(self):
+        self.client.get(reverse('video-list'))
+        self.client.get(reverse('video-detail', args=[self.video.id]))
+        Video.objects.filter(id=self.video.id).update(title='Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_video(self.video.id)
+        response = self.client.get(reverse('video-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn('Renamed', [video['title'] for video in response.json()['results']])
+        self.assertEqual(self.client.get(reverse('video-detail', args=[self.video.id]))['X-Cache'], 'MISS')
+
+    def test_detail_is_keyed_on_its_own_video(self):
+        self.client.get(reverse('video-detail', args=[self.video.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_video(self.other.id)
+        self.assertEqual(self.client.get(reverse('video-detail', args=[self.video.id]))['X-Cache'], 'HIT')
+
+    def test_delete_signal_invalidates(self):
+        self.client.get(reverse('video-list'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        response = self.client.get(reverse('video-list'))
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual([video['id'] for video in response.json()['results']], [self.video.id])
+
+    def test_errors_are_not_cached(self):
+        self.client.get(reverse('video-detail', args=[9999]))
+        response = self.client.get(reverse('video-detail', args=[9999]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('X-Cache', response)
+
+    def test_stats(self):
+        self.client.get(reverse('video-list'))
+        self.client.get(reverse('video-list'))
+        self.client.get(reverse('video-list'))
+        stats = cache_stats()
+        self.assertEqual(
+            {counter: stats[counter] for counter in ('hits', 'misses', 'stale', 'hit_ratio')},
+            {'hits': 2, 'misses': 1, 'stale': 0, 'hit_ratio': 0.6667},
+        )
+        self.client.force_authenticate(MagicMock(is_staff=True))
+        self.assertEqual(self.client.get(reverse('catalog-cache-stats')).data['hits'], 2)
+
+    def test_stale_response_is_served_while_locked(self):
+        url = reverse('video-list')
+        first = self.client.get(url)
+        Video.objects.filter(id=self.video.id).update(title='Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_video(self.video.id)
+        token = acquire_lock(response_key('video-list', 'http://testserver' + url))
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'STALE')
+        self.assertEqual(response.content, first.content)
+        release_lock(response_key('video-list', 'http://testserver' + url), token)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(b'Renamed', response.content)
+        self.assertEqual(cache_stats()['stale'], 1)
+
+    @override_settings(CATALOG_LOCK_WAIT=0.1)
+    def test_missing_entry_is_built_after_waiting_for_lock(self):
+        url = reverse('video-list')
+        acquire_lock(response_key('video-list', 'http://testserver' + url))
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_fill_releases_lock(self):
+        url = reverse('video-list')
+        self.client.get(url)
+        self.assertIsNotNone(acquire_lock(response_key('video-list', 'http://testserver' + url)))
+
+    @patch('backend.cache.random.random', return_value=0.5)
+    def test_refresh_early(self, mock_random):
+        self.assertFalse(refresh_early({'expires': 1000.0, 'delta': 0.1}, 900.0, 1.0))
+        self.assertTrue(refresh_early({'expires': 1000.0, 'delta': 0.1}, 999.95, 1.0))
+        self.assertFalse(refresh_early({'expires': 1000.0, 'delta': 0.1}, 999.95, 0))
+        self.assertTrue(refresh_early({'expires': 1000.0, 'delta': 0.1}, 1000.0, 0))
+
+
+class LocalCacheTests(unittest.TestCase):
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        local = LocalCache(400)
+        for key in 'abcd':
+            local.set(key, key.upper(), 100, expires=time.time() + 60)
+        local.get('a')
+        local.set('e', 'E', 100, expires=time.time() + 60)
+        self.assertIsNone(local.get('b'))
+        self.assertEqual(local.get('a'), 'A')
+        self.assertEqual(local.size, 400)
+
+    def test_expiry_and_oversized_values(self):
+        local = LocalCache(400)
+        local.set('old', 'value', 10, expires=time.time() - 1)
+        local.set('large', 'value', 101, expires=time.time() + 60)
+        self.assertIsNone(local.get('old'))
+        self.assertIsNone(local.get('large'))
+        self.assertEqual(local.size, 0)
+
+    def test_version_listener(self):
+        reset = MagicMock()
+        listener = VersionListener('channel', on_reset=reset)
+        listener.remember({'list': 5})
+        self.assertIsNone(listener.get(['list']))
+        listener.connected.set()
+        listener.remember({'list': 5})
+        listener.handle(b'video:7 3')
+        listener.remember({'list': 4})
+        self.assertEqual(listener.get(['video:7', 'list']), [3, 5])
+        self.assertIsNone(listener.get(['video:8']))
+        listener.reset()
+        self.assertIsNone(listener.get(['list']))
+        reset.assert_called_once()
+
+
+class LocalCatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.video = Video.objects.create(title='Cached', genre='Action', description='')
+        version_listener.ensure_started()
+        version_listener.connected.set()
+
+    def tearDown(self):
+        version_listener.reset()
+
+    def test_local_hit_skips_redis(self):
+        url = reverse('video-list')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        local_hits = local_stats['hits']
+        with patch('backend.cache.cache') as mock_cache:
+            response = self.client.get(url)
+        mock_cache.get.assert_not_called()
+        mock_cache.get_many.assert_not_called()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(cache_stats()['local']['hits'], local_hits + 1)
+
+    def test_published_version_invalidates_local_entry(self):
+        url = reverse('video-list')
+        self.client.get(url)
+        Video.objects.filter(id=self.video.id).update(title='Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_video(self.video.id)
+        version_listener.handle(f"list {cache.get('catalog:version:list')}")
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn(b'Renamed', response.content)
+
+
+class CatalogConditionalGetTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.video = Video.objects.create(title='Cached', genre='Action', description='')
+
+    def test_validators_are_emitted(self):
+        for url in (
+            reverse('video-list'),
+            reverse('video-detail', args=[self.video.id]),
+            reverse('video-by-genre', args=['Action']),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['ETag'].startswith('"'))
+            self.assertIn('Last-Modified', response)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+
+    def test_if_none_match_skips_serializer(self):
+        url = reverse('video-list')
+        etag = self.client.get(url)['ETag']
+        with patch.object(VideoList, 'get_serializer') as mock_get_serializer:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        mock_get_serializer.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_conditional_request_skips_the_cache_entry(self):
+        url = reverse('video-list')
+        response = self.client.get(url)
+        with patch('backend.views.fetch') as mock_fetch:
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, status.HTTP_304_NOT_MODIFIED
+            )
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+                status.HTTP_304_NOT_MODIFIED
+            )
+        mock_fetch.assert_not_called()
+
+    def test_etag_changes_after_invalidation(self):
+        url = reverse('video-detail', args=[self.video.id])
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            update_video(self.video.id, title='Renamed')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_if_modified_since(self):
+        url = reverse('video-list')
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE='Mon, 01 Jan 2024 00:00:00 GMT')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_update_video_sets_updated_at(self):
+        Video.objects.filter(id=self.video.id).update(updated_at=self.video.updated_at.replace(year=2024))
+        with self.captureOnCommitCallbacks(execute=True):
+            update_video(self.video.id, genre='Drama')
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.genre, 'Drama')
+        self.assertGreater(self.video.updated_at.year, 2024)
 
 
 class VideoSignalsTests(TestCase):
 
     @patch('backend.tasks.generate_thumbnail')
-    @patch('backend.tasks.save_thumbnail_to_model')
     @patch('django_rq.get_queue')
-    def test_video_post_save_created(self, mock_get_queue, mock_save_thumbnail_to_model, mock_generate_thumbnail):
+    def test_video_post_save_created(self, mock_get_queue, mock_generate_thumbnail):
         mock_queue = MagicMock()
         mock_get_queue.return_value = mock_queue
-        mock_generate_thumbnail.return_value = 'thumbnail.png'
 
         video = Video.objects.create(title='Test Video', video_file='testlocation/video.mp4')
+        mock_queue.reset_mock()
 
-        video_post_save(Video, video, created=True)
+        with self.captureOnCommitCallbacks() as callbacks:
+            video_post_save(Video, video, created=True)
+        mock_queue.enqueue.assert_not_called()
+        for callback in callbacks:
+            callback()
 
-        mock_generate_thumbnail.assert_called_once_with('testlocation/video.mp4', 'testlocation/video_thumbnail.png')
-        mock_save_thumbnail_to_model.assert_called_once_with(video.id, 'thumbnail.png')
-        self.assertEqual(mock_queue.enqueue.call_count, 3)
+        mock_generate_thumbnail.assert_not_called()
+        calls = {call[0][0]: call for call in mock_queue.enqueue.call_args_list}
+        self.assertEqual(calls[create_thumbnail][0][1:], (video.video_file.path, video.id))
+        self.assertEqual(calls[process_video][0][1:], (video.video_file.path, video.id))
+        self.assertEqual(calls[process_video][1]['meta']['video_id'], video.id)
+        self.assertIsNone(calls[process_video][1]['meta']['resolutions'])
+        self.assertEqual(calls[process_video][1]['job_timeout'], 6 * 60 * 60 + 300)
+        self.assertEqual(mock_queue.enqueue.call_count, 2)
 
-    @patch('backend.tasks.generate_thumbnail')
-    @patch('backend.tasks.save_thumbnail_to_model')
     @patch('django_rq.get_queue')
-    def test_video_post_save_not_created(self, mock_get_queue, mock_save_thumbnail_to_model, mock_generate_thumbnail):
+    def test_video_post_save_not_created(self, mock_get_queue):
         mock_queue = MagicMock()
         mock_get_queue.return_value = mock_queue
 
         video = Video.objects.create(title='Test Video', video_file='testlocation/video.mp4')
+        mock_queue.reset_mock()
 
         video_post_save(Video, video, created=False)
 
-        mock_generate_thumbnail.assert_not_called()
-        mock_save_thumbnail_to_model.assert_not_called()
         mock_queue.enqueue.assert_not_called()
 
+    @patch('django_rq.get_queue')
+    def test_video_post_save_without_file(self, mock_get_queue):
+        Video.objects.create(title='Test Video')
+        mock_get_queue.assert_not_called()
+
     @patch('os.path.isfile', return_value=True)
     @patch('os.remove')
     def test_auto_delete_file_on_delete(self, mock_remove, mock_isfile):
@@ -115,18 +473,30 @@ class VideoSignalsTests(TestCase):
 
 class VideoProcessingTests(unittest.TestCase):
 
-    @patch('subprocess.run')
-    def test_run_command_success(self, mock_run):
-        mock_run.return_value = MagicMock(stdout=b'output', stderr=b'')
-        run_command('echo "Hello, World!"')
-        mock_run.assert_called_once_with('echo "Hello, World!"', capture_output=True, shell=True, check=True)
+    @patch('backend.tasks.run_process')
+    def test_run_command_success(self, mock_run_process):
+        mock_run_process.return_value = ProcessResult(args=['echo', 'Hello, World!'], returncode=0, stdout='Hello, World!\n')
+        with override_settings(FFMPEG_TIMEOUT=60, FFMPEG_CPU_LIMIT=None):
+            result = run_command(['echo', 'Hello, World!'])
+        self.assertTrue(result.ok)
+        mock_run_process.assert_called_once_with(
+            ['echo', 'Hello, World!'], timeout=60, cpu_limit=None, on_stdout_line=None
+        )
 
-    @patch('subprocess.run')
-    def test_run_command_failure(self, mock_run):
-        mock_run.side_effect = subprocess.CalledProcessError(1, 'cmd', stderr=b'error')
+    @patch('backend.tasks.run_process')
+    def test_run_command_failure(self, mock_run_process):
+        mock_run_process.return_value = ProcessResult(args=['invalid_command'], returncode=1, stderr='error')
         with patch('builtins.print') as mock_print:
-            run_command('invalid_command')
-            mock_print.assert_called_with('Error: error')
+            self.assertFalse(run_command(['invalid_command']).ok)
+            mock_print.assert_called_with('Error: Exit-Code 1: error')
+
+    @patch('backend.tasks.run_process')
+    def test_run_command_progress_flags(self, mock_run_process):
+        run_command(['ffmpeg', '-i', 'video.mp4', 'out.m3u8'], on_progress=lambda report: None)
+        self.assertEqual(
+            mock_run_process.call_args[0][0],
+            ['ffmpeg', '-progress', 'pipe:1', '-nostats', '-i', 'video.mp4', 'out.m3u8']
+        )
 
     @patch('os.path.exists', return_value=True)
     @patch('backend.tasks.run_command')
@@ -144,67 +514,257 @@ class VideoProcessingTests(unittest.TestCase):
         mock_run_command.assert_called_once()
         mock_exists.assert_called_once_with('thumbnail.jpg')
 
-    @patch('builtins.open', new_callable=unittest.mock.mock_open)
-    @patch('django.core.files.File')
-    def test_save_thumbnail_to_model(self, mock_file, mock_open):
-        video = Video.objects.create(title='Test Video')
-        save_thumbnail_to_model(video.id, 'thumbnail.jpg')
-        mock_open.assert_called_once_with('thumbnail.jpg', 'rb')
-        mock_file.assert_called_once()
+    def test_build_encode_command_single_decode(self):
+        args, targets = build_encode_command('video.mp4', VIDEO_LADDER)
+        self.assertEqual(args.count('-i'), 1)
+        filter_graph = args[args.index('-filter_complex') + 1]
+        self.assertIn('split=3[v0][v1][v2]', filter_graph)
+        self.assertIn('scale=-2:1080[out2]', filter_graph)
+        self.assertEqual(args.count('expr:gte(t,n_forced*2)'), 3)
+        self.assertEqual(args[args.index('-maxrate') + 1], '800000')
+        self.assertEqual(args[args.index('-bufsize') + 1], '1600000')
+        self.assertEqual(targets, [
+            ('360p', 'video_360p.mp4'),
+            ('720p', 'video_720p.mp4'),
+            ('1080p', 'video_1080p.mp4'),
+        ])
+
+    def test_build_encode_command_direct_hls(self):
+        args, targets = build_encode_command('video.mp4', VIDEO_LADDER, direct_hls=True)
+        self.assertEqual(args.count('hls'), 3)
+        self.assertNotIn('video_360p.mp4', args)
+        self.assertEqual(targets[0], ('360p', 'video_360p.m3u8'))
 
     @patch('os.path.exists', return_value=True)
+    @patch('backend.tasks.save_to_model')
     @patch('backend.tasks.convert_hls')
     @patch('backend.tasks.run_command')
-    def test_convert_360p_success(self, mock_run_command, mock_convert_hls, mock_exists):
-        convert_360p('video.mp4', 1)
+    def test_encode_renditions_direct_hls(self, mock_run_command, mock_convert_hls, mock_save_to_model, mock_exists):
+        with override_settings(VIDEO_DIRECT_HLS=True):
+            encode_renditions('video.mp4', 1)
         mock_run_command.assert_called_once()
-        mock_convert_hls.assert_called_once_with('video_360p.mp4', '360p', 1)
-        mock_exists.assert_called_once_with('video_360p.mp4')
-
-    @patch('os.path.exists', return_value=False)
-    @patch('backend.tasks.run_command')
-    def test_convert_360p_failure(self, mock_run_command, mock_exists):
-        with patch('builtins.print') as mock_print:
-            convert_360p('video.mp4', 1)
-            mock_run_command.assert_called_once()
-            mock_exists.assert_called_once_with('video_360p.mp4')
-            mock_print.assert_called_with('Fehler: 360p Datei video_360p.mp4 wurde nicht erstellt.')
+        mock_convert_hls.assert_not_called()
+        mock_save_to_model.assert_any_call(1, 'video_360p.m3u8', '360p')
+        self.assertEqual(mock_save_to_model.call_count, 3)
 
     @patch('os.path.exists', return_value=True)
     @patch('backend.tasks.convert_hls')
     @patch('backend.tasks.run_command')
-    def test_convert_720p_success(self, mock_run_command, mock_convert_hls, mock_exists):
-        convert_720p('video.mp4', 1)
+    def test_encode_renditions_mp4(self, mock_run_command, mock_convert_hls, mock_exists):
+        with override_settings(VIDEO_DIRECT_HLS=False):
+            encode_renditions('video.mp4', 1)
         mock_run_command.assert_called_once()
-        mock_convert_hls.assert_called_once_with('video_720p.mp4', '720p', 1)
-        mock_exists.assert_called_once_with('video_720p.mp4')
+        mock_convert_hls.assert_any_call('video_360p.mp4', '360p', 1)
+        mock_convert_hls.assert_any_call('video_720p.mp4', '720p', 1)
+        mock_convert_hls.assert_any_call('video_1080p.mp4', '1080p', 1)
+        self.assertEqual(mock_convert_hls.call_count, 3)
 
+    @patch('backend.tasks.mark_rendition_failed')
     @patch('os.path.exists', return_value=False)
+    @patch('backend.tasks.save_to_model')
     @patch('backend.tasks.run_command')
-    def test_convert_720p_failure(self, mock_run_command, mock_exists):
+    def test_encode_renditions_failure(self, mock_run_command, mock_save_to_model, mock_exists, mock_mark_rendition_failed):
         with patch('builtins.print') as mock_print:
-            convert_720p('video.mp4', 1)
+            encode_renditions('video.mp4', 1)
             mock_run_command.assert_called_once()
-            mock_exists.assert_called_once_with('video_720p.mp4')
-            mock_print.assert_called_with('Fehler: 720p Datei video_720p.mp4 wurde nicht erstellt.')
+            mock_save_to_model.assert_not_called()
+            mock_print.assert_called_with('Fehler: 1080p Datei video_1080p.m3u8 wurde nicht erstellt.')
+            mock_mark_rendition_failed.assert_any_call(1, '1080p')
+
+    def test_parse_probe(self):
+        output = json.dumps({
+            'streams': [
+                {'codec_type': 'video', 'codec_name': 'h264', 'width': 854, 'height': 480, 'avg_frame_rate': '30000/1001'},
+                {'codec_type': 'audio', 'codec_name': 'aac'},
+            ],
+            'format': {'duration': '7260.500000', 'bit_rate': '1500000'},
+        })
+        self.assertEqual(parse_probe(output), {
+            'duration': 7260.5,
+            'width': 854,
+            'height': 480,
+            'frame_rate': 29.97,
+            'video_codec': 'h264',
+            'video_profile': None,
+            'pixel_format': None,
+            'audio_codec': 'aac',
+            'bitrate': 1500000,
+        })
+
+    @patch('backend.tasks.run_command', return_value=ProcessResult(args=['ffprobe'], returncode=1))
+    def test_probe_video_failure(self, mock_run_command):
+        with patch('builtins.print') as mock_print:
+            self.assertIsNone(probe_video('video.mp4', 1))
+            mock_print.assert_called_with('Fehler: video.mp4 konnte nicht analysiert werden.')
+
+    def test_select_ladder_skips_upscaling(self):
+        self.assertEqual([rung['resolution'] for rung in select_ladder(480)], ['360p'])
+        self.assertEqual([rung['resolution'] for rung in select_ladder(1080)], ['360p', '720p', '1080p'])
+        self.assertEqual([rung['resolution'] for rung in select_ladder(240)], ['360p'])
+        self.assertEqual(select_ladder(None), VIDEO_LADDER)
+
+    def test_select_ladder_uses_short_side(self):
+        self.assertEqual([rung['resolution'] for rung in select_ladder(1080, 1440)], ['360p', '720p', '1080p'])
+        self.assertEqual([rung['resolution'] for rung in select_ladder(1920, 1080)], ['360p', '720p', '1080p'])
+        self.assertEqual([rung['resolution'] for rung in select_ladder(1280, 720)], ['360p', '720p'])
+        self.assertEqual([rung['resolution'] for rung in select_ladder(1080, 1920)], ['360p', '720p', '1080p'])
+
+    @patch('django_rq.get_queue')
+    @patch('backend.tasks.register_renditions')
+    @patch('backend.tasks.encode_renditions')
+    @patch('backend.tasks.transcode_in_chunks')
+    @patch('backend.tasks.probe_video', return_value={'duration': 7200.0, 'height': 720})
+    def test_process_video_long_is_chunked(self, mock_probe_video, mock_transcode_in_chunks, mock_encode_renditions, mock_register_renditions, mock_get_queue):
+        with override_settings(VIDEO_CHUNKED_MIN_DURATION=600):
+            process_video('video.mp4', 1)
+        mock_transcode_in_chunks.assert_not_called()
+        trickplay_call, chunked_call = mock_get_queue.return_value.enqueue.call_args_list
+        self.assertEqual(trickplay_call[0], (create_trickplay, 'video.mp4', 1))
+        self.assertEqual(chunked_call[0], (mock_transcode_in_chunks, 'video.mp4', 1, VIDEO_LADDER[:2]))
+        self.assertEqual(chunked_call[1]['duration'], 7200.0)
+        self.assertEqual(chunked_call[1]['meta']['resolutions'], ['360p', '720p'])
+        mock_encode_renditions.assert_not_called()
+
+    @patch('django_rq.get_queue')
+    @patch('backend.tasks.register_renditions')
+    @patch('backend.tasks.encode_renditions')
+    @patch('backend.tasks.transcode_in_chunks')
+    @patch('backend.tasks.probe_video', return_value={'duration': 60.0, 'height': 1080})
+    def test_process_video_short_single_job(self, mock_probe_video, mock_transcode_in_chunks, mock_encode_renditions, mock_register_renditions, mock_get_queue):
+        with override_settings(VIDEO_CHUNKED_MIN_DURATION=600):
+            process_video('video.mp4', 1)
+        mock_encode_renditions.assert_not_called()
+        mock_transcode_in_chunks.assert_not_called()
+        mock_get_queue.assert_any_call('high', autocommit=True)
+        mock_get_queue.assert_any_call('low', autocommit=True)
+        encode_calls = [
+            call for call in mock_get_queue.return_value.enqueue.call_args_list if call[0][0] == mock_encode_renditions
+        ]
+        self.assertEqual(
+            [call[0][1:] for call in encode_calls], [('video.mp4', 1, VIDEO_LADDER[:1]), ('video.mp4', 1, VIDEO_LADDER[1:])]
+        )
+        self.assertEqual([call[1]['separate_audio'] for call in encode_calls], [False, False])
+        self.assertEqual([call[1]['job_timeout'] for call in encode_calls], [600 + 300, 600 + 300])
+        self.assertIs(encode_calls[0][1]['on_failure'], on_job_failure)
+
+    def test_find_copy_rung(self):
+        metadata = {
+            'video_codec': 'h264', 'video_profile': 'High', 'pixel_format': 'yuv420p', 'audio_codec': 'aac',
+            'width': 1280, 'height': 720, 'bitrate': 2500000,
+        }
+        self.assertEqual(find_copy_rung(metadata, VIDEO_LADDER), VIDEO_LADDER[1])
+        self.assertIsNone(find_copy_rung(dict(metadata, video_profile='High 10'), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, pixel_format='yuv422p'), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, bitrate=12000000), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, bitrate=None), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, video_codec='hevc'), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, audio_codec='opus'), VIDEO_LADDER))
+        self.assertIsNone(find_copy_rung(dict(metadata, width=1000), VIDEO_LADDER))
 
     @patch('os.path.exists', return_value=True)
-    @patch('backend.tasks.convert_hls')
+    @patch('backend.tasks.save_to_model')
     @patch('backend.tasks.run_command')
-    def test_convert_1080p_success(self, mock_run_command, mock_convert_hls, mock_exists):
-        convert_1080p('video.mp4', 1)
-        mock_run_command.assert_called_once()
-        mock_convert_hls.assert_called_once_with('video_1080p.mp4', '1080p', 1)
-        mock_exists.assert_called_once_with('video_1080p.mp4')
+    def test_copy_rendition(self, mock_run_command, mock_save_to_model, mock_exists):
+        copy_rendition('video.mp4', 1, VIDEO_LADDER[1])
+        args = mock_run_command.call_args[0][0]
+        self.assertEqual(args[args.index('-c') + 1], 'copy')
+        self.assertNotIn('libx264', args)
+        mock_save_to_model.assert_called_once_with(1, 'video_720p.m3u8', '720p')
 
-    @patch('os.path.exists', return_value=False)
+    @patch('django_rq.get_queue')
+    @patch('backend.tasks.register_renditions')
+    @patch('backend.tasks.encode_renditions')
+    @patch('backend.tasks.copy_rendition')
+    @patch('backend.tasks.probe_video', return_value={
+        'duration': 60.0, 'width': 1280, 'height': 720, 'video_codec': 'h264', 'video_profile': 'Main',
+        'pixel_format': 'yuv420p', 'audio_codec': 'aac', 'bitrate': 2000000})
+    def test_process_video_stream_copy(self, mock_probe_video, mock_copy_rendition, mock_encode_renditions, mock_register_renditions, mock_get_queue):
+        with override_settings(VIDEO_SEPARATE_AUDIO=True):
+            process_video('video.mp4', 1)
+        mock_register_renditions.assert_called_once_with(1, VIDEO_LADDER[:2], audio=True)
+        mock_copy_rendition.assert_not_called()
+        calls = {call[0][0]: call for call in mock_get_queue.return_value.enqueue.call_args_list}
+        self.assertEqual(calls[encode_audio][0][1:], ('video.mp4', 1))
+        self.assertTrue(calls[encode_audio][1]['copy'])
+        self.assertEqual(calls[mock_copy_rendition][0][1:], ('video.mp4', 1, VIDEO_LADDER[1]))
+        self.assertEqual(calls[mock_copy_rendition][1]['meta']['resolutions'], ['720p'])
+        self.assertEqual(calls[mock_encode_renditions][0][1:], ('video.mp4', 1, VIDEO_LADDER[:1]))
+        self.assertTrue(calls[mock_encode_renditions][1]['separate_audio'])
+
+    def test_build_encode_command_separate_audio(self):
+        args, _ = build_encode_command('video.mp4', VIDEO_LADDER, separate_audio=True)
+        self.assertEqual(args.count('-an'), 3)
+        self.assertNotIn('0:a?', args)
+        args, _ = build_encode_command('video.mp4', VIDEO_LADDER)
+        self.assertEqual(args.count('0:a?'), 3)
+
+    @patch('os.path.exists', return_value=True)
+    @patch('backend.tasks.save_to_model')
     @patch('backend.tasks.run_command')
-    def test_convert_1080p_failure(self, mock_run_command, mock_exists):
-        with patch('builtins.print') as mock_print:
-            convert_1080p('video.mp4', 1)
-            mock_run_command.assert_called_once()
-            mock_exists.assert_called_once_with('video_1080p.mp4')
-            mock_print.assert_called_with('Fehler: 1080p Datei video_1080p.mp4 wurde nicht erstellt.')
+    def test_encode_audio(self, mock_run_command, mock_save_to_model, mock_exists):
+        encode_audio('video.mp4', 1)
+        args = mock_run_command.call_args[0][0]
+        self.assertEqual(args[args.index('-map') + 1], '0:a:0')
+        self.assertIn('-vn', args)
+        self.assertEqual(args[args.index('-c:a') + 1], 'aac')
+        mock_save_to_model.assert_called_once_with(
+            1, 'video_audio.m3u8', 'audio', codec='aac', kind=VideoRendition.Kind.AUDIO
+        )
+
+    @patch('glob.glob', return_value=['video_chunk001.mp4', 'video_chunk000.mp4'])
+    @patch('backend.tasks.run_command')
+    def test_split_source(self, mock_run_command, mock_glob):
+        chunks = split_source('video.mp4', 120)
+        self.assertEqual(chunks, ['video_chunk000.mp4', 'video_chunk001.mp4'])
+        args = mock_run_command.call_args[0][0]
+        self.assertIn('segment', args)
+        self.assertEqual(args[args.index('-segment_time') + 1], '120')
+        self.assertEqual(args[-1], 'video_chunk%03d.mp4')
+
+    @patch('django_rq.get_queue')
+    @patch('backend.tasks.split_source', return_value=['video_chunk000.mp4', 'video_chunk001.mp4'])
+    def test_transcode_in_chunks(self, mock_split_source, mock_get_queue):
+        mock_queue = MagicMock()
+        mock_queue.enqueue.side_effect = lambda *args, **kwargs: f'job{mock_queue.enqueue.call_count}'
+        mock_get_queue.return_value = mock_queue
+        transcode_in_chunks('video.mp4', 1)
+        self.assertEqual(mock_queue.enqueue.call_count, 7)
+        stitch_calls = [call for call in mock_queue.enqueue.call_args_list if call[0][0] == stitch_chunks]
+        self.assertEqual([call[0][4] for call in stitch_calls], [VIDEO_LADDER[:1], VIDEO_LADDER[1:]])
+        self.assertEqual(len(stitch_calls[0][1]['depends_on'].dependencies), 2)
+        self.assertTrue(stitch_calls[0][1]['depends_on'].allow_failure)
+        chunk_call = mock_queue.enqueue.call_args_list[0]
+        self.assertEqual(chunk_call[1]['meta']['files'], ['video_chunk000_360p.mp4'])
+        cleanup_call = mock_queue.enqueue.call_args
+        self.assertEqual(cleanup_call[0], (remove_files, ['video_chunk000.mp4', 'video_chunk001.mp4']))
+        self.assertEqual(len(cleanup_call[1]['depends_on'].dependencies), 2)
+        self.assertTrue(cleanup_call[1]['depends_on'].allow_failure)
+
+    def test_job_timeout(self):
+        with override_settings(FFMPEG_TIMEOUT=6 * 60 * 60, VIDEO_JOB_TIMEOUT_FACTOR=3, VIDEO_JOB_MIN_TIMEOUT=600):
+            self.assertEqual(job_timeout(60.0), 600 + 300)
+            self.assertEqual(job_timeout(600.0, outputs=2), 3600 + 300)
+            self.assertEqual(job_timeout(7200.0, outputs=2), 6 * 60 * 60 + 300)
+            self.assertEqual(job_timeout(None), 6 * 60 * 60 + 300)
+
+    def test_priority_groups(self):
+        self.assertEqual(priority_groups(VIDEO_LADDER), [('high', VIDEO_LADDER[:1]), ('low', VIDEO_LADDER[1:])])
+        self.assertEqual(priority_groups(VIDEO_LADDER[:1]), [('high', VIDEO_LADDER[:1])])
+        with override_settings(VIDEO_PRIORITIZE_FIRST_RUNG=False):
+            self.assertEqual(priority_groups(VIDEO_LADDER), [('default', VIDEO_LADDER)])
+
+    @patch('os.remove')
+    @patch('os.path.exists', return_value=True)
+    @patch('backend.tasks.save_to_model')
+    @patch('backend.tasks.run_command')
+    @patch('builtins.open', new_callable=mock_open)
+    def test_stitch_chunks(self, mock_file, mock_run_command, mock_save_to_model, mock_exists, mock_remove):
+        stitch_chunks('video.mp4', 1, ['video_chunk000.mp4', 'video_chunk001.mp4'], VIDEO_LADDER[:1])
+        mock_file().write.assert_any_call("file 'video_chunk000_360p.mp4'\n")
+        mock_file().write.assert_any_call("file 'video_chunk001_360p.mp4'\n")
+        self.assertEqual(mock_run_command.call_args[0][0][1:5], ['-f', 'concat', '-safe', '0'])
+        mock_save_to_model.assert_called_once_with(1, 'video_360p.m3u8', '360p')
+        mock_remove.assert_any_call('video_chunk000_360p.mp4')
 
     @patch('os.path.exists', return_value=True)
     @patch('backend.tasks.save_to_model')
@@ -215,45 +775,818 @@ class VideoProcessingTests(unittest.TestCase):
         mock_save_to_model.assert_called_once_with(1, 'video.m3u8', '360p')
         mock_exists.assert_called_once_with('video.m3u8')
 
+    @patch('backend.tasks.mark_rendition_failed')
     @patch('os.path.exists', return_value=False)
     @patch('backend.tasks.run_command')
-    def test_convert_hls_failure(self, mock_run_command, mock_exists):
+    def test_convert_hls_failure(self, mock_run_command, mock_exists, mock_mark_rendition_failed):
         with patch('builtins.print') as mock_print:
             convert_hls('video.mp4', '360p', 1)
             mock_run_command.assert_called_once()
             mock_exists.assert_called_once_with('video.m3u8')
             mock_print.assert_called_with('Fehler: HLS-Datei video.m3u8 wurde nicht erstellt.')
 
+
+class VideoRenditionTests(TestCase):
+
+    def setUp(self):
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(title='Test Video', video_file='videos/video.mp4')
+
+    @patch('os.path.getsize', return_value=1000000)
+    @patch('os.path.exists', return_value=True)
+    @patch('builtins.open', new_callable=mock_open,
+           read_data='#EXTM3U\n#EXTINF:10.0,\nvideo_360p0.ts\n#EXTINF:6.0,\nvideo_360p1.ts\n#EXT-X-ENDLIST\n')
+    def test_playlist_stats(self, mock_file, mock_exists, mock_getsize):
+        stats = playlist_stats('/media/videos/video_360p.m3u8')
+        self.assertEqual(stats, {'segment_count': 2, 'size_bytes': 2000000, 'bitrate': 1000000, 'peak_bitrate': 1333333})
+        mock_getsize.assert_any_call('/media/videos/video_360p0.ts')
+
+    @patch('os.path.getsize')
+    @patch('builtins.open', new_callable=mock_open, read_data=(
+        '#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI="video_360p.m4s",BYTERANGE="800@0"\n'
+        '#EXTINF:10.0,\n#EXT-X-BYTERANGE:1250000@800\nvideo_360p.m4s\n'
+        '#EXTINF:6.0,\n#EXT-X-BYTERANGE:750000\nvideo_360p.m4s\n#EXT-X-ENDLIST\n'
+    ))
+    def test_playlist_stats_byte_ranges(self, mock_file, mock_getsize):
+        stats = playlist_stats('/media/videos/video_360p.m3u8')
+        self.assertEqual(stats, {'segment_count': 2, 'size_bytes': 2000800, 'bitrate': 1000000, 'peak_bitrate': 1000000})
+        mock_getsize.assert_not_called()
+
+    @patch('builtins.open', new_callable=mock_open, read_data=(
+        '#EXTM3U\n#EXTINF:10.0,\n#EXT-X-BYTERANGE:1000@0\nvideo_360p.m4s\n'
+        '#EXTINF:10.0,\n#EXT-X-BYTERANGE:500\nvideo_360p.m4s\n'
+    ))
+    def test_parse_media_playlist_continues_byte_ranges(self, mock_file):
+        segments = parse_media_playlist('/media/videos/video_360p.m3u8')['segments']
+        self.assertEqual([(segment['offset'], segment['length']) for segment in segments], [(0, 1000), (1000, 500)])
+
+    def test_hls_options_fmp4(self):
+        with override_settings(VIDEO_HLS_SEGMENT_TYPE='fmp4'):
+            options = hls_options('/media/videos/video_360p.m3u8')
+        self.assertEqual(options[options.index('-hls_segment_type') + 1], 'fmp4')
+        self.assertEqual(options[options.index('-hls_flags') + 1], 'single_file')
+        self.assertEqual(options[options.index('-hls_fmp4_init_filename') + 1], 'video_360p.init.mp4')
+        with override_settings(VIDEO_HLS_SEGMENT_TYPE='mpegts'):
+            self.assertNotIn('-hls_segment_type', hls_options('/media/videos/video_360p.m3u8'))
+
+    @patch('backend.tasks.create_master_playlist')
+    @patch('backend.tasks.probe_rendition', return_value={'codecs': 'avc1.64001E,mp4a.40.2', 'frame_rate': 25.0})
+    @patch('backend.tasks.playlist_stats', return_value={'segment_count': 3, 'size_bytes': 300, 'bitrate': 80})
+    def test_save_to_model_publishes_after_each_rendition(self, mock_playlist_stats, mock_probe_rendition, mock_create_master_playlist):
+        register_renditions(self.video.id, VIDEO_LADDER[:2])
+        save_to_model(self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_360p.m3u8'), '360p')
+        rendition = self.video.renditions.get(resolution='360p')
+        self.assertEqual(rendition.status, VideoRendition.Status.READY)
+        self.assertEqual(rendition.playlist.name, 'videos/video_360p.m3u8')
+        self.assertEqual(rendition.segment_count, 3)
+        mock_create_master_playlist.assert_called_once()
+
+        save_to_model(self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_720p.m3u8'), '720p')
+        self.assertEqual(mock_create_master_playlist.call_count, 2)
+        self.assertEqual(self.video.renditions.count(), 2)
+
+    @patch('backend.tasks.create_master_playlist')
+    @patch('backend.tasks.probe_rendition', return_value={})
+    @patch('backend.tasks.playlist_stats', return_value={'segment_count': 3, 'size_bytes': 300, 'bitrate': 80})
+    def test_failed_rendition_publishes_the_rest(self, mock_playlist_stats, mock_probe_rendition, mock_create_master_playlist):
+        register_renditions(self.video.id, VIDEO_LADDER[:2])
+        save_to_model(self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_360p.m3u8'), '360p')
+        mark_rendition_failed(self.video.id, '720p')
+        self.assertEqual(mock_create_master_playlist.call_count, 2)
+        self.assertEqual(self.video.renditions.get(resolution='720p').status, VideoRendition.Status.FAILED)
+
+    @patch('backend.tasks.remove_files')
     @patch('backend.tasks.create_master_playlist')
-    def test_save_to_model(self, mock_create_master_playlist):
-        video = Video.objects.create(title='Test Video')
-        with patch('os.path.relpath', return_value='testlocation/video.m3u8'):
-            save_to_model(video.id, 'testlocation/video.m3u8', '360p')
-            video.refresh_from_db()
-            self.assertEqual(video.video_360p_m3u8, 'testlocation/video.m3u8')
-            mock_create_master_playlist.assert_not_called()
+    @patch('backend.tasks.probe_rendition', return_value={})
+    @patch('backend.tasks.playlist_stats', return_value={'segment_count': 3, 'size_bytes': 300, 'bitrate': 80})
+    def test_failed_job_marks_pending_renditions(self, mock_playlist_stats, mock_probe_rendition, mock_create_master_playlist, mock_remove_files):
+        register_renditions(self.video.id, VIDEO_LADDER[:2])
+        save_to_model(self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_360p.m3u8'), '360p')
+        job = MagicMock(meta={'video_id': self.video.id, 'resolutions': ['360p', '720p'], 'files': ['part.mp4']})
+        with patch('builtins.print'):
+            on_job_failure(job, None, Exception, Exception('JobTimeoutException'), None)
+        mock_remove_files.assert_called_once_with(['part.mp4'])
+        self.assertEqual(self.video.renditions.get(resolution='360p').status, VideoRendition.Status.READY)
+        self.assertEqual(self.video.renditions.get(resolution='720p').status, VideoRendition.Status.FAILED)
+        self.assertEqual(mock_create_master_playlist.call_count, 2)
 
+    @patch('os.replace')
     @patch('builtins.open', new_callable=mock_open)
     @patch('os.path.exists', return_value=True)
-    def test_create_master_playlist(self, mock_exists, mock_open):
-        video = Video.objects.create(
-            title='Test Video',
-            video_file='testlocation/video.mp4',
-            video_360p_m3u8='testlocation/video_360p.m3u8',
-            video_720p_m3u8='testlocation/video_720p.m3u8',
-            video_1080p_m3u8='testlocation/video_1080p.m3u8'
-        )
+    def test_create_master_playlist(self, mock_exists, mock_open, mock_replace):
+        for rung in VIDEO_LADDER:
+            VideoRendition.objects.create(
+                video=self.video, resolution=rung['resolution'], width=rung['width'], height=rung['height'],
+                playlist=f"videos/video_{rung['resolution']}.m3u8", status=VideoRendition.Status.READY,
+            )
 
-        create_master_playlist(video)
+        create_master_playlist(self.video)
 
-        # Ensure the file was opened for writing the master playlist
-        mock_open.assert_called_with('testlocation/video_master.m3u8', 'w')
+        master_playlist_path = self.video.video_file.path.replace('.mp4', '_master.m3u8')
+        mock_open.assert_called_with(f'{master_playlist_path}.tmp', 'w')
+        mock_replace.assert_called_once_with(f'{master_playlist_path}.tmp', master_playlist_path)
         handle = mock_open()
         handle.write.assert_any_call('#EXTM3U\n')
         handle.write.assert_any_call('#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n')
-        handle.write.assert_any_call('../testlocation/video_360p.m3u8\n')
+        handle.write.assert_any_call('../videos/video_360p.m3u8\n')
         handle.write.assert_any_call('#EXT-X-STREAM-INF:BANDWIDTH=2800000,RESOLUTION=1280x720\n')
-        handle.write.assert_any_call('../testlocation/video_720p.m3u8\n')
+        handle.write.assert_any_call('../videos/video_720p.m3u8\n')
         handle.write.assert_any_call('#EXT-X-STREAM-INF:BANDWIDTH=5000000,RESOLUTION=1920x1080\n')
-        handle.write.assert_any_call('../testlocation/video_1080p.m3u8\n')
-        self.assertEqual(handle.write.call_count, 7)
\ No newline at end of file
+        handle.write.assert_any_call('../videos/video_1080p.m3u8\n')
+        self.assertEqual(handle.write.call_count, 7)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.video_master_m3u8.name, 'videos/video_master.m3u8')
+
+    @patch('os.replace')
+    @patch('builtins.open', new_callable=mock_open)
+    @patch('os.path.exists', return_value=True)
+    def test_create_master_playlist_measured_attributes(self, mock_exists, mock_open, mock_replace):
+        VideoRendition.objects.create(
+            video=self.video, resolution='360p', width=640, height=360, bitrate=701000, peak_bitrate=912000,
+            codecs='avc1.64001E,mp4a.40.2', frame_rate=29.97, playlist='videos/video_360p.m3u8',
+            status=VideoRendition.Status.READY,
+        )
+        create_master_playlist(self.video)
+        mock_open().write.assert_any_call(
+            '#EXT-X-STREAM-INF:BANDWIDTH=912000,AVERAGE-BANDWIDTH=701000,CODECS="avc1.64001E,mp4a.40.2",'
+            'RESOLUTION=640x360,FRAME-RATE=29.970\n'
+        )
+
+    @patch('backend.tasks.create_master_playlist')
+    @patch('backend.tasks.probe_rendition', return_value={})
+    @patch('backend.tasks.playlist_stats', return_value={'segment_count': 3, 'size_bytes': 300, 'bitrate': 80})
+    def test_pending_audio_holds_back_master_playlist(self, mock_playlist_stats, mock_probe_rendition, mock_create_master_playlist):
+        register_renditions(self.video.id, VIDEO_LADDER[:1], audio=True)
+        save_to_model(self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_360p.m3u8'), '360p')
+        mock_create_master_playlist.assert_not_called()
+        save_to_model(
+            self.video.id, os.path.join(settings.MEDIA_ROOT, 'videos/video_audio.m3u8'), 'audio',
+            codec='aac', kind=VideoRendition.Kind.AUDIO
+        )
+        mock_create_master_playlist.assert_called_once()
+
+    @patch('os.replace')
+    @patch('builtins.open', new_callable=mock_open)
+    @patch('os.path.exists', return_value=True)
+    def test_create_master_playlist_audio_group(self, mock_exists, mock_open, mock_replace):
+        VideoRendition.objects.create(
+            video=self.video, resolution='360p', width=640, height=360, bitrate=700000, peak_bitrate=900000,
+            codecs='avc1.64001E', playlist='videos/video_360p.m3u8', status=VideoRendition.Status.READY,
+        )
+        VideoRendition.objects.create(
+            video=self.video, kind=VideoRendition.Kind.AUDIO, codec='aac', resolution='audio', bitrate=128000,
+            peak_bitrate=130000, codecs='mp4a.40.2', playlist='videos/video_audio.m3u8',
+            status=VideoRendition.Status.READY,
+        )
+        create_master_playlist(self.video)
+        handle = mock_open()
+        handle.write.assert_any_call(
+            '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="audio",NAME="Audio",DEFAULT=YES,AUTOSELECT=YES,'
+            'URI="../videos/video_audio.m3u8"\n'
+        )
+        handle.write.assert_any_call(
+            '#EXT-X-STREAM-INF:BANDWIDTH=1030000,AVERAGE-BANDWIDTH=828000,CODECS="avc1.64001E,mp4a.40.2",'
+            'RESOLUTION=640x360,AUDIO="audio"\n'
+        )
+        self.assertEqual(handle.write.call_count, 4)
+
+    def test_codec_string(self):
+        self.assertEqual(codec_string({'codec_name': 'h264', 'profile': 'High', 'level': 31}), 'avc1.64001F')
+        self.assertEqual(codec_string({'codec_name': 'h264', 'profile': 'Main', 'level': 30}), 'avc1.4D401E')
+        self.assertEqual(codec_string({'codec_name': 'h264', 'profile': 'Constrained Baseline', 'level': 30}), 'avc1.42E01E')
+        self.assertEqual(codec_string({'codec_name': 'aac', 'profile': 'LC'}), 'mp4a.40.2')
+        self.assertEqual(codec_string({'codec_name': 'aac', 'profile': 'HE-AAC'}), 'mp4a.40.5')
+        self.assertIsNone(codec_string({'codec_name': 'h264', 'profile': 'High', 'level': -99}))
+
+    @patch('backend.tasks.run_command')
+    def test_probe_rendition_omits_unknown_codecs(self, mock_run_command):
+        mock_run_command.return_value = ProcessResult(args=['ffprobe'], returncode=0, stdout=json.dumps({'streams': [
+            {'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High', 'level': 30, 'avg_frame_rate': '25/1'},
+            {'codec_type': 'audio', 'codec_name': 'opus'},
+        ]}))
+        self.assertEqual(probe_rendition('/media/videos/video_360p.m3u8'), {'codecs': None, 'frame_rate': 25.0})
+
+    @patch('backend.tasks.run_command')
+    def test_probe_rendition_reads_encoded_size(self, mock_run_command):
+        mock_run_command.return_value = ProcessResult(args=['ffprobe'], returncode=0, stdout=json.dumps({'streams': [
+            {'codec_type': 'video', 'codec_name': 'h264', 'width': 480, 'height': 360, 'avg_frame_rate': '25/1'},
+        ]}))
+        rendition = probe_rendition('/media/videos/video_360p.m3u8')
+        self.assertEqual((rendition['width'], rendition['height']), (480, 360))
+
+    def test_serializer_includes_renditions(self):
+        VideoRendition.objects.create(video=self.video, resolution='360p', width=640, height=360)
+        data = VideoViewSerializer(self.video).data
+        self.assertEqual([rendition['resolution'] for rendition in data['renditions']], ['360p'])
+
+
+class ThumbnailStageTests(TemporaryMediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(title='Test Video', video_file='videos/video.mp4')
+
+    def test_save_thumbnail_to_model(self):
+        thumbnail_file = os.path.join(self.media_root, 'video_thumbnail.png')
+        Image.new('RGB', (640, 360), 'red').save(thumbnail_file)
+        save_thumbnail_to_model(self.video.id, thumbnail_file)
+        self.video.refresh_from_db()
+        self.assertTrue(os.path.exists(self.video.thumbnails.path))
+        self.assertTrue(self.video.thumbnails.name.startswith('thumbnails/video_thumbnail'))
+        self.assertEqual((self.video.thumbnail_width, self.video.thumbnail_height), (640, 360))
+        self.assertEqual(self.video.thumbnail_status, ProcessingStatus.READY)
+
+    @patch('backend.tasks.save_thumbnail_to_model')
+    @patch('backend.tasks.generate_thumbnail', return_value='videos/video_thumbnail.png')
+    def test_create_thumbnail(self, mock_generate_thumbnail, mock_save_thumbnail_to_model):
+        create_thumbnail('videos/video.mp4', self.video.id)
+        mock_generate_thumbnail.assert_called_once_with('videos/video.mp4', 'videos/video_thumbnail.png')
+        mock_save_thumbnail_to_model.assert_called_once_with(self.video.id, 'videos/video_thumbnail.png')
+
+    @patch('backend.tasks.generate_thumbnail', return_value=None)
+    def test_create_thumbnail_failure(self, mock_generate_thumbnail):
+        with patch('builtins.print'):
+            create_thumbnail('videos/video.mp4', self.video.id)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.thumbnail_status, ProcessingStatus.FAILED)
+
+
+class TrickplayTests(TestCase):
+
+    def setUp(self):
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(
+                title='Test Video', video_file='videos/video.mp4', duration=265.0, width=1920, height=1080
+            )
+
+    def test_build_trickplay_vtt(self):
+        vtt = build_trickplay_vtt(265.0, ['video_sprite000.jpg', 'video_sprite001.jpg'], 160, 90)
+        lines = vtt.split('\n')
+        self.assertEqual(lines[0], 'WEBVTT')
+        self.assertEqual(lines[2], '00:00:00.000 --> 00:00:10.000')
+        self.assertEqual(lines[3], 'video_sprite000.jpg#xywh=0,0,160,90')
+        self.assertIn('00:00:50.000 --> 00:01:00.000\nvideo_sprite000.jpg#xywh=0,90,160,90', vtt)
+        self.assertIn('00:04:10.000 --> 00:04:20.000\nvideo_sprite001.jpg#xywh=0,0,160,90', vtt)
+        self.assertTrue(vtt.rstrip().endswith('video_sprite001.jpg#xywh=160,0,160,90'))
+        self.assertIn('00:04:20.000 --> 00:04:25.000', vtt)
+
+    @patch('builtins.open', new_callable=mock_open)
+    @patch('glob.glob', return_value=['/media/videos/video_sprite000.jpg'])
+    @patch('backend.tasks.run_command')
+    def test_create_trickplay(self, mock_run_command, mock_glob, mock_file):
+        source = self.video.video_file.path
+        create_trickplay(source, self.video.id)
+        args = mock_run_command.call_args[0][0]
+        self.assertIn('fps=1/10,scale=160:90,tile=5x5', args)
+        self.assertEqual(args.count('-i'), 1)
+        mock_file.assert_called_once_with(source.replace('.mp4', '_trickplay.vtt'), 'w')
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.trickplay_vtt.name, 'videos/video_trickplay.vtt')
+
+
+class ThumbnailVariantTests(TemporaryMediaRootMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'thumbnails'))
+        Image.new('RGB', (1920, 1080), 'red').save(os.path.join(self.media_root, 'thumbnails', 'video_thumbnail.png'))
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(
+                title='Test Video', video_file='videos/video.mp4', thumbnails='thumbnails/video_thumbnail.png'
+            )
+
+    def test_variant_is_generated_once(self):
+        path = get_thumbnail_variant(self.video, 320, 'jpg')
+        with Image.open(path) as img:
+            self.assertEqual(img.size, (320, 180))
+            self.assertEqual(img.format, 'JPEG')
+        with patch('backend.thumbnails.Image.open') as mock_image_open:
+            self.assertEqual(get_thumbnail_variant(self.video, 320, 'jpg'), path)
+            mock_image_open.assert_not_called()
+
+    def test_evict_cache_removes_least_recently_used(self):
+        old = get_thumbnail_variant(self.video, 320, 'jpg')
+        new = get_thumbnail_variant(self.video, 640, 'jpg')
+        os.utime(old, (1, 1))
+        evict_cache(max_bytes=os.path.getsize(new))
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+
+    def test_thumbnail_view(self):
+        response = self.client.get(reverse('video-thumbnail', args=[self.video.id, 640, 'jpg']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        response.close()
+
+    def test_thumbnail_view_unsupported_width(self):
+        response = self.client.get(reverse('video-thumbnail', args=[self.video.id, 123, 'jpg']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serializer_srcset(self):
+        srcset = VideoViewSerializer(self.video).data['thumbnail_srcset']
+        self.assertEqual(
+            srcset['jpg'],
+            f'/videos/{self.video.id}/thumbnail/320.jpg 320w, '
+            f'/videos/{self.video.id}/thumbnail/640.jpg 640w, '
+            f'/videos/{self.video.id}/thumbnail/1280.jpg 1280w'
+        )
+
+    def test_serializer_srcset_skips_widths_above_source(self):
+        Video.objects.filter(pk=self.video.pk).update(thumbnail_width=640, thumbnail_height=360)
+        with patch('backend.thumbnails.Image.open') as mock_open:
+            srcset = VideoViewSerializer(Video.objects.get(pk=self.video.pk)).data['thumbnail_srcset']
+        mock_open.assert_not_called()
+        self.assertEqual(
+            srcset['jpg'],
+            f'/videos/{self.video.id}/thumbnail/320.jpg 320w, /videos/{self.video.id}/thumbnail/640.jpg 640w'
+        )
+
+
+class UploadSessionTests(TemporaryMediaRootMixin, APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin_user = get_user_model().objects.create_superuser(email='admin@example.com', password='password123')
+        self.client.force_authenticate(admin_user)
+        response = self.client.post(reverse('upload-create'), {
+            'filename': 'movie.mp4', 'size': 10, 'title': 'Uploaded', 'description': 'Uploaded video',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.session = UploadSession.objects.get(pk=response.data['id'])
+
+    def put_range(self, data, start, end):
+        return self.client.put(
+            reverse('upload-detail', args=[self.session.pk]), data,
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE=f'bytes {start}-{end}/10'
+        )
+
+    def test_upload_requires_staff(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('upload-detail', args=[self.session.pk]))
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_rejects_non_mp4(self):
+        response = self.client.post(reverse('upload-create'), {
+            'filename': 'movie.mkv', 'size': 10, 'title': 'Uploaded', 'description': 'Uploaded video',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filename_is_normalized(self):
+        response = self.client.post(reverse('upload-create'), {
+            'filename': "My Clip's.v2.MP4", 'size': 10, 'title': 'Uploaded', 'description': 'Uploaded video',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['filename'], 'My_Clips_v2.mp4')
+        response = self.client.post(reverse('upload-create'), {
+            'filename': '.mp4', 'size': 10, 'title': 'Uploaded', 'description': 'Uploaded video',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_resume_and_finalize(self):
+        response = self.put_range(b'01234', 0, 4)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Upload-Offset'], '5')
+
+        response = self.put_range(b'01234', 0, 4)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['offset'], 5)
+
+        response = self.client.post(reverse('upload-finalize', args=[self.session.pk]))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.put_range(b'56789', 5, 9)
+        self.assertEqual(response['Upload-Offset'], '10')
+
+        with patch('django_rq.get_queue') as mock_get_queue, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload-finalize', args=[self.session.pk]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        video = Video.objects.get(pk=response.data['id'])
+        self.assertEqual(video.video_file.name, 'videos/movie.mp4')
+        with open(video.video_file.path, 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertFalse(os.path.exists(self.session.partial_path()))
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(mock_get_queue.return_value.enqueue.call_count, 2)
+
+        response = self.client.post(reverse('upload-finalize', args=[self.session.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_failed_finalize_moves_the_file_back(self):
+        self.put_range(b'0123456789', 0, 9)
+        with patch('backend.views.Video.objects.create', side_effect=DatabaseError('insert failed')):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('upload-finalize', args=[self.session.pk]))
+        self.assertTrue(UploadSession.objects.filter(pk=self.session.pk).exists())
+        with open(self.session.partial_path(), 'rb') as f:
+            self.assertEqual(f.read(), b'0123456789')
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'videos', 'movie.mp4')))
+
+    def test_put_locks_session_before_writing(self):
+        calls = []
+        select_for_update = UploadSession.objects.select_for_update
+
+        def lock():
+            calls.append('lock')
+            return select_for_update()
+
+        def write(*args, **kwargs):
+            calls.append('open')
+            return open(*args, **kwargs)
+
+        with patch('backend.views.UploadSession.objects.select_for_update', side_effect=lock), \
+                patch('backend.views.open', side_effect=write, create=True):
+            response = self.put_range(b'01234', 0, 4)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(calls, ['lock', 'open'])
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).offset, 5)
+
+    def test_concurrent_range_is_rejected(self):
+        def write(*args, **kwargs):
+            UploadSession.objects.filter(pk=self.session.pk).update(offset=5)
+            return open(*args, **kwargs)
+
+        with patch('backend.views.open', side_effect=write, create=True):
+            response = self.put_range(b'01234', 0, 4)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).offset, 5)
+
+    def test_short_body_keeps_offset(self):
+        response = self.client.put(
+            reverse('upload-detail', args=[self.session.pk]), b'012',
+            content_type='application/octet-stream', HTTP_CONTENT_RANGE='bytes 0-4/10'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).offset, 0)
+
+
+class PipelineProgressTests(TestCase):
+
+    def test_run_command_with_progress(self):
+        reports = []
+        result = run_command(
+            ['printf', 'frame=10\\nout_time_us=5000000\\nspeed=2.5x\\nprogress=continue\\nlog line\\nprogress=end\\n'],
+            on_progress=reports.append
+        )
+        self.assertEqual(reports[0], {'frame': '10', 'out_time_us': '5000000', 'speed': '2.5x', 'progress': 'continue'})
+        self.assertEqual(reports[1], {'progress': 'end'})
+        self.assertTrue(result.ok)
+
+    def test_run_command_with_progress_failure(self):
+        with patch('builtins.print') as mock_print:
+            self.assertFalse(run_command(['sh', '-c', 'echo broken >&2; exit 1'], on_progress=lambda report: None).ok)
+            mock_print.assert_called_with('Error: Exit-Code 1: broken')
+
+    @patch('backend.progress.record_stage')
+    def test_progress_recorder(self, mock_record_stage):
+        progress_recorder(1, 'encode_360p')({'out_time_us': '5000000', 'speed': '2.5x', 'progress': 'continue'})
+        mock_record_stage.assert_called_once_with(1, 'encode_360p', out_time=5.0, speed=2.5)
+
+    @patch('backend.progress.record_stage')
+    def test_stage_timer_failure(self, mock_record_stage):
+        with self.assertRaises(ValueError):
+            with stage_timer(1, 'probe'):
+                raise ValueError()
+        self.assertEqual(mock_record_stage.call_args[1]['status'], 'failed')
+
+    @patch('backend.progress.record_stage')
+    def test_stage_timer_fail_without_exception(self, mock_record_stage):
+        with stage_timer(1, 'encode_360p') as timer:
+            timer.fail()
+        self.assertEqual(mock_record_stage.call_args[1]['status'], 'failed')
+        with stage_timer(1, 'encode_360p'):
+            pass
+        self.assertEqual(mock_record_stage.call_args[1]['status'], 'done')
+
+    @patch('backend.progress.record_stage')
+    @patch('backend.tasks.run_command', return_value=ProcessResult(args=['ffmpeg'], returncode=1))
+    def test_failed_ffmpeg_run_is_recorded_as_failed(self, mock_run_command, mock_record_stage):
+        with patch('builtins.print'), patch('backend.tasks.mark_rendition_failed'):
+            copy_rendition('video.mp4', 1, VIDEO_LADDER[1])
+        self.assertEqual(mock_record_stage.call_args[1]['status'], 'failed')
+
+    @patch('backend.views.get_pipeline_status', return_value={'encode_360p': {'status': 'running', 'out_time': 30.0}})
+    def test_status_view(self, mock_get_pipeline_status):
+        with patch('django_rq.get_queue'):
+            video = Video.objects.create(title='Test Video', video_file='videos/video.mp4', duration=120.0)
+        VideoRendition.objects.create(video=video, resolution='360p')
+        response = self.client.get(reverse('video-status', args=[video.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['renditions'], {'360p': 'pending'})
+        self.assertEqual(response.data['stages']['encode_360p']['progress'], 0.25)
+
+
+class ProcessRunnerTests(unittest.TestCase):
+
+    def test_run_process_keeps_output_tail(self):
+        result = run_process(['seq', '1000'], output_lines=3)
+        self.assertTrue(result.ok)
+        self.assertEqual(result.stdout, '998\n999\n1000\n')
+
+    def test_run_process_timeout_kills_process_group(self):
+        started = time.monotonic()
+        result = run_process(['sh', '-c', 'sleep 30 & sleep 30'], timeout=0.5)
+        self.assertTrue(result.timed_out)
+        self.assertFalse(result.ok)
+        self.assertLess(time.monotonic() - started, 10)
+
+    def test_run_process_closes_stdin(self):
+        with patch('backend.process.subprocess.Popen', side_effect=OSError('not started')) as mock_popen:
+            run_process(['ffmpeg', '-i', 'video.mp4', 'video_360p.mp4'])
+        self.assertEqual(mock_popen.call_args.kwargs['stdin'], subprocess.DEVNULL)
+        result = run_process(['sh', '-c', 'read answer; echo "[$answer]"'], timeout=10)
+        self.assertEqual(result.stdout, '[]\n')
+
+    def test_run_process_missing_program(self):
+        result = run_process(['videoflix-missing-program'])
+        self.assertFalse(result.ok)
+        self.assertIn('konnte nicht gestartet werden', result.describe())
+
+    def test_run_process_cpu_limit(self):
+        result = run_process(['sh', '-c', 'while :; do :; done'], cpu_limit=1, timeout=10)
+        self.assertFalse(result.ok)
+        self.assertFalse(result.timed_out)
+
+
+class BenchmarkPipelineTests(unittest.TestCase):
+
+    def test_build_clip_command(self):
+        args = build_clip_command('clip.mp4', 1280, 720, 10)
+        self.assertIn('testsrc2=size=1280x720:rate=30:duration=10', args)
+        self.assertIn('sine=frequency=440:sample_rate=48000:duration=10', args)
+        self.assertEqual(args[-1], 'clip.mp4')
+
+    @patch('backend.management.commands.benchmark_pipeline.rendition_metrics', return_value={'size_bytes': 100})
+    @patch('backend.management.commands.benchmark_pipeline.run_command')
+    @patch('backend.management.commands.benchmark_pipeline.run_process')
+    def test_benchmark_clip_runs_pipeline_jobs(self, mock_run_process, mock_run_command, mock_rendition_metrics):
+        mock_run_process.return_value = ProcessResult(args=['ffprobe'], returncode=0, seconds=0.5, stdout=json.dumps({
+            'streams': [
+                {
+                    'codec_type': 'video', 'codec_name': 'h264', 'profile': 'High', 'pix_fmt': 'yuv420p',
+                    'width': 1280, 'height': 720,
+                },
+                {'codec_type': 'audio', 'codec_name': 'aac'},
+            ],
+            'format': {'duration': '10.0', 'bit_rate': '2000000'},
+        }))
+        mock_run_command.side_effect = [
+            ProcessResult(args=['ffmpeg'], returncode=0, seconds=1.0, cpu_seconds=1.0, max_rss_kb=1000),
+            ProcessResult(args=['ffmpeg'], returncode=0, seconds=2.0, cpu_seconds=1.5, max_rss_kb=2000),
+            ProcessResult(args=['ffmpeg'], returncode=0, seconds=4.0, cpu_seconds=12.0, max_rss_kb=5000),
+        ]
+        with override_settings(VIDEO_SEPARATE_AUDIO=True, VIDEO_PRIORITIZE_FIRST_RUNG=True):
+            metrics = benchmark_clip('/tmp/clip_720p_10s.mp4', 10)
+        self.assertEqual(list(metrics['jobs']), ['probe', 'encode_audio', 'copy_720p', 'encode_360p'])
+        self.assertEqual(set(metrics['renditions']), {'audio', '720p', '360p'})
+        self.assertEqual(metrics['jobs']['encode_360p']['speed'], 2.5)
+        self.assertEqual(metrics['max_rss_kb'], 5000)
+        self.assertEqual(metrics['time_to_first_playable'], 2.5)
+
+    @patch('backend.management.commands.benchmark_pipeline.rendition_metrics', return_value={'size_bytes': 100})
+    @patch('backend.management.commands.benchmark_pipeline.run_command')
+    @patch('backend.management.commands.benchmark_pipeline.run_process')
+    def test_benchmark_clip_without_copy(self, mock_run_process, mock_run_command, mock_rendition_metrics):
+        mock_run_process.return_value = ProcessResult(args=['ffprobe'], returncode=0, seconds=0.5, stdout=json.dumps({
+            'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 1280, 'height': 720}],
+            'format': {'duration': '10.0'},
+        }))
+        mock_run_command.return_value = ProcessResult(args=['ffmpeg'], returncode=0, seconds=1.0)
+        with override_settings(VIDEO_PRIORITIZE_FIRST_RUNG=True):
+            metrics = benchmark_clip('/tmp/clip_720p_10s.mp4', 10, copy=False)
+        self.assertEqual(list(metrics['jobs']), ['probe', 'encode_360p', 'encode_720p'])
+
+    @patch('backend.management.commands.benchmark_pipeline.benchmark_clip')
+    @patch('backend.management.commands.benchmark_pipeline.run_command')
+    @patch('backend.management.commands.benchmark_pipeline.run_process')
+    def test_report_is_the_only_standard_output(self, mock_run_process, mock_run_command, mock_benchmark_clip):
+        mock_run_process.return_value = ProcessResult(args=['ffmpeg'], returncode=0, stdout='ffmpeg version 6.1\n')
+        mock_run_command.return_value = ProcessResult(args=['ffmpeg'], returncode=0)
+
+        def benchmark_clip_with_error(source, duration, copy=True):
+            print('Error: Exit-Code 1: encoder failed')
+            return {'seconds': 1.0}
+
+        mock_benchmark_clip.side_effect = benchmark_clip_with_error
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with patch('sys.stderr', stderr):
+            call_command('benchmark_pipeline', sizes=['640x360'], durations=[10], stdout=stdout, stderr=stderr)
+        self.assertEqual(json.loads(stdout.getvalue())['clips']['360p_10s']['seconds'], 1.0)
+        self.assertIn('encoder failed', stderr.getvalue())
+
+    def test_compare_baselines(self):
+        baseline = {'clips': {'720p_10s': {'seconds': 10.0, 'jobs': {'encode_360p': {'speed': 2.0, 'ok': True}}}}}
+        current = {'clips': {'720p_10s': {'seconds': 12.0, 'jobs': {'encode_360p': {'speed': 2.5, 'ok': True}}}}}
+        changes = compare_baselines(baseline, current)
+        self.assertEqual(changes, [
+            ('720p_10s.jobs.encode_360p.speed', 2.0, 2.5, -25.0),
+            ('720p_10s.seconds', 10.0, 12.0, 20.0),
+        ])
+
+
+class DashManifestTests(TemporaryMediaRootMixin, TestCase):
+    media_settings = {'VIDEO_HLS_SEGMENT_TYPE': 'fmp4'}
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'videos'))
+        with open(os.path.join(self.media_root, 'videos', 'video_360p.m3u8'), 'w') as f:
+            f.write(
+                '#EXTM3U\n#EXT-X-VERSION:7\n#EXT-X-MAP:URI="video_360p.m4s",BYTERANGE="800@0"\n'
+                '#EXTINF:10.000000,\n#EXT-X-BYTERANGE:1000@800\nvideo_360p.m4s\n'
+                '#EXTINF:10.000000,\n#EXT-X-BYTERANGE:1000\nvideo_360p.m4s\n'
+                '#EXTINF:4.500000,\n#EXT-X-BYTERANGE:400\nvideo_360p.m4s\n#EXT-X-ENDLIST\n'
+            )
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(title='Test Video', video_file='videos/video.mp4', duration=24.5)
+        VideoRendition.objects.create(
+            video=self.video, resolution='360p', width=640, height=360, bitrate=700000,
+            playlist='videos/video_360p.m3u8', status=VideoRendition.Status.READY,
+        )
+
+    def test_create_dash_manifest(self):
+        self.assertEqual(create_dash_manifest(self.video), 'videos/video_manifest.mpd')
+        namespace = {'mpd': 'urn:mpeg:dash:schema:mpd:2011'}
+        mpd = ElementTree.parse(os.path.join(self.media_root, 'videos', 'video_manifest.mpd')).getroot()
+        self.assertEqual(mpd.get('mediaPresentationDuration'), 'PT24.500S')
+        representation = mpd.find('.//mpd:Representation', namespace)
+        self.assertEqual(representation.get('bandwidth'), '700000')
+        self.assertEqual(representation.find('mpd:BaseURL', namespace).text, 'video_360p.m4s')
+        self.assertEqual(representation.find('.//mpd:Initialization', namespace).get('range'), '0-799')
+        self.assertEqual(
+            [segment.get('mediaRange') for segment in representation.findall('.//mpd:SegmentURL', namespace)],
+            ['800-1799', '1800-2799', '2800-3199']
+        )
+        self.assertEqual(
+            [entry.attrib for entry in representation.findall('.//mpd:S', namespace)],
+            [{'d': '10000', 't': '0', 'r': '1'}, {'d': '4500'}]
+        )
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.video_dash_mpd.name, 'videos/video_manifest.mpd')
+        self.assertEqual(VideoViewSerializer(self.video).data['video_dash_mpd'], '/media/videos/video_manifest.mpd')
+
+    def test_create_dash_manifest_skips_mpegts(self):
+        with open(os.path.join(self.media_root, 'videos', 'video_360p.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXTINF:10.0,\nvideo_360p0.ts\n#EXT-X-ENDLIST\n')
+        with patch('builtins.print'):
+            self.assertIsNone(create_dash_manifest(self.video))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'videos', 'video_manifest.mpd')))
+
+
+class MediaFileTests(TemporaryMediaRootMixin, TestCase):
+    media_settings = {'MEDIA_SENDFILE_MODE': None}
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'videos'))
+        with open(os.path.join(self.media_root, 'videos', 'video_360p0.ts'), 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+        with open(os.path.join(self.media_root, 'videos', 'video_360p.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n')
+
+    def test_segment_is_immutable(self):
+        response = self.client.get('/media/videos/video_360p0.ts')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(256)) * 4)
+        self.assertEqual(response['Content-Type'], 'video/mp2t')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_playlist_is_cached_briefly(self):
+        with override_settings(MEDIA_MANIFEST_MAX_AGE=2):
+            response = self.client.get('/media/videos/video_360p.m3u8')
+        self.assertEqual(response['Content-Type'], 'application/vnd.apple.mpegurl')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=2')
+
+    def test_range_request(self):
+        response = self.client.get('/media/videos/video_360p0.ts', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1024')
+        response = self.client.get('/media/videos/video_360p0.ts', HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(252, 256)))
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get('/media/videos/video_360p0.ts', HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_none_match(self):
+        etag = self.client.get('/media/videos/video_360p0.ts')['ETag']
+        response = self.client.get('/media/videos/video_360p0.ts', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_media_accept_header_is_not_negotiated(self):
+        response = self.client.get('/media/videos/video_360p.m3u8', HTTP_ACCEPT='application/vnd.apple.mpegurl')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get('/media/videos/video_360p0.ts', HTTP_ACCEPT='video/mp2t')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_x_accel_redirect(self):
+        with override_settings(MEDIA_SENDFILE_MODE='x-accel-redirect', MEDIA_SENDFILE_PREFIX='/protected-media/'):
+            response = self.client.get('/media/videos/video_360p0.ts')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/videos/video_360p0.ts')
+        self.assertEqual(response.content, b'')
+
+    def test_private_and_missing_files(self):
+        os.makedirs(os.path.join(self.media_root, 'uploads'))
+        with open(os.path.join(self.media_root, 'uploads', 'session.part'), 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(self.client.get('/media/uploads/session.part').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/media/videos/missing.ts').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get('/media/videos/../../etc/passwd').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_private_files_with_dot_segments(self):
+        os.makedirs(os.path.join(self.media_root, 'uploads'))
+        with open(os.path.join(self.media_root, 'uploads', 'session.part'), 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(self.client.get('/media/./uploads/session.part').status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(
+            self.client.get('/media/videos/../uploads/session.part').status_code, status.HTTP_404_NOT_FOUND
+        )
+        self.assertEqual(self.client.get('/media/./videos/video_360p0.ts').status_code, status.HTTP_200_OK)
+
+
+class SignedMediaTests(TemporaryMediaRootMixin, APITestCase):
+    media_settings = {'MEDIA_SIGNED_URL_TTL': 600}
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'videos'))
+        files = {
+            'video_master.m3u8': '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n../videos/video_360p.m3u8\n',
+            'video_360p.m3u8': '#EXTM3U\n#EXTINF:10.0,\nvideo_360p0.ts\n#EXT-X-ENDLIST\n',
+            'video_360p0.ts': 'segment',
+            'video_360p_abc1234.mp4': 'another video',
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.media_root, 'videos', name), 'w') as f:
+                f.write(content)
+        with patch('django_rq.get_queue'):
+            self.video = Video.objects.create(
+                title='Test Video', video_file='videos/video.mp4', video_master_m3u8='videos/video_master.m3u8'
+            )
+        self.user = get_user_model().objects.create_superuser(email='viewer@example.com', password='password123')
+
+    def signed_playlist_url(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('video-master-playlist', args=[self.video.id]))
+        self.client.force_authenticate(None)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        return response.content.decode().splitlines()[-1]
+
+    def test_master_playlist_requires_authentication(self):
+        response = self.client.get(reverse('video-master-playlist', args=[self.video.id]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_signed_playlist_and_segments(self):
+        playlist_url = self.signed_playlist_url()
+        self.assertTrue(playlist_url.startswith('/media/s/'))
+        self.assertTrue(playlist_url.endswith('/videos/video_360p.m3u8'))
+        with self.assertNumQueries(0):
+            response = self.client.get(playlist_url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            segment_url = playlist_url.rsplit('/', 1)[0] + '/video_360p0.ts'
+            self.assertEqual(b''.join(self.client.get(segment_url).streaming_content), b'segment')
+
+    def test_signed_segment_with_media_accept_header(self):
+        playlist_url = self.signed_playlist_url()
+        segment_url = playlist_url.rsplit('/', 1)[0] + '/video_360p0.ts'
+        response = self.client.get(segment_url, HTTP_ACCEPT='video/mp2t')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_signature_does_not_cover_other_files(self):
+        prefix = self.signed_playlist_url().rsplit('/', 1)[0]
+        response = self.client.get(prefix + '/video_360p_abc1234.mp4')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_tampered_and_expired_signatures(self):
+        playlist_url = self.signed_playlist_url()
+        _, _, _, expires, scope, signature, path = playlist_url.split('/', 6)
+        tampered = f'/media/s/{int(expires) + 60}/{scope}/{signature}/{path}'
+        self.assertEqual(self.client.get(tampered).status_code, status.HTTP_403_FORBIDDEN)
+        with patch('backend.signing.time.time', return_value=int(expires) + 1):
+            self.assertEqual(self.client.get(playlist_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_unsigned_access_can_be_disabled(self):
+        with open(os.path.join(self.media_root, 'videos', 'video_trickplay.vtt'), 'w') as f:
+            f.write('WEBVTT\n')
+        with override_settings(MEDIA_REQUIRE_SIGNED_URLS=True):
+            self.assertEqual(self.client.get('/media/videos/video_360p0.ts').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get('/media/videos/video_360p.m3u8').status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(self.client.get('/media/videos/video_trickplay.vtt').status_code, status.HTTP_200_OK)
+
+    def test_dot_segments_do_not_skip_the_signature(self):
+        with override_settings(MEDIA_REQUIRE_SIGNED_URLS=True):
+            response = self.client.get('/media/./videos/video_360p0.ts')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get('/media/videos/../videos/video_360p.m3u8')
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_serializer_exposes_signed_master_playlist(self):
+        with override_settings(MEDIA_REQUIRE_SIGNED_URLS=True):
+            data = VideoViewSerializer(self.video).data
+        self.assertEqual(data['signed_master_m3u8'], reverse('video-master-playlist', args=[self.video.id]))
+        self.assertIsNone(data['video_dash_mpd'])
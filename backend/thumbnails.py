@@ -0,0 +1,120 @@
+import os
+from PIL import Image, features
+from django.conf import settings
+
+
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+
+THUMBNAIL_FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg'),
+}
+
+
+def get_cache_dir():
+    """
+    Returns the directory of the on-disk thumbnail cache, which can be configured with `THUMBNAIL_CACHE_DIR`.
+    """
+    return getattr(settings, 'THUMBNAIL_CACHE_DIR', os.path.join(settings.MEDIA_ROOT, 'thumbnail_cache'))
+
+
+def available_formats():
+    """
+    Returns the thumbnail formats the installed Pillow can write, most efficient first.
+    AVIF is only available if Pillow was built with AVIF support or a plugin such as `pillow-avif-plugin`
+    is installed, WebP if Pillow was built with libwebp. JPEG is always available as the fallback.
+    Returns:
+        list: Format names, keys of `THUMBNAIL_FORMATS`.
+    """
+    formats = []
+    if '.avif' in Image.registered_extensions():
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    formats.append('jpg')
+    return formats
+
+
+def variant_path(video, width, image_format):
+    """
+    Returns the cache path of a thumbnail variant.
+    The name of the source thumbnail is part of the file name, so a new thumbnail never serves stale variants.
+    """
+    stem = os.path.splitext(os.path.basename(video.thumbnails.name))[0]
+    return os.path.join(get_cache_dir(), f'{video.id}_{stem}_{width}.{image_format}')
+
+
+def get_thumbnail_variant(video, width, image_format):
+    """
+    Returns the path of a thumbnail variant of the given width and format, generating it on first request.
+    Variants are created lazily from the video's thumbnail with Pillow and kept in the on-disk cache. Every hit
+    updates the file's modification time, which `evict_cache` uses as the least-recently-used order. New files
+    are written under a temporary name and moved into place, so concurrent requests never read a partial file.
+    Args:
+        video (Video): The video whose thumbnail is resized.
+        width (int): The target width in pixels, one of `THUMBNAIL_WIDTHS`.
+        image_format (str): The target format, one of `available_formats()`.
+    Returns:
+        str: The absolute path of the variant.
+    """
+    path = variant_path(video, width, image_format)
+    if os.path.exists(path):
+        os.utime(path)
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with Image.open(video.thumbnails.path) as img:
+        img = img.convert('RGB')
+        img.thumbnail((width, width * 4))
+        img.save(temporary_path, THUMBNAIL_FORMATS[image_format][0], quality=80)
+    os.replace(temporary_path, path)
+    evict_cache()
+    return path
+
+
+def evict_cache(max_bytes=None):
+    """
+    Removes the least recently used variants until the cache fits into `THUMBNAIL_CACHE_MAX_BYTES`.
+    Args:
+        max_bytes (int, optional): The size limit in bytes. Defaults to the `THUMBNAIL_CACHE_MAX_BYTES` setting.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, 'THUMBNAIL_CACHE_MAX_BYTES', 512 * 1024 * 1024)
+    entries = []
+    with os.scandir(get_cache_dir()) as scan:
+        for entry in scan:
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def build_srcset(video, url_for):
+    """
+    Builds a srcset-style map of the thumbnail variants of a video.
+    Only widths up to the width of the source thumbnail are listed, since `get_thumbnail_variant` never upscales
+    and a larger 'w' descriptor would make browsers download a variant that is no sharper. The width is read from
+    `Video.thumbnail_width`, so building the srcset of a list never opens an image. The smallest width is always
+    kept. If the width is unknown, all widths are listed.
+    Args:
+        video (Video): The video with a thumbnail.
+        url_for (callable): Returns the URL of the variant for a given width and format.
+    Returns:
+        dict: One srcset string ('<url> 320w, <url> 640w, ...') per available format.
+    """
+    source_width = video.thumbnail_width
+    widths = [width for width in THUMBNAIL_WIDTHS if not source_width or width <= source_width]
+    widths = widths or list(THUMBNAIL_WIDTHS[:1])
+    return {
+        image_format: ', '.join(f'{url_for(width, image_format)} {width}w' for width in widths)
+        for image_format in available_formats()
+    }
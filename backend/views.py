@@ -1,54 +1,504 @@
 
+import os
+import re
+from urllib.parse import urlencode
 from django.conf import settings
-from django.core.cache.backends.base import DEFAULT_TIMEOUT
-from rest_framework import generics
-from .models import Video
-from .serializer import VideoViewSerializer
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+from django.views import View
+from rest_framework import generics, status
+from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .cache import CATALOG_LIST_SCOPE, cache_stats, fetch, get_validators, video_scope
+from .media import MEDIA_CONTENT_TYPES, etag_matches, normalize_media_path, requires_signature, serve_media
+from .models import UploadSession, Video
+from .pagination import VideoCursorPagination
+from .progress import get_pipeline_status
+from .serializer import UploadSessionSerializer, VideoViewSerializer
+from .signing import sign_master_playlist, verify_signed_path
+from .thumbnails import THUMBNAIL_FORMATS, THUMBNAIL_WIDTHS, available_formats, get_thumbnail_variant
 
 
-CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
+UPLOAD_READ_SIZE = 1024 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 
-class VideoList(generics.ListAPIView):
+class CatalogCacheMixin:
+    """
+    Serves GET requests of a catalog view from the catalog cache (see `backend.cache`).
+    The rendered bytes of successful responses are cached together with the versions of the view's scopes, so a
+    hit skips the database and the serializer entirely. Writes bump the versions, and one request renders a fresh
+    response while concurrent requests keep getting the previous one (see `fetch`). Only responses rendered by the
+    JSON renderer are cached; the browsable API and error responses always go through the view. Every cached
+    response carries an X-Cache header with HIT, STALE or MISS.
+    Cached responses also carry an ETag derived from the versions they were built from and a Last-Modified date of
+    the latest version change, with `Cache-Control: no-cache`, so clients revalidate on every request. A client
+    that sends a matching If-None-Match (or, without one, an If-Modified-Since that is not older) gets a 304
+    without a body. Both validators follow from the versions alone (see `get_validators`), so such a request is
+    answered before the cache entry is read or the response is serialized, even if the entry has expired.
+    Attributes:
+        cache_name (str): The name of the endpoint in the cache keys.
+        cache_query_params (tuple): The query parameters the response depends on. All others are left out of the
+            cache key, so requests with arbitrary parameters cannot bypass the cache or fill it with copies.
+    Methods:
+        get_cache_scopes(self): Returns the version scopes the response depends on.
+        get_cache_url(self): Returns the URL the response is cached under.
+        is_not_modified(self, entry): Checks the conditional request headers against a cache entry.
+    """
+    cache_name = None
+    cache_query_params = ('cursor', 'page_size')
+
+    def get_cache_scopes(self):
+        """
+        Returns the version scopes of the response. Lists depend on every video, so they use the list scope.
+        """
+        return [CATALOG_LIST_SCOPE]
+
+    def get_cache_url(self):
+        """
+        Returns the absolute URL of the request with only the query parameters in `cache_query_params`, in a fixed
+        order. The host stays part of it, since serialized file URLs contain it.
+        """
+        params = [
+            (name, self.request.query_params[name]) for name in sorted(self.cache_query_params)
+            if name in self.request.query_params
+        ]
+        url = self.request.build_absolute_uri(self.request.path)
+        return f'{url}?{urlencode(params)}' if params else url
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+        cache_url = self.get_cache_url()
+        if 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers:
+            validators = get_validators(self.cache_name, self.get_cache_scopes(), cache_url)
+            if validators is not None and self.is_not_modified(validators):
+                return self.cached_content_response(validators, 'HIT')
+        uncached = None
+
+        def build():
+            nonlocal uncached
+            response = super(CatalogCacheMixin, self).get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                uncached = response
+                return None
+            return request.accepted_renderer.render(
+                response.data, request.accepted_media_type, self.get_renderer_context()
+            )
+
+        entry, cache_status = fetch(self.cache_name, self.get_cache_scopes(), cache_url, build)
+        if entry is None:
+            return uncached
+        return self.cached_content_response(entry, cache_status)
+
+    def is_not_modified(self, entry):
+        """
+        Returns True if the client already has the response of a cache entry. If-None-Match takes precedence over
+        If-Modified-Since, which is only compared when the request has no If-None-Match header.
+        """
+        if_none_match = self.request.headers.get('If-None-Match')
+        if if_none_match:
+            return entry.get('etag') is not None and etag_matches(if_none_match, entry['etag'])
+        if_modified_since = parse_http_date_safe(self.request.headers.get('If-Modified-Since', ''))
+        modified = entry.get('modified')
+        return if_modified_since is not None and modified is not None and int(modified) <= if_modified_since
+
+    def cached_content_response(self, entry, cache_status):
+        """
+        Wraps the rendered content of a cache entry in a response that DRF does not render again, or answers with
+        304 if the client already has it.
+        """
+        if self.is_not_modified(entry):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(entry['content'], content_type=self.request.accepted_renderer.media_type)
+        if entry.get('etag'):
+            response['ETag'] = entry['etag']
+        if entry.get('modified') is not None:
+            response['Last-Modified'] = http_date(entry['modified'])
+        response['Cache-Control'] = 'no-cache'
+        response['X-Cache'] = cache_status
+        return response
+
+
+class VideoList(CatalogCacheMixin, generics.ListAPIView):
     """
     API view to retrieve a list of videos.
-    This view lists all videos available in the database, serialized by `VideoViewSerializer`.    
+    This view lists all videos available in the database, serialized by `VideoViewSerializer`.
+    The videos are returned newest first in pages of `VideoCursorPagination`, so a request never serializes
+    the whole catalog.
     Attributes:
-        queryset (QuerySet): The set of all `Video` objects.
+        queryset (QuerySet): The set of all `Video` objects, with their renditions prefetched.
         serializer_class (VideoViewSerializer): The serializer class for video objects.
+        pagination_class (VideoCursorPagination): Keyset pagination on (created_at, id).
+        cache_name (str): Responses are cached by `CatalogCacheMixin`.
     """
-    queryset = Video.objects.all()
+    queryset = Video.objects.prefetch_related('renditions')
     serializer_class = VideoViewSerializer
+    pagination_class = VideoCursorPagination
+    cache_name = 'video-list'
 
 
-class VideoDetail(generics.RetrieveAPIView):
+class VideoDetail(CatalogCacheMixin, generics.RetrieveAPIView):
     """
     API view to retrieve a detailed view of a specific video.
     This view provides detailed information about a video identified by its ID, using the `VideoViewSerializer`.    
     Attributes:
-        queryset (QuerySet): The set of all `Video` objects.
+        queryset (QuerySet): The set of all `Video` objects, with their renditions prefetched.
         serializer_class (VideoViewSerializer): The serializer class for video objects.
+        cache_name (str): Responses are cached by `CatalogCacheMixin` under the version of the video alone.
     """
-    queryset = Video.objects.all()
+    queryset = Video.objects.prefetch_related('renditions')
     serializer_class = VideoViewSerializer
+    cache_name = 'video-detail'
+    cache_query_params = ()
 
+    def get_cache_scopes(self):
+        return [video_scope(self.kwargs['pk'])]
 
-class VideoByGenreList(generics.ListAPIView):
+
+class VideoByGenreList(CatalogCacheMixin, generics.ListAPIView):
     """
     API view to retrieve a list of videos filtered by genre.
-    This view returns a list of videos that match a specific genre, which is provided via the URL.    
+    This view returns a list of videos that match a specific genre, which is provided via the URL.
+    Like `VideoList`, it is paginated newest first with `VideoCursorPagination`.
     Attributes:
-        serializer_class (VideoViewSerializer): The serializer class for video objects.    
+        serializer_class (VideoViewSerializer): The serializer class for video objects.
+        pagination_class (VideoCursorPagination): Keyset pagination on (created_at, id).
+        cache_name (str): Responses are cached by `CatalogCacheMixin`.
     Methods:
         get_queryset(self): Filters the `Video` objects by the genre specified in the URL.
     """
     serializer_class = VideoViewSerializer
+    pagination_class = VideoCursorPagination
+    cache_name = 'video-by-genre'
 
     def get_queryset(self):
         """
         Filter the video queryset based on the genre provided in the URL.        
         Returns:
-            QuerySet: A queryset of `Video` objects filtered by the specified genre.
+            QuerySet: A queryset of `Video` objects filtered by the specified genre, with their renditions prefetched.
         """
         genre = self.kwargs['genre']
-        return Video.objects.filter(genre=genre)
+        return Video.objects.filter(genre=genre).prefetch_related('renditions')
+
+
+class VideoThumbnail(generics.RetrieveAPIView):
+    """
+    API view to retrieve a resized thumbnail of a video in a given width and format.
+    Variants are generated on first request and served from the on-disk thumbnail cache afterwards.
+    Attributes:
+        queryset (QuerySet): The set of all `Video` objects.
+    Methods:
+        retrieve(self, request, *args, **kwargs): Returns the thumbnail variant as an image response.
+    """
+    queryset = Video.objects.all()
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the requested thumbnail variant.
+        Returns:
+            FileResponse: The image, cacheable by clients for a year since variant URLs never change content.
+        Raises:
+            Http404: If the video has no thumbnail or the width or format is not supported.
+        """
+        width = kwargs['width']
+        image_format = kwargs['image_format']
+        if width not in THUMBNAIL_WIDTHS or image_format not in available_formats():
+            raise Http404('Unsupported thumbnail variant')
+        video = self.get_object()
+        if not video.thumbnails:
+            raise Http404('Video has no thumbnail')
+        path = get_thumbnail_variant(video, width, image_format)
+        response = FileResponse(open(path, 'rb'), content_type=THUMBNAIL_FORMATS[image_format][1])
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
+
+
+class CatalogCacheStats(APIView):
+    """
+    API view that reports the hit and miss counters of the catalog cache to administrators.
+    Methods:
+        get(self, request): Returns the counters, see `cache_stats`.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Return the counters.
+        Returns:
+            Response: 'hits', 'misses' and 'hit_ratio'.
+        """
+        return Response(cache_stats())
+
+
+class MediaFile(View):
+    """
+    View that delivers playlists, manifests, segments and other files below MEDIA_ROOT.
+    It replaces Django's static file handler, which reads whole files into memory. Responses carry an ETag,
+    Last-Modified and a Cache-Control header that depends on the file type, and Range requests are answered
+    with partial content. With `MEDIA_SENDFILE_MODE` set, the web server sends the file instead of Python.
+    It is a plain Django view rather than a DRF view: no authentication runs on these requests, so a segment fetch
+    never touches the database, and there is no content negotiation, so players that send an Accept header for
+    the media type they expect are not rejected with 406. With `MEDIA_REQUIRE_SIGNED_URLS` enabled, rendition
+    playlists and segments are only available through `SignedMediaFile` (see `requires_signature`); trickplay
+    files, thumbnails and source files stay available here.
+    Methods:
+        get(self, request, path): Returns the file, see `serve_media`.
+    """
+
+    def get(self, request, path):
+        """
+        Return the file at `path`, relative to MEDIA_ROOT. The signature requirement is checked on the normalized
+        path, so dot segments such as '/media/./videos/...' cannot skip it.
+        Raises:
+            PermissionDenied: If the file may only be fetched with a signed URL.
+            Http404: If there is no such file.
+        """
+        path = normalize_media_path(path)
+        if getattr(settings, 'MEDIA_REQUIRE_SIGNED_URLS', False) and requires_signature(path):
+            raise PermissionDenied('A signed URL is required')
+        return serve_media(request, path)
+
+
+class SignedMediaFile(View):
+    """
+    View that delivers rendition playlists and segments through short-lived signed URLs.
+    The URL carries its expiry, the signed scope and an HMAC signature (see `backend.signing`), so every request
+    is verified in constant time from the URL alone, without a token lookup or any other database or cache access.
+    Like `MediaFile`, it is a plain Django view, so the Accept header of the player is not negotiated.
+    Methods:
+        get(self, request, expires, scope, signature, path): Returns the file if the signature is valid.
+    """
+
+    def get(self, request, expires, scope, signature, path):
+        """
+        Return the file at `path` if the URL is signed for it and has not expired.
+        Raises:
+            PermissionDenied: If the signature is invalid, expired or does not cover the path.
+            Http404: If there is no such file.
+        """
+        path = normalize_media_path(path)
+        if not verify_signed_path(expires, scope, signature, path):
+            raise PermissionDenied('Invalid or expired signature')
+        return serve_media(request, path)
+
+
+class VideoMasterPlaylist(generics.RetrieveAPIView):
+    """
+    API view that returns the master playlist of a video with signed rendition URLs for the requesting viewer.
+    This is the only request of a playback session that authenticates the viewer; the signed URLs in the
+    playlist grant access to the renditions and their segments until they expire after `MEDIA_SIGNED_URL_TTL`.
+    Attributes:
+        queryset (QuerySet): The set of all `Video` objects.
+    Methods:
+        retrieve(self, request, *args, **kwargs): Returns the signed master playlist.
+    """
+    queryset = Video.objects.all()
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the signed master playlist.
+        Returns:
+            HttpResponse: The playlist. It must not be shared between viewers, so it is marked private.
+        Raises:
+            Http404: If the video has no master playlist yet.
+        """
+        video = self.get_object()
+        if not video.video_master_m3u8:
+            raise Http404('Video has no master playlist')
+        try:
+            with open(video.video_master_m3u8.path) as f:
+                content = f.read()
+        except FileNotFoundError:
+            raise Http404('Video has no master playlist')
+        response = HttpResponse(
+            sign_master_playlist(content, video.video_master_m3u8.name), content_type=MEDIA_CONTENT_TYPES['.m3u8']
+        )
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
+class UploadSessionCreate(generics.CreateAPIView):
+    """
+    API view to start a resumable upload of a video file.
+    Creates an `UploadSession` and an empty partial file of the announced size, into which the byte ranges
+    sent to `UploadSessionDetail` are written. Only staff users can upload videos.
+    Attributes:
+        serializer_class (UploadSessionSerializer): The serializer class for upload sessions.
+    """
+    serializer_class = UploadSessionSerializer
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def perform_create(self, serializer):
+        """
+        Save the session and allocate its partial file.
+        """
+        session = serializer.save()
+        os.makedirs(os.path.dirname(session.partial_path()), exist_ok=True)
+        with open(session.partial_path(), 'wb') as f:
+            f.truncate(session.size)
+
+
+class UploadSessionDetail(APIView):
+    """
+    API view to query and continue a resumable upload.
+    Methods:
+        get(request, pk): Returns the session, including the offset at which the upload continues.
+        put(request, pk): Writes the byte range given in the `Content-Range` header at its offset in the partial file.
+    """
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
 
+    def get_session(self, pk, lock=False):
+        queryset = UploadSession.objects.select_for_update() if lock else UploadSession.objects
+        try:
+            return queryset.get(pk=pk)
+        except UploadSession.DoesNotExist:
+            raise Http404('Upload session not found')
+
+    def get(self, request, pk):
+        """
+        Return the upload session. The `Upload-Offset` header tells the client where to resume.
+        """
+        session = self.get_session(pk)
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+    def put(self, request, pk):
+        """
+        Write one byte range of the file.
+        The request body is streamed from the socket straight into the partial file in blocks of
+        `UPLOAD_READ_SIZE`, without being buffered by Django's upload handlers. The range has to start at the
+        session's current offset. The session row is only locked with `select_for_update` while that offset is
+        checked; the body is written outside of any transaction, so a slow client holds neither a database
+        connection nor a row lock during the transfer. The new offset is then stored with a conditional UPDATE
+        on the checked offset, so of two clients sending the same range only one succeeds.
+        Returns:
+            Response: The session with its new offset, 400 for a malformed `Content-Range` header or 409 if the range
+            does not start at the current offset or was written concurrently.
+        """
+        match = CONTENT_RANGE_PATTERN.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return Response({'error': 'A Content-Range header of the form "bytes start-end/total" is required.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end, total = (int(value) for value in match.groups())
+
+        with transaction.atomic():
+            session = self.get_session(pk, lock=True)
+        if total != session.size or end < start or end >= session.size:
+            return Response({'error': 'The range does not fit the announced file size.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start != session.offset:
+            return Response({'error': 'The range has to start at the current offset.', 'offset': session.offset},
+                            status=status.HTTP_409_CONFLICT)
+
+        remaining = end - start + 1
+        stream = request.stream
+        with open(session.partial_path(), 'r+b') as f:
+            f.seek(start)
+            while remaining and stream is not None:
+                block = stream.read(min(UPLOAD_READ_SIZE, remaining))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+        if remaining:
+            return Response({'error': 'The request body is shorter than the range.', 'offset': session.offset},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        updated = UploadSession.objects.filter(pk=session.pk, offset=start).update(offset=end + 1)
+        if not updated:
+            return Response({'error': 'The range was written concurrently.'}, status=status.HTTP_409_CONFLICT)
+        session.offset = end + 1
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = str(session.offset)
+        return response
+
+
+class UploadSessionFinalize(APIView):
+    """
+    API view to finish a resumable upload.
+    Methods:
+        post(request, pk): Moves the completed file into MEDIA_ROOT and creates the `Video`.
+    """
+    authentication_classes = [TokenAuthentication, SessionAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, pk):
+        """
+        Move the assembled file to 'videos/' with an atomic rename and create the video from the session.
+        Creating the video starts the processing pipeline through the `post_save` signal. The session row is locked
+        and deleted in the same transaction as the rename, so a concurrent second call waits for the first one and
+        then gets a 404 instead of failing on the partial file that was already moved. If the video cannot be
+        created or the transaction does not commit, the file is moved back, so the session can be finalized again.
+        Returns:
+            Response: The created video with HTTP 201, 404 if the session does not exist (anymore) or 409 if bytes
+            are still missing.
+        """
+        moved = None
+        try:
+            with transaction.atomic():
+                try:
+                    session = UploadSession.objects.select_for_update().get(pk=pk)
+                except UploadSession.DoesNotExist:
+                    raise Http404('Upload session not found')
+                if session.offset != session.size:
+                    return Response({'error': 'The upload is not complete.', 'offset': session.offset},
+                                    status=status.HTTP_409_CONFLICT)
+
+                partial_path = session.partial_path()
+                filename = default_storage.get_valid_name(os.path.basename(session.filename))
+                name = default_storage.get_available_name(os.path.join('videos', filename))
+                final_path = os.path.join(settings.MEDIA_ROOT, name)
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(partial_path, final_path)
+                moved = (final_path, partial_path)
+                video = Video.objects.create(
+                    title=session.title, description=session.description, genre=session.genre, video_file=name
+                )
+                session.delete()
+        except Exception:
+            if moved:
+                os.replace(*moved)
+            raise
+        return Response(VideoViewSerializer(video, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+class VideoStatus(generics.RetrieveAPIView):
+    """
+    API view to retrieve the processing status of a video.
+    Combines the stored state of the thumbnail and the renditions with the per-stage timings and ffmpeg progress
+    that the task layer records in Redis.
+    Attributes:
+        queryset (QuerySet): The set of all `Video` objects, with their renditions prefetched.
+    """
+    queryset = Video.objects.prefetch_related('renditions')
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Return the status of the video.
+        Returns:
+            Response: The thumbnail status, the status of every rendition and the recorded stages. Stages that
+            report ffmpeg progress also contain `progress`, the encoded fraction of the video between 0 and 1.
+        """
+        video = self.get_object()
+        stages = get_pipeline_status(video.id)
+        if video.duration:
+            for stage in stages.values():
+                if 'out_time' in stage:
+                    stage['progress'] = round(min(stage['out_time'] / video.duration, 1.0), 3)
+        return Response({
+            'id': video.id,
+            'thumbnail_status': video.thumbnail_status,
+            'renditions': {rendition.resolution: rendition.status for rendition in video.renditions.all()},
+            'stages': stages,
+        })
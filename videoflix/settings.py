@@ -46,6 +46,49 @@ CORS_ORIGIN_WHITELIST = [
 
 CACHE_TTL = 60 * 15
 
+# Catalog cache fills: outdated responses are served for up to CATALOG_STALE_TTL seconds while one process holds
+# the fill lock (CATALOG_LOCK_TIMEOUT seconds) and rebuilds them; without a previous response, other processes
+# wait up to CATALOG_LOCK_WAIT seconds. CATALOG_XFETCH_BETA scales probabilistic early refreshes (0 disables them)
+CATALOG_STALE_TTL = 60 * 60
+CATALOG_LOCK_TIMEOUT = 10
+CATALOG_LOCK_WAIT = 2
+CATALOG_XFETCH_BETA = 1.0
+
+# In-process cache in front of Redis for the hottest catalog responses, per web worker: its size in bytes
+# (0 disables it) and how long an entry is kept at most if a version bump on the pub/sub channel is lost
+CATALOG_LOCAL_CACHE_MAX_BYTES = 16 * 1024 * 1024
+CATALOG_LOCAL_CACHE_TTL = 30
+
+# Videos per page of the video lists, and the largest page size a client may request with ?page_size=
+VIDEO_PAGE_SIZE = 20
+VIDEO_MAX_PAGE_SIZE = 100
+
+# Encode renditions straight into HLS segments instead of intermediate MP4 files
+VIDEO_DIRECT_HLS = True
+
+# Segment container of the HLS renditions: 'mpegts' (one .ts file per segment) or 'fmp4' (one fragmented MP4
+# file per rendition, addressed with EXT-X-BYTERANGE)
+VIDEO_HLS_SEGMENT_TYPE = 'mpegts'
+
+# Videos at least this long (in seconds) are split into chunks that are encoded in parallel
+VIDEO_CHUNKED_MIN_DURATION = 600
+VIDEO_CHUNK_DURATION = 120
+
+# Encode the lowest rung of every new video first on the 'high' queue, the rest later on the 'low' queue
+VIDEO_PRIORITIZE_FIRST_RUNG = True
+
+# Encode the audio once into a shared HLS audio rendition (EXT-X-MEDIA) instead of into every video rung
+VIDEO_SEPARATE_AUDIO = True
+
+# Limits for every ffmpeg/ffprobe process: wall-clock seconds and CPU seconds (None disables a limit)
+FFMPEG_TIMEOUT = 6 * 60 * 60
+FFMPEG_CPU_LIMIT = None
+
+# RQ job timeouts of the conversion pipeline: VIDEO_JOB_TIMEOUT_FACTOR seconds per second of video and encoded
+# rendition, at least VIDEO_JOB_MIN_TIMEOUT and at most FFMPEG_TIMEOUT (plus a margin for database writes)
+VIDEO_JOB_TIMEOUT_FACTOR = 3
+VIDEO_JOB_MIN_TIMEOUT = 600
+
 
 # Application definition
 
@@ -82,14 +125,29 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Workers take jobs in the order the queues are listed: python manage.py rqworker high default low
 RQ_QUEUES = {
+    'high': {
+        'HOST': 'localhost',
+        'PORT': 6379,
+        'DB': 0,
+        'PASSWORD': 'foobared',
+        'DEFAULT_TIMEOUT': 360,
+    },
     'default': {
         'HOST': 'localhost',
         'PORT': 6379,
         'DB': 0,
         'PASSWORD': 'foobared',
         'DEFAULT_TIMEOUT': 360,
-    }
+    },
+    'low': {
+        'HOST': 'localhost',
+        'PORT': 6379,
+        'DB': 0,
+        'PASSWORD': 'foobared',
+        'DEFAULT_TIMEOUT': 360,
+    },
 }
 
 CACHES = {
@@ -126,6 +184,20 @@ TEMPLATES = [
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Media files are served by backend.views.MediaFile. Playlists and manifests may be cached for this many seconds.
+MEDIA_MANIFEST_MAX_AGE = 2
+# Let the web server send media files: None, 'x-accel-redirect' (nginx, internal location MEDIA_SENDFILE_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile)
+MEDIA_SENDFILE_MODE = None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
+# Signed rendition URLs handed out by the per-viewer master playlist (videos/<id>/master.m3u8): validity in
+# seconds, HMAC key (defaults to SECRET_KEY) and whether rendition playlists and segments are only served through
+# them. Trickplay files, thumbnails and source files stay unsigned; DASH manifests are not offered while enabled
+MEDIA_SIGNED_URL_TTL = 4 * 60 * 60
+MEDIA_SIGNING_KEY = None
+MEDIA_REQUIRE_SIGNED_URLS = False
+
 WSGI_APPLICATION = "videoflix.wsgi.application"
 
 # Database
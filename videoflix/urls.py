@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
 from user.views import UserView, LoginView, LogoutView, activate, request_password_reset, password_reset_confirm
-from backend.views import VideoList, VideoDetail, VideoByGenreList
+from backend.views import (
+    VideoList, VideoDetail, VideoByGenreList, VideoThumbnail, UploadSessionCreate, UploadSessionDetail,
+    UploadSessionFinalize, VideoStatus, MediaFile, SignedMediaFile, VideoMasterPlaylist, CatalogCacheStats
+)
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
 
 
@@ -18,12 +20,20 @@ urlpatterns = [
     path('videos/', VideoList.as_view(), name='video-list'),
     path('videos/<int:pk>/', VideoDetail.as_view(), name='video-detail'),
     path('videos/genre/<str:genre>/', VideoByGenreList.as_view(), name='video-by-genre'),
+    path('videos/<int:pk>/thumbnail/<int:width>.<str:image_format>', VideoThumbnail.as_view(), name='video-thumbnail'),
+    path('videos/<int:pk>/status/', VideoStatus.as_view(), name='video-status'),
+    path('videos/<int:pk>/master.m3u8', VideoMasterPlaylist.as_view(), name='video-master-playlist'),
+    path('cache/stats/', CatalogCacheStats.as_view(), name='catalog-cache-stats'),
+    path('uploads/', UploadSessionCreate.as_view(), name='upload-create'),
+    path('uploads/<uuid:pk>/', UploadSessionDetail.as_view(), name='upload-detail'),
+    path('uploads/<uuid:pk>/finalize/', UploadSessionFinalize.as_view(), name='upload-finalize'),
     path('activate/<uidb64>/<token>/', activate, name='activate'),
     path('request-password-reset/', request_password_reset, name='request-password-reset'),
     path('password-reset-confirm/<uidb64>/<token>/', password_reset_confirm, name='password-reset-confirm'),
+    path(
+        f"{settings.MEDIA_URL.lstrip('/')}s/<int:expires>/<str:scope>/<str:signature>/<path:path>",
+        SignedMediaFile.as_view(), name='signed-media'
+    ),
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", MediaFile.as_view(), name='media'),
 
 ] + staticfiles_urlpatterns()
-
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)